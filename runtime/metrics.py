@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+metrics.py — IKDD Runtime 共通メトリクス（Prometheus テキスト形式）
+目的:
+  - v0.3 RuntimeEngine と v0.2 ikdd.generate で共有するメトリクスレジストリ
+  - counter / gauge / histogram（ラベル付き）を保持し、Prometheus テキスト形式で公開する
+公開方法:
+  - write_textfile(path)      : node_exporter textfile collector 用ファイル（原子的に置換）
+  - start_http_server(port)   : ローカル HTTP エンドポイント（GET /metrics）
+RuntimeEngine への接続:
+  from runtime.metrics import MetricsHook
+  engine = RuntimeEngine(resolver, hooks=[MetricsHook()])
+依存:
+  - 標準ライブラリのみ
+"""
+
+from __future__ import annotations
+
+import os
+import math
+import time
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# ===== メトリクス =====
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._children.items())
+        for key, value in items:
+            lines.extend(self._render_child(key, value))
+        return lines
+
+    def _render_child(self, key: Tuple[str, ...], value: Any) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_fmt(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        if amount < 0:
+            raise ValueError("counter can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = self._children.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._children.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = self._children.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: Any) -> float:
+        return self._children.get(self._key(labels), 0.0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = [[0] * len(self.buckets), 0.0, 0]   # [counts, sum, count]
+            counts = child[0]
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    counts[i] += 1
+                    break
+            child[1] += value
+            child[2] += 1
+
+    def count(self, **labels: Any) -> int:
+        child = self._children.get(self._key(labels))
+        return child[2] if child else 0
+
+    def _render_child(self, key: Tuple[str, ...], value: Any) -> List[str]:
+        counts, total, n = value
+        lines = []
+        cumulative = 0
+        for upper, c in zip(self.buckets, counts):
+            cumulative += c
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, ('le', _fmt(upper)))} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(total)}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+# ===== レジストリ =====
+
+class MetricsRegistry:
+    """名前 → メトリクス。同名・同種の再登録は既存のものを返す（モジュール再読込に強くする）"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get_or_create(self, cls, name: str, help: str, labelnames: Sequence[str], **kw: Any):
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                m = self._metrics[name] = cls(name, help, labelnames, **kw)
+            elif not isinstance(m, cls) or m.labelnames != tuple(labelnames):
+                raise ValueError(f"metric {name} already registered with a different type or labels")
+            return m
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines: List[str] = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+# ===== 公開 =====
+
+def write_textfile(path: str, registry: MetricsRegistry = REGISTRY) -> None:
+    """textfile collector 用に書き出す（収集中に読みかけのファイルを見せないよう一時ファイル経由で置換）"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".prom.tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(registry.render())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def start_http_server(port: int = 9464, addr: str = "127.0.0.1",
+                      registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """GET /metrics を返す HTTP サーバを daemon スレッドで起動する（停止は server.shutdown()）"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass   # アクセスログは出さない
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="ikdd-metrics-http", daemon=True).start()
+    return server
+
+
+# ===== 標準メトリクス =====
+
+def runtime_metrics(registry: MetricsRegistry = REGISTRY) -> Dict[str, _Metric]:
+    return {
+        "runs": registry.counter("ikdd_runtime_runs_total", "RuntimeEngine runs by outcome", ["iep", "status"]),
+        "run_duration": registry.histogram("ikdd_runtime_run_duration_seconds", "RuntimeEngine run latency", ["iep"]),
+        "in_progress": registry.gauge("ikdd_runtime_runs_in_progress", "RuntimeEngine runs currently executing"),
+        "step_duration": registry.histogram("ikdd_runtime_step_duration_seconds", "ref_step latency",
+                                            ["step", "executor"]),
+        "step_failures": registry.counter("ikdd_runtime_step_failures_total", "ref_step failures by exception type",
+                                          ["step", "error"]),
+        "cache_hits": registry.counter("ikdd_runtime_cache_hits_total", "StepCache hits", ["step"]),
+        "shard_duration": registry.histogram("ikdd_runtime_shard_duration_seconds", "foreach shard latency",
+                                             ["step"]),
+        "contract_failures": registry.counter("ikdd_runtime_contract_failures_total", "failed contract checks",
+                                              ["phase"]),
+        "contracts_skipped": registry.counter("ikdd_runtime_contracts_skipped_total",
+                                              "contract checks skipped because they could not be parsed", ["phase"]),
+    }
+
+
+def generator_metrics(registry: MetricsRegistry = REGISTRY) -> Dict[str, _Metric]:
+    return {
+        "provider_duration": registry.histogram("ikdd_generate_provider_duration_seconds",
+                                                "LLM provider call latency", ["provider"]),
+        "provider_errors": registry.counter("ikdd_generate_provider_errors_total", "LLM provider call failures",
+                                            ["provider"]),
+        "retries": registry.counter("ikdd_generate_retries_total",
+                                    "generation attempts repeated after constraint violations", ["provider"]),
+        "generations": registry.counter("ikdd_generate_runs_total", "code generations by outcome",
+                                        ["provider", "status"]),
+    }
+
+
+class MetricsHook:
+    """RuntimeEngine の hook（hooks=[MetricsHook()]）としてメトリクスを更新する"""
+    def __init__(self, registry: MetricsRegistry = REGISTRY):
+        self.m = runtime_metrics(registry)
+        self._started: Dict[int, float] = {}
+        self._run_started: Dict[int, float] = {}
+
+    def run_start(self, plan):
+        self._run_started[id(plan)] = time.perf_counter()
+        self.m["in_progress"].inc()
+
+    def run_end(self, plan, error):
+        self.m["in_progress"].dec()
+        started = self._run_started.pop(id(plan), None)
+        iep = plan.iep_id or ""
+        if started is not None:
+            self.m["run_duration"].observe(time.perf_counter() - started, iep=iep)
+        self.m["runs"].inc(iep=iep, status="ok" if error is None else "error")
+
+    def before_step(self, action, args):
+        self._started[id(action)] = time.perf_counter()
+
+    def after_step(self, action, args, result, error, cached):
+        started = self._started.pop(id(action), None)
+        if error is not None:
+            self.m["step_failures"].inc(step=action.ref_step, error=type(error).__name__)
+            return
+        if cached:
+            self.m["cache_hits"].inc(step=action.ref_step)   # キャッシュ命中は latency に混ぜない
+        elif started is not None:
+            self.m["step_duration"].observe(time.perf_counter() - started, step=action.ref_step,
+                                            executor=action.executor)
+
+    def shard(self, action, index, count, elapsed, error):
+        if error is not None:
+            self.m["step_failures"].inc(step=action.ref_step, error=type(error).__name__)
+        elif elapsed is not None:
+            self.m["shard_duration"].observe(elapsed, step=action.ref_step)
+
+    def contract(self, phase, text, ok):
+        if ok is None:
+            self.m["contracts_skipped"].inc(phase=phase)
+        elif not ok:
+            self.m["contract_failures"].inc(phase=phase)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_metrics.py — 共通メトリクス（Prometheus テキスト形式）のテスト
+Usage:
+  python3 -m pytest runtime/test_metrics.py -q
+"""
+
+import os
+import urllib.error
+import urllib.request
+
+import pytest
+
+from runtime.metrics import (CONTENT_TYPE, MetricsHook, MetricsRegistry, runtime_metrics, start_http_server,
+                             write_textfile)
+
+V03_RUNTIME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "v0_3", "runtime")
+
+
+def test_counter_and_gauge_render_with_escaped_labels():
+    reg = MetricsRegistry()
+    c = reg.counter("jobs_total", "jobs", ["name"])
+    c.inc(name='a"b\nc')
+    c.inc(2, name='a"b\nc')
+    g = reg.gauge("queue", "queue depth")
+    g.inc(5)
+    g.dec(2)
+    assert c.value(name='a"b\nc') == 3 and g.value() == 3
+    assert reg.render().splitlines() == [
+        "# HELP jobs_total jobs", "# TYPE jobs_total counter", 'jobs_total{name="a\\"b\\nc"} 3',
+        "# HELP queue queue depth", "# TYPE queue gauge", "queue 3",
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    reg = MetricsRegistry()
+    h = reg.histogram("lat_seconds", "latency", buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 0.5, 3.0):
+        h.observe(v)
+    lines = [line for line in reg.render().splitlines() if not line.startswith("#")]
+    assert lines == ['lat_seconds_bucket{le="0.1"} 1', 'lat_seconds_bucket{le="1"} 3',
+                     'lat_seconds_bucket{le="+Inf"} 4', "lat_seconds_sum 4.05", "lat_seconds_count 4"]
+    assert h.count() == 4
+
+
+def test_invalid_use_is_rejected():
+    reg = MetricsRegistry()
+    c = reg.counter("c_total", "c", ["step"])
+    assert reg.counter("c_total", "again", ["step"]) is c   # 同名・同種は既存を返す
+    with pytest.raises(ValueError, match="different type or labels"):
+        reg.gauge("c_total", "c", ["step"])
+    with pytest.raises(ValueError, match="expected labels"):
+        c.inc(other="x")
+    with pytest.raises(ValueError, match="only increase"):
+        c.inc(-1, step="x")
+
+
+def test_write_textfile_replaces_the_file(tmp_path):
+    reg = MetricsRegistry()
+    reg.counter("runs_total", "runs").inc()
+    path = tmp_path / "sub" / "ikdd.prom"
+    write_textfile(str(path), reg)
+    assert "runs_total 1" in path.read_text(encoding="utf-8")
+    assert [p.name for p in path.parent.iterdir()] == ["ikdd.prom"]   # 一時ファイルは残らない
+
+
+def test_http_endpoint_serves_metrics():
+    reg = MetricsRegistry()
+    reg.gauge("up", "up").set(1)
+    server = start_http_server(0, registry=reg)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(url + "/metrics") as resp:
+            assert resp.headers["Content-Type"] == CONTENT_TYPE
+            assert "up 1" in resp.read().decode("utf-8")
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + "/other")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_metrics_hook_records_runtime_engine_runs(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(V03_RUNTIME)
+    from runtime_engine import RuntimeEngine
+
+    def boom():
+        raise ValueError("boom")
+
+    reg = MetricsRegistry()
+    iep = {"id": "m", "states": [{"id": "s", "entry_action": [{"ref_step": "OK"}]}],
+           "runtime": {"contract_checks": {"post": ["looks fine to me"]}}}
+    bad = {"id": "bad", "states": [{"id": "s", "entry_action": [{"ref_step": "BOOM"}]}]}
+    with RuntimeEngine({"OK": lambda: 1, "BOOM": boom}, log_path=str(tmp_path / "runtime.log"), echo=False,
+                       hooks=[MetricsHook(reg)]) as engine:
+        engine.execute(iep)
+        with pytest.raises(ValueError):
+            engine.execute(bad)
+    m = runtime_metrics(reg)
+    assert m["runs"].value(iep="m", status="ok") == 1 and m["runs"].value(iep="bad", status="error") == 1
+    assert m["step_duration"].count(step="OK", executor="inline") == 1
+    assert m["step_failures"].value(step="BOOM", error="ValueError") == 1
+    assert m["contracts_skipped"].value(phase="post") == 1
+    assert m["in_progress"].value() == 0
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_yamlio.py — 共通 YAML / JSON ローダとパースキャッシュのテスト
+Usage:
+  python3 -m pytest runtime/test_yamlio.py -q
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from runtime import yamlio
+from runtime.yamlio import ParseCache, load_file, parse_text
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+V03 = os.path.join(HERE, "v0_3")
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    yamlio.configure_parse_cache(None)
+    yield
+    yamlio.configure_parse_cache(os.environ.get("IKDD_PARSE_CACHE") or None)
+
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_load_file_picks_format_from_extension_or_fmt(tmp_path):
+    assert load_file(write(tmp_path / "a.yaml", "x: [1, 2]\n")) == {"x": [1, 2]}
+    assert load_file(write(tmp_path / "a.json", '{"x": 1}')) == {"x": 1}
+    assert load_file(write(tmp_path / "a.txt", "x: 1\n"), fmt="yaml") == {"x": 1}
+    with pytest.raises(ValueError, match="unknown format"):
+        load_file(str(tmp_path / "a.json"), fmt="toml")
+
+
+def test_parse_text_uses_path_extension():
+    assert parse_text("a: 1\n", "plan.iep.yml") == {"a": 1}
+    assert parse_text('{"a": 1}', "plan.iep.json") == {"a": 1}
+    assert parse_text("a: 1\n", fmt="yaml") == {"a": 1}
+
+
+def test_cache_hit_returns_independent_copies(tmp_path):
+    path = write(tmp_path / "a.yaml", "items: [1]\n")
+    os.utime(path, (1, 1))   # RACY_WINDOW の外に置き、stat で当たるようにする
+    first = load_file(path)
+    first["items"].append(2)
+    second = load_file(path)
+    assert second == {"items": [1]}
+    assert yamlio.parse_cache().hits == 1 and yamlio.parse_cache().misses == 1
+
+
+def test_content_hash_hit_after_touch_and_miss_after_edit(tmp_path):
+    path = write(tmp_path / "a.yaml", "v: 1\n")
+    os.utime(path, (1, 1))
+    load_file(path)
+    os.utime(path, (2, 2))           # 内容は同じ → パースしない
+    assert load_file(path) == {"v": 1}
+    assert yamlio.parse_cache().misses == 1
+    write(tmp_path / "a.yaml", "v: 2\n")
+    assert load_file(path) == {"v": 2}
+    assert yamlio.parse_cache().misses == 2
+    assert load_file(path, cache=False) == {"v": 2}
+
+
+def test_persistent_cache_is_shared_across_instances(tmp_path):
+    path = write(tmp_path / "a.json", '{"v": 1}')
+    os.utime(path, (1, 1))
+    root = str(tmp_path / "cache")
+    ParseCache(root).load(path, "json")
+    second = ParseCache(root)
+    assert second.load(path, "json") == {"v": 1}
+    assert second.hits == 1 and second.misses == 0
+    # 壊れたエントリは無視して読み直す
+    for name in os.listdir(root):
+        with open(os.path.join(root, name), "wb") as f:
+            f.write(b"broken")
+    third = ParseCache(root)
+    assert third.load(path, "json") == {"v": 1} and third.misses == 1
+
+
+def test_explicit_yaml_without_pyyaml_is_a_clear_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(yamlio, "HAVE_YAML", False)
+    with pytest.raises(ImportError, match="PyYAML is required"):
+        load_file(write(tmp_path / "a.yml", "x: 1\n"))
+    with pytest.raises(ImportError, match="PyYAML is required"):
+        load_file(write(tmp_path / "a.txt", "x: 1\n"), fmt="yaml")
+    assert load_file(write(tmp_path / "a.json", '{"x": 1}')) == {"x": 1}
+
+
+STEPS_PY = """
+CSV_LOAD = lambda csv_file: []
+FILTER_ROWS = lambda column, op, threshold: []
+JSON_EXPORT = lambda path: path
+"""
+
+
+def run_script(args, cwd):
+    # ドキュメントどおりの直接実行（PYTHONPATH なし → リポジトリ直下は sys.path にない）
+    env = {k: v for k, v in os.environ.items() if k != "PYTHONPATH"}
+    return subprocess.run([sys.executable] + args, cwd=cwd, env=env, capture_output=True, text=True)
+
+
+def test_entry_points_import_the_shared_loader_when_run_as_scripts(tmp_path):
+    example = os.path.join(V03, "examples", "ex1_minimal.iep.yaml")
+    steps = write(tmp_path / "steps.py", STEPS_PY)
+    for name in ("tool.yaml", "knowledge.yaml"):
+        shutil.copy(os.path.join(HERE, "v0_1", name), str(tmp_path / name))
+    runs = [
+        (["compiler/iep_to_v02.py", example, str(tmp_path / "out.tool.yaml")], V03),
+        (["../validator/dryrun_validator.py", example], os.path.join(V03, "schemas")),
+        (["runtime/codegen.py", example, "--steps", steps], V03),
+        (["-m", "ikdd.cli", str(tmp_path / "tool.yaml"), str(tmp_path / "knowledge.yaml")],
+         os.path.join(HERE, "v0_1")),
+        (["-m", "ikdd.cli", "--tool", "tool.yaml", "--knowledge", "knowledge.yaml", "--provider", "dummy",
+          "--outdir", str(tmp_path / "gen")], os.path.join(HERE, "v0_2")),
+    ]
+    for args, cwd in runs:
+        out = run_script(args, cwd)
+        assert out.returncode == 0, (args, out.stderr)
@@ -1,5 +1,10 @@
 
-import argparse, os
+import argparse, os, sys
+
+if __name__ == "__main__":
+    # Run as a script: make the shared runtime package (repository root) importable.
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+
 from ikdd.loader.tool_loader import load_tool
 from ikdd.loader.knowledge_loader import load_knowledge
 from ikdd.validator.constraint_validator import validate_constraints
@@ -1,9 +1,10 @@
 
-import yaml
 import ast
 import textwrap
 from types import ModuleType
 
+from runtime import yamlio
+
 FORBIDDEN_FUNCTIONS = {"exec", "eval", "compile", "__import__"}
 FORBIDDEN_MODULES = {"os", "sys", "subprocess", "shutil"}
 
@@ -30,8 +31,7 @@ def _validate_snippet_safety(snippet: str):
                 raise RuntimeError(f"Forbidden import-from in knowledge snippet: {node.module}")
 
 def load_knowledge(yaml_path: str):
-    with open(yaml_path, encoding="utf-8") as f:
-        data = yaml.safe_load(f)
+    data = yamlio.load_file(yaml_path, fmt="yaml")
 
     if "knowledge" not in data or not isinstance(data["knowledge"], list):
         raise ValueError("knowledge.yaml must contain a 'knowledge' list")
@@ -15,6 +15,11 @@ import os
 import json
 import tempfile
 from pathlib import Path
+
+if __name__ == "__main__":
+    # Run as a script: make the shared runtime package (repository root) importable.
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
 from ikdd.generate import generate, Options
 from ikdd.constraints import run_checks
 
@@ -1,11 +1,19 @@
 from __future__ import annotations
-import os, pathlib
+import os, pathlib, time
 from dataclasses import dataclass
 from typing import Tuple, List
 from .prompt import load_tool, load_knowledge, assemble_prompt
 from .constraints import run_checks
 from .providers import DummyProvider, OpenAIProvider, AnthropicProvider, Provider
 
+try:
+    from ...metrics import generator_metrics, write_textfile
+    METRICS = generator_metrics()
+    HAVE_METRICS = True
+except ImportError:   # ikdd パッケージ単体で使われている場合
+    METRICS = None
+    HAVE_METRICS = False
+
 @dataclass
 class Options:
     tool_path: str
@@ -32,7 +40,18 @@ def generate(opts: Options) -> Tuple[bool, str, List[str]]:
     problems: List[str] = []
     code = ""
     for attempt in range(1, opts.max_tries + 1):
-        resp = provider.generate(prompt if attempt == 1 else f"{prompt}\n\n# 前回の問題点を修正:\n" + "\n".join(problems))
+        if attempt > 1 and HAVE_METRICS:
+            METRICS["retries"].inc(provider=opts.provider)
+        t0 = time.perf_counter()
+        try:
+            resp = provider.generate(prompt if attempt == 1 else f"{prompt}\n\n# 前回の問題点を修正:\n" + "\n".join(problems))
+        except Exception:
+            if HAVE_METRICS:
+                METRICS["provider_errors"].inc(provider=opts.provider)
+                METRICS["generations"].inc(provider=opts.provider, status="error")
+            raise
+        if HAVE_METRICS:
+            METRICS["provider_duration"].observe(time.perf_counter() - t0, provider=opts.provider)
         code = resp.code
         ok, problems = run_checks(code,
                                   must_use=tool.constraints.get("must_use", []),
@@ -40,6 +59,8 @@ def generate(opts: Options) -> Tuple[bool, str, List[str]]:
                                   immutable_params=tool.constraints.get("immutable_params", []))
         if ok:
             break
+    if HAVE_METRICS:
+        METRICS["generations"].inc(provider=opts.provider, status="ok" if ok else "violations")
     pathlib.Path(opts.outdir).mkdir(parents=True, exist_ok=True)
     out_path = os.path.join(opts.outdir, f"{tool.name}.py")
     with open(out_path, "w", encoding="utf-8") as f:
@@ -65,6 +86,8 @@ def main(argv=None):
     p.add_argument("--provider", choices=["dummy", "openai", "anthropic"], default="dummy",
                    help="LLM provider (default: dummy)")
     p.add_argument("--max-tries", type=int, default=2, help="Max constraint validation retries (default: 2)")
+    p.add_argument("--metrics-file", default=None,
+                   help="Write Prometheus metrics to this textfile-collector file (*.prom) after generation")
 
     args = p.parse_args(argv)
 
@@ -83,7 +106,13 @@ def main(argv=None):
         max_tries=args.max_tries
     )
 
-    ok, out_path, problems = generate(opts)
+    if args.metrics_file and not HAVE_METRICS:
+        p.error("--metrics-file requires the runtime.metrics module")
+    try:
+        ok, out_path, problems = generate(opts)
+    finally:
+        if args.metrics_file:
+            write_textfile(args.metrics_file)
     print(f"✅ Written: {out_path}")
     if not ok:
         print("⚠️  Constraint violations remained:")
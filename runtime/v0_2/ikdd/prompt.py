@@ -1,9 +1,13 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from typing import Dict, Any, List
-import yaml
 import textwrap
 
+def _load_yaml(path: str) -> Dict[str, Any]:
+    # Imported on first use: `python -m ikdd.cli` imports this package before cli.py adds the repository root.
+    from runtime import yamlio
+    return yamlio.load_file(path, fmt="yaml")
+
 @dataclass
 class ToolSpec:
     name: str
@@ -22,8 +26,7 @@ def load_tool(path: str) -> ToolSpec:
     - IKDD DSL format (ikdd: root key)
     - v0.2 runtime format (tool: root key)
     """
-    with open(path, 'r', encoding='utf-8') as f:
-        data = yaml.safe_load(f)
+    data = _load_yaml(path)
 
     # Check if IKDD DSL format
     if 'ikdd' in data:
@@ -60,8 +63,7 @@ def load_knowledge(path: str) -> KnowledgeSpec:
     - Array format: knowledge: [{id: ..., snippet: ...}, ...]
     - Dict format: knowledge: {ID: {description: ..., hint: ...}, ...}
     """
-    with open(path, 'r', encoding='utf-8') as f:
-        data = yaml.safe_load(f)
+    data = _load_yaml(path)
 
     knowledge_data = data.get('knowledge', [])
 
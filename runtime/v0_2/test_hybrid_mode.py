@@ -18,6 +18,11 @@ from __future__ import annotations
 import os
 import sys
 
+if __name__ == "__main__":
+    # Run as a script: make the shared runtime package (repository root) importable.
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+
 def check_prerequisites():
     """Check if all prerequisites are met."""
     print("=" * 60)
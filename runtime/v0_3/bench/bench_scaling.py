@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_scaling.py — IKDD v0.3 compile → validate → execute スケーリングベンチマーク
+目的:
+  - 規模の異なる合成 IEP（states / transitions / contracts）を決定的に生成する
+  - 次の 3 フェーズを計測する
+      compile  : iep_to_v02.compile_iepy_to_v02(in_path, out_path)
+      validate : dryrun_validator.validate_iepy_file(in_path)
+      execute  : RuntimeEngine.execute(iep)（no-op step、IEP 読み込みは計測外）
+  - スループット（states/s）・レイテンシ分位点・ピーク RSS を JSON で出力し、
+    コミット間で比較できるようにする（--compare で回帰判定）
+計測方法:
+  - (規模, フェーズ) ごとに子プロセスを起動し、ru_maxrss が他の計測に汚染されないようにする
+  - 各フェーズは --repeat 回（--budget 秒を超えたらそこで打ち切り、最低 1 回）実行する
+Usage:
+  python3 bench_scaling.py [--sizes 10 100 1000 10000 100000] [--phases compile validate execute]
+                           [--repeat 5] [--budget 30] [--format yaml|json] [--out bench_results.json]
+                           [--compare baseline.json] [--tolerance 0.2]
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from contextlib import redirect_stdout
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+V03 = os.path.dirname(HERE)
+for sub in ("compiler", "validator", "runtime"):
+    sys.path.insert(0, os.path.join(V03, sub))
+sys.path.append(os.path.dirname(os.path.dirname(V03)))   # リポジトリ直下（共通 runtime パッケージ）
+
+PHASES = ("compile", "validate", "execute")
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000)
+SCHEMA_PATH = os.path.join(V03, "schemas", "plan_schema.yaml")
+
+
+# ===== 合成 IEP =====
+
+def make_iep(n_states: int, fanout: int = 2, contracts: Optional[int] = None) -> Dict[str, Any]:
+    """
+    n_states 個の state をもつ決定的な IEP。
+      - 各 state: entry 1 件（${cfg.th} 参照付き）
+      - 各 state から fanout 本の transition（guard と effect 1 件付き）
+      - contracts: pre / post 合計（既定は n_states / 10、2〜10000）
+    """
+    if contracts is None:
+        contracts = min(10000, max(2, n_states // 10))
+    states = []
+    transitions = []
+    for i in range(n_states):
+        states.append({
+            "id": f"s{i}",
+            "kind": "internal",
+            "entry_action": [{"ref_step": "NOOP", "args": {"i": i, "th": "${cfg.th}"}}],
+        })
+        for k in range(1, fanout + 1):
+            transitions.append({
+                "from": f"s{i}",
+                "to": f"s{(i + k) % n_states}",
+                "guard": f"context.NOOP_result exists or cfg.th >= {k}",
+                "effects": [{"ref_step": "NOOP_EFFECT", "args": {"k": k}}],
+            })
+    templates = ("cfg.th >= 0", "len(context._executed_steps) >= 0", "cfg.mode == 'bench' and not cfg.fail")
+    pre = [templates[j % len(templates)] + f" or cfg.th == {j}" for j in range(contracts // 2)]
+    post = [templates[j % len(templates)] + f" or cfg.th == {j}" for j in range(contracts - contracts // 2)]
+    return {
+        "id": f"bench_{n_states}",
+        "metadata": {"name": f"bench_{n_states}", "version": "0.3.2-min"},
+        "states": states,
+        "transitions": transitions,
+        "constraints": {"must": ["NOOP"], "forbidden": ["FORBIDDEN_STEP"], "keep": ["cfg"]},
+        "runtime": {"contract_checks": {"pre": pre, "post": post}},
+    }
+
+
+BENCH_PARAMS = {"cfg": {"th": 1, "mode": "bench", "fail": False}}
+
+
+def write_iep(iep: Dict[str, Any], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml  # type: ignore
+            yaml.safe_dump(iep, f, sort_keys=False, allow_unicode=True)
+        else:
+            json.dump(iep, f, ensure_ascii=False)
+
+
+def _noop(**kwargs):
+    return None
+
+
+# ===== 集計 =====
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """nearest-rank 分位点（q は 0〜100）"""
+    if not sorted_values:
+        return float("nan")
+    k = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def summarize(samples: List[float], n_states: int) -> Dict[str, Any]:
+    s = sorted(samples)
+    p50 = percentile(s, 50)
+    return {
+        "runs": len(s),
+        "latency_s": {
+            "min": s[0], "p50": p50, "p90": percentile(s, 90), "p99": percentile(s, 99),
+            "max": s[-1], "mean": sum(s) / len(s),
+        },
+        "throughput_states_per_s": n_states / p50 if p50 > 0 else None,
+    }
+
+
+def _rss_kb() -> int:
+    # Linux は KiB、macOS はバイト
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+# ===== 子プロセス（1 フェーズ分の計測） =====
+
+def run_phase(phase: str, iep_path: str, n_states: int, repeat: int, budget: float) -> Dict[str, Any]:
+    workdir = os.path.dirname(iep_path)
+    if phase == "compile":
+        import iep_to_v02
+        out_path = os.path.join(workdir, "bench.tool.yaml")
+
+        def once():
+            iep_to_v02.compile_iepy_to_v02(iep_path, out_path)
+    elif phase == "validate":
+        import dryrun_validator
+        dryrun_validator.PLAN_SCHEMA_PATH = SCHEMA_PATH
+
+        def once():
+            result = dryrun_validator.validate_iepy_file(iep_path)
+            if result["status"] != "ok":
+                raise RuntimeError("validation failed: " + " / ".join(result["report"]))
+    elif phase == "execute":
+        from runtime_engine import RuntimeEngine, load_yaml_or_json
+        iep = load_yaml_or_json(iep_path)
+        resolver = {"NOOP": _noop, "NOOP_EFFECT": _noop}
+
+        def once():
+            with RuntimeEngine(resolver, log_path=None, echo=False) as engine:
+                engine.execute(iep, params=BENCH_PARAMS)
+    else:
+        raise ValueError(f"unknown phase: {phase}")
+
+    baseline = _rss_kb()
+    samples: List[float] = []
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for _ in range(max(1, repeat)):
+            t0 = time.perf_counter()
+            once()
+            samples.append(time.perf_counter() - t0)
+            if time.perf_counter() - started >= budget:
+                break
+    out = {"phase": phase, "n_states": n_states}
+    out.update(summarize(samples, n_states))
+    out["baseline_rss_kb"] = baseline
+    out["peak_rss_kb"] = _rss_kb()
+    return out
+
+
+def _child_main(argv: List[str]) -> int:
+    phase, iep_path, n_states, repeat, budget, result_path = argv
+    res = run_phase(phase, iep_path, int(n_states), int(repeat), float(budget))
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(res, f)
+    return 0
+
+
+# ===== 親プロセス =====
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=V03, capture_output=True,
+                              text=True, check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(sizes: List[int], phases: List[str], repeat: int = 5, budget: float = 30.0,
+                  fmt: str = "yaml", fanout: int = 2, contracts: Optional[int] = None,
+                  progress: bool = True) -> Dict[str, Any]:
+    results: List[Dict[str, Any]] = []
+    tmp_root = tempfile.mkdtemp(prefix="ikdd_bench_")
+    try:
+        for n in sizes:
+            iep_path = os.path.join(tmp_root, f"bench_{n}.iep.{fmt}")
+            write_iep(make_iep(n, fanout=fanout, contracts=contracts), iep_path)
+            for phase in phases:
+                result_path = os.path.join(tmp_root, f"result_{n}_{phase}.json")
+                cmd = [sys.executable, os.path.abspath(__file__), "--child",
+                       phase, iep_path, str(n), str(repeat), str(budget), result_path]
+                proc = subprocess.run(cmd, capture_output=True, text=True)
+                if proc.returncode != 0:
+                    res = {"phase": phase, "n_states": n, "error": proc.stderr.strip().splitlines()[-1:]}
+                else:
+                    with open(result_path, "r", encoding="utf-8") as f:
+                        res = json.load(f)
+                results.append(res)
+                if progress:
+                    lat = res.get("latency_s", {})
+                    print(f"[bench] n={n:<7} {phase:<8} p50={lat.get('p50', float('nan')):.4f}s "
+                          f"runs={res.get('runs', 0)} peak_rss={res.get('peak_rss_kb', '-')}KiB",
+                          file=sys.stderr)
+    finally:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "format": fmt,
+            "fanout": fanout,
+            "repeat": repeat,
+            "budget_s": budget,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.2) -> List[str]:
+    """p50 が baseline の (1 + tolerance) 倍を超えた (規模, フェーズ) を回帰として列挙する"""
+    base = {(r["n_states"], r["phase"]): r for r in baseline.get("results", []) if "latency_s" in r}
+    regressions = []
+    for r in current.get("results", []):
+        b = base.get((r["n_states"], r["phase"]))
+        if b is None or "latency_s" not in r:
+            continue
+        ratio = r["latency_s"]["p50"] / b["latency_s"]["p50"] if b["latency_s"]["p50"] else float("inf")
+        line = f"n={r['n_states']} {r['phase']}: p50 {b['latency_s']['p50']:.4f}s -> {r['latency_s']['p50']:.4f}s (x{ratio:.2f})"
+        print(("[regression] " if ratio > 1 + tolerance else "[ok] ") + line, file=sys.stderr)
+        if ratio > 1 + tolerance:
+            regressions.append(line)
+    return regressions
+
+
+def main(argv: List[str]) -> int:
+    if len(argv) > 1 and argv[1] == "--child":
+        return _child_main(argv[2:])
+    p = argparse.ArgumentParser(prog="bench_scaling.py", description="IKDD v0.3 scaling benchmark")
+    p.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="state counts")
+    p.add_argument("--phases", nargs="+", choices=PHASES, default=list(PHASES))
+    p.add_argument("--repeat", type=int, default=5, help="runs per (size, phase) (default: 5)")
+    p.add_argument("--budget", type=float, default=30.0, help="stop repeating after N seconds (default: 30)")
+    p.add_argument("--format", choices=["yaml", "json"], default="yaml", help="IEP file format (default: yaml)")
+    p.add_argument("--fanout", type=int, default=2, help="transitions per state (default: 2)")
+    p.add_argument("--contracts", type=int, default=None, help="pre+post contracts (default: states/10)")
+    p.add_argument("--out", default=None, help="write JSON results here (default: stdout)")
+    p.add_argument("--compare", default=None, help="baseline JSON to compare p50 latencies against")
+    p.add_argument("--tolerance", type=float, default=0.2, help="allowed p50 slowdown ratio (default: 0.2)")
+    args = p.parse_args(argv[1:])
+
+    report = run_benchmark(args.sizes, args.phases, repeat=args.repeat, budget=args.budget,
+                           fmt=args.format, fanout=args.fanout, contracts=args.contracts)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    failed = [r for r in report["results"] if "error" in r]
+    for r in failed:
+        print(f"[bench-error] n={r['n_states']} {r['phase']}: {r['error']}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            if compare(report, json.load(f), args.tolerance):
+                return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv))
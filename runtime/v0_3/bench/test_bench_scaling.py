@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_bench_scaling.py — スケーリングベンチマーク（合成 IEP・集計・回帰判定）のテスト
+Usage:
+  python3 -m pytest runtime/v0_3/bench/test_bench_scaling.py -q
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from bench_scaling import PHASES, compare, make_iep, percentile, run_benchmark
+
+
+def test_make_iep_is_deterministic_and_sized():
+    iep = make_iep(10, fanout=3, contracts=4)
+    assert iep == make_iep(10, fanout=3, contracts=4)
+    assert len(iep["states"]) == 10 and len(iep["transitions"]) == 30
+    checks = iep["runtime"]["contract_checks"]
+    assert len(checks["pre"]) + len(checks["post"]) == 4
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(v) for v in range(1, 11)]
+    assert (percentile(values, 50), percentile(values, 90), percentile(values, 100)) == (5.0, 9.0, 10.0)
+
+
+@pytest.mark.parametrize("fmt", ["json", "yaml"])
+def test_smoke_all_phases_on_a_tiny_plan(fmt):
+    report = run_benchmark([5], list(PHASES), repeat=1, budget=5.0, fmt=fmt, progress=False)
+    assert [r["phase"] for r in report["results"]] == list(PHASES)
+    for r in report["results"]:
+        assert "error" not in r, r
+        assert r["runs"] == 1 and r["latency_s"]["p50"] > 0 and r["peak_rss_kb"] > 0
+    assert report["meta"]["format"] == fmt
+
+
+def test_failing_phase_is_reported_not_raised():
+    # state 0 個の IEP は must (NOOP) を満たせず execute が失敗する
+    report = run_benchmark([0], ["execute"], repeat=1, budget=1.0, progress=False)
+    (res,) = report["results"]
+    assert res["phase"] == "execute" and "error" in res
+
+
+def test_compare_flags_only_slowdowns_beyond_tolerance():
+    def report(p50s):
+        return {"results": [{"n_states": n, "phase": "execute", "latency_s": {"p50": p}} for n, p in p50s]}
+    baseline = report([(10, 1.0), (100, 1.0)])
+    regressions = compare(report([(10, 1.1), (100, 1.5), (1000, 9.0)]), baseline, tolerance=0.2)
+    assert len(regressions) == 1 and regressions[0].startswith("n=100 execute")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+iep_batch.py — IEP の一括処理（iep_to_v02 / dryrun_validator の batch モード共通部）
+- 入力展開: ファイル・ディレクトリ（再帰、*.iep.yaml|yml|json）・glob（** 可）
+- 実行: ProcessPoolExecutor で 1 ファイル 1 タスク（workers=1 ならプロセス内で逐次）
+- 集計: 1 つの JSON または JUnit XML レポートに書き出す
+結果レコード:
+  {"path": str, "status": "ok" | "error", "elapsed_ms": float, "messages": [str, ...], ...}
+"""
+import os
+import glob
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from xml.etree import ElementTree as ET
+
+IEP_SUFFIXES = (".iep.yaml", ".iep.yml", ".iep.json")
+REPORT_FORMATS = ("json", "junit")
+
+Result = Dict[str, Any]
+
+def expand_inputs(inputs: Iterable[str], suffixes=IEP_SUFFIXES) -> List[str]:
+    """ファイル・ディレクトリ・glob を重複なしのファイル列（ソート済み）に展開する"""
+    found: Dict[str, None] = {}
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith(suffixes):
+                        found.setdefault(os.path.join(root, name), None)
+        elif glob.has_magic(item):
+            for path in sorted(glob.glob(item, recursive=True)):
+                if os.path.isfile(path):
+                    found.setdefault(path, None)
+        else:
+            found.setdefault(item, None)   # 存在しないファイルは処理側で error として報告する
+    return list(found)
+
+def default_workers() -> int:
+    return max(1, os.cpu_count() or 1)
+
+def run_batch(func: Callable[[str], Result], paths: List[str], workers: Optional[int] = None) -> List[Result]:
+    """func(path) → 結果レコード を並列に実行し、入力順の結果を返す（func は pickle 可能なトップレベル関数）"""
+    workers = min(workers or default_workers(), max(1, len(paths)))
+    if workers <= 1:
+        return [_timed(func, p) for p in paths]
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_timed, [func] * len(paths), paths, chunksize=chunksize))
+
+def _timed(func: Callable[[str], Result], path: str) -> Result:
+    t0 = time.perf_counter()
+    try:
+        result = func(path)
+    except Exception as e:   # 想定外の例外も 1 ファイルの失敗として集計する
+        result = {"status": "error", "messages": [f"[{type(e).__name__}] {e}"]}
+    result = {"path": path, **result}
+    result["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+    return result
+
+def summarize(results: List[Result]) -> Dict[str, int]:
+    failed = sum(1 for r in results if r["status"] != "ok")
+    return {"total": len(results), "passed": len(results) - failed, "failed": failed}
+
+def write_report(results: List[Result], path: str, fmt: str = "json", suite: str = "ikdd") -> None:
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"unknown report format: {fmt}")
+    if fmt == "json":
+        doc = {"suite": suite, **summarize(results), "results": results}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(doc, f, ensure_ascii=False, indent=2)
+        return
+    stats = summarize(results)
+    total_s = sum(r["elapsed_ms"] for r in results) / 1000
+    ts = ET.Element("testsuite", name=suite, tests=str(stats["total"]), failures=str(stats["failed"]),
+                    errors="0", time=f"{total_s:.3f}")
+    for r in results:
+        tc = ET.SubElement(ts, "testcase", classname=suite, name=r["path"], time=f"{r['elapsed_ms'] / 1000:.3f}")
+        messages = r.get("messages") or []
+        if r["status"] != "ok":
+            failure = ET.SubElement(tc, "failure", message=messages[-1] if messages else "failed")
+            failure.text = "\n".join(messages)
+        elif messages:
+            ET.SubElement(tc, "system-out").text = "\n".join(messages)
+    ET.ElementTree(ts).write(path, encoding="utf-8", xml_declaration=True)
+
+def print_summary(results: List[Result], label: str) -> None:
+    for r in results:
+        mark = "ok" if r["status"] == "ok" else "FAILED"
+        line = f"[{mark}] {r['path']} ({r['elapsed_ms']:.1f} ms)"
+        if r["status"] != "ok" and r.get("messages"):
+            line += f": {r['messages'][-1]}"
+        print(line)
+    stats = summarize(results)
+    print(f"[{label}] {stats['passed']}/{stats['total']} passed, {stats['failed']} failed")
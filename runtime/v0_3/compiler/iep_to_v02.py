@@ -5,18 +5,42 @@ iep_to_v02.fixed.py — IEP (v0.3.2-min) → v0.2 tool.yaml projector (MVP, fixe
 - 参照専用: entry_action[].ref_step / transitions[].effects[].ref_step
 - HOW 本文は扱わない（禁止）
 - 線形化は「定義順 state の entry → 記述順 transitions の effects」
+- --cache-dir 指定時はコンパイル結果をキャッシュする（CompileCache）
+    文書単位: IEP 内容ハッシュ＋COMPILER_VERSION が一致すれば出力テキストをそのまま再利用
+    断片単位: 編集された IEP でも、部分木ハッシュが変わっていない state / transition の flow 断片を再利用
+- --dataflow 指定時は args の ${context.<STEP>_result} 参照から依存 DAG を作り、
+  各 step に stage（並行実行できる段）と depends_on（参照する output）を付けて stage 順に並べる
+- --optimize 指定時は optimize_flow で重複 step の統合と未使用 step の削除を行い、削除内容を報告する
+- --batch 指定時は複数の IEP（ファイル・ディレクトリ・glob）をプロセスプールで射影し、
+  集計レポート（JSON / JUnit）を書き出す。1 つでも失敗すれば exit 1
 Usage:
   python3 iep_to_v02.fixed.py <input.iep.yaml|json> <output.tool.yaml|json>
+                              [--cache-dir DIR] [--dataflow] [--optimize]
+  python3 iep_to_v02.fixed.py --batch <dir|glob|file>... --out-dir OUT
+                              [--workers N] [--report PATH] [--format json|junit] [...]
 """
+import os
+import re
 import sys
 import json
-from typing import Any, Dict, List
+import pickle
+import hashlib
+import argparse
+import tempfile
+import functools
+from typing import Any, Dict, List, Optional
 
-try:
-    import yaml  # type: ignore
-    HAVE_YAML = True
-except Exception:
-    HAVE_YAML = False
+if __name__ == "__main__":
+    # スクリプトとして直接実行した場合はリポジトリ直下（共通 runtime パッケージ）を import 可能にする
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+
+# 共通ローダ（libyaml・パースキャッシュ）
+from runtime import yamlio  # noqa: E402
+
+HAVE_YAML = yamlio.HAVE_YAML
+
+# 出力が変わる変更をしたら上げる（コンパイルキャッシュのキーに含まれる）
+COMPILER_VERSION = "0.3.2-min.2"
 
 class CompileError(Exception):
     pass
@@ -33,21 +57,19 @@ def ensure(cond: bool, msg: str):
         raise CompileError(msg)
 
 def load_iepy(path: str) -> Dict[str, Any]:
-    with open(path, "r", encoding="utf-8") as f:
-        text = f.read()
-    if path.endswith((".yaml", ".yml")) and HAVE_YAML:
-        return yaml.safe_load(text)
-    return json.loads(text)
+    return yamlio.load_file(path)
 
-def dump_tool_yaml(obj: Dict[str, Any], path: str) -> None:
+def render_tool(obj: Dict[str, Any]) -> str:
     if HAVE_YAML:
-        text = yaml.safe_dump(obj, sort_keys=False, allow_unicode=True)
-    else:
-        text = json.dumps(obj, ensure_ascii=False, indent=2)
+        return yamlio.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, indent=2)
+
+def dump_tool_yaml(obj: Dict[str, Any], path: str) -> None:
+    text = render_tool(obj)
     with open(path, "w", encoding="utf-8") as f:
         f.write(text)
 
-def validate_iepy(iepy: Dict[str, Any]) -> None:
+def _validate_header(iepy: Dict[str, Any]) -> None:
     ensure(isinstance(iepy, dict), "IEP must be an object")
     for key in ("id", "states", "constraints"):
         ensure(key in iepy, f"IEP missing required key '{key}'")
@@ -58,23 +80,44 @@ def validate_iepy(iepy: Dict[str, Any]) -> None:
     forbidden = set(as_list(constraints.get("forbidden")))
     ensure(must.isdisjoint(forbidden), "constraints conflict: some 'must' are also 'forbidden'")
 
-    # ref_step の簡易点検
-    for st in iepy["states"]:
-        for sec in ("entry_action", "exit_action"):
-            for act in as_list(st.get(sec)):
-                ensure("ref_step" in act and isinstance(act["ref_step"], str) and act["ref_step"].strip(),
-                       f"{sec} requires non-empty ref_step in state '{st.get('id')}'")
+# ref_step の簡易点検
+def _validate_state(st: Dict[str, Any]) -> None:
+    for sec in ("entry_action", "exit_action"):
+        for act in as_list(st.get(sec)):
+            ensure("ref_step" in act and isinstance(act["ref_step"], str) and act["ref_step"].strip(),
+                   f"{sec} requires non-empty ref_step in state '{st.get('id')}'")
+
+def _validate_transition(tr: Dict[str, Any]) -> None:
+    for eff in as_list(tr.get("effects")):
+        ensure("ref_step" in eff and isinstance(eff["ref_step"], str) and eff["ref_step"].strip(),
+               "transition.effects requires non-empty ref_step")
 
+def validate_iepy(iepy: Dict[str, Any]) -> None:
+    _validate_header(iepy)
+    for st in iepy["states"]:
+        _validate_state(st)
     for tr in as_list(iepy.get("transitions")):
-        for eff in as_list(tr.get("effects")):
-            ensure("ref_step" in eff and isinstance(eff["ref_step"], str) and eff["ref_step"].strip(),
-                   "transition.effects requires non-empty ref_step")
+        _validate_transition(tr)
 
 def _step_from_action(action: Dict[str, Any]) -> Dict[str, Any]:
     ref_step = action["ref_step"].strip()
     args = action.get("args") or {}
     inputs = list(args.keys())
-    return {"step": ref_step, "input": inputs, "_args": args}
+    step = {"step": ref_step, "input": inputs, "_args": args}
+    if action.get("foreach"):
+        step["_foreach"] = action["foreach"]
+    if action.get("side_effect"):
+        step["_side_effect"] = True
+    return step
+
+def _steps_from_action(action: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """action → flow step 群（foreach の reduce step は map step の直後に置く）"""
+    step = _step_from_action(action)
+    reduce = (action.get("foreach") or {}).get("reduce")
+    if not reduce:
+        return [step]
+    reduce_arg = action["foreach"].get("reduce_arg") or "results"
+    return [step, {"step": reduce.strip(), "input": [reduce_arg], "_args": {}, "_reduce_of": step["step"]}]
 
 def _assign_outputs(flow: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     counters: Dict[str, int] = {}
@@ -84,6 +127,12 @@ def _assign_outputs(flow: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         item["output"] = f"out_{step}_{counters[step]}"
     return flow
 
+def _state_steps(st: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [step for act in as_list(st.get("entry_action")) for step in _steps_from_action(act)]
+
+def _transition_steps(tr: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [step for eff in as_list(tr.get("effects")) for step in _steps_from_action(eff)]
+
 def linearize_flow(iepy: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     MVP 線形化：
@@ -93,16 +142,249 @@ def linearize_flow(iepy: Dict[str, Any]) -> List[Dict[str, Any]]:
     flow: List[Dict[str, Any]] = []
 
     for st in iepy["states"]:  # 1) entry_action
-        for act in as_list(st.get("entry_action")):
-            flow.append(_step_from_action(act))
+        flow.extend(_state_steps(st))
 
     for tr in as_list(iepy.get("transitions")):  # 2) transitions effects
-        for eff in as_list(tr.get("effects")):
-            flow.append(_step_from_action(eff))
+        flow.extend(_transition_steps(tr))
 
     ensure(len(flow) > 0, "Generated flow is empty; nothing to compile")
     return _assign_outputs(flow)
 
+# ===== コンパイルキャッシュ =====
+
+def _digest(*parts: bytes) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(b"%d:" % len(part))
+        h.update(part)
+    return h.hexdigest()
+
+def _write_atomic(path: str, data: bytes) -> None:
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class CompileCache:
+    """
+    opt-in のコンパイルキャッシュ。
+      <root>/doc/<key>.json : COMPILER_VERSION＋出力形式＋オプション＋IEP ファイル内容のハッシュ → 出力テキスト
+      <root>/frag/<key>.pkl : 入力パスごとの前回の断片表（部分木ハッシュ → 検査・線形化済み flow 断片）
+    失敗したコンパイルは保存しない。
+    """
+    def __init__(self, root: str = ".ikdd_compile_cache"):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+        self.fragment_hits = 0
+        self.fragment_misses = 0
+
+    def doc_key(self, data: bytes, *options: str) -> str:
+        # libyaml の Dumper は長い文字列の折り返し位置が異なるため、出力形式として区別する
+        fmt = b"json" if not HAVE_YAML else b"yaml-c" if yamlio.HAVE_LIBYAML else b"yaml"
+        return _digest(COMPILER_VERSION.encode(), fmt, ",".join(options).encode(), data)
+
+    def get_doc(self, key: str) -> Optional[Dict[str, Any]]:
+        """{"text": 出力テキスト, "removed": optimize_flow の削除報告}"""
+        path = os.path.join(self.root, "doc", f"{key}.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put_doc(self, key: str, text: str, removed: Optional[List[Dict[str, Any]]] = None) -> None:
+        data = json.dumps({"text": text, "removed": removed or []}, ensure_ascii=False)
+        _write_atomic(os.path.join(self.root, "doc", f"{key}.json"), data.encode("utf-8"))
+
+    def _fragments_path(self, in_path: str) -> str:
+        name = _digest(os.path.abspath(in_path).encode("utf-8"))
+        return os.path.join(self.root, "frag", f"{name}.pkl")
+
+    def load_fragments(self, in_path: str) -> Dict[str, List[Dict[str, Any]]]:
+        try:
+            with open(self._fragments_path(in_path), "rb") as f:
+                table = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return {}
+        return table if isinstance(table, dict) else {}
+
+    def save_fragments(self, in_path: str, table: Dict[str, List[Dict[str, Any]]]) -> None:
+        _write_atomic(self._fragments_path(in_path), pickle.dumps(table, protocol=pickle.HIGHEST_PROTOCOL))
+
+def _fragment_key(kind: str, node: Any) -> str:
+    body = json.dumps(node, sort_keys=True, ensure_ascii=False, default=str)
+    return _digest(COMPILER_VERSION.encode(), kind.encode(), body.encode("utf-8"))
+
+def linearize_flow_incremental(iepy: Dict[str, Any], previous: Dict[str, List[Dict[str, Any]]],
+                               cache: Optional[CompileCache] = None):
+    """
+    linearize_flow と同じ結果を、部分木ハッシュが一致する state / transition は previous から再利用して作る。
+    断片の検査（ref_step の簡易点検）も再利用するため、validate_iepy の代わりに _validate_header と併用する。
+    戻り値: (flow, 今回の断片表)
+    """
+    table: Dict[str, List[Dict[str, Any]]] = {}
+    flow: List[Dict[str, Any]] = []
+    parts = [("state", st, _validate_state, _state_steps) for st in iepy["states"]]
+    parts += [("transition", tr, _validate_transition, _transition_steps) for tr in as_list(iepy.get("transitions"))]
+    for kind, node, check, build in parts:
+        key = _fragment_key(kind, node)
+        steps = table.get(key)
+        if steps is None:
+            steps = previous.get(key)
+        if steps is None:
+            check(node)
+            steps = build(node)
+            if cache is not None:
+                cache.fragment_misses += 1
+        elif cache is not None:
+            cache.fragment_hits += 1
+        table[key] = steps
+        flow.extend(dict(step) for step in steps)   # output は断片ではなくコピーに付ける
+    ensure(len(flow) > 0, "Generated flow is empty; nothing to compile")
+    return _assign_outputs(flow), table
+
+# ===== データフロー（DAG）=====
+
+_CONTEXT_REF_RE = re.compile(r"\$\{\s*context\.([A-Za-z_][A-Za-z0-9_]*)")
+
+def _context_refs(value: Any) -> List[str]:
+    """args 中の ${context.<KEY>...} 参照の KEY を列挙する"""
+    if isinstance(value, str):
+        return _CONTEXT_REF_RE.findall(value)
+    if isinstance(value, dict):
+        return [k for v in value.values() for k in _context_refs(v)]
+    if isinstance(value, (list, tuple)):
+        return [k for v in value for k in _context_refs(v)]
+    return []
+
+# ===== 最適化（重複統合・未使用 step 削除）=====
+
+_CONTRACT_REF_RE = re.compile(r"context\.([A-Za-z_][A-Za-z0-9_]*)")
+
+def _flow_units(flow: List[Dict[str, Any]]) -> List[List[int]]:
+    """flow の index を実行単位にまとめる（foreach の map step と直後の reduce step は 1 単位）"""
+    units: List[List[int]] = []
+    for i, item in enumerate(flow):
+        if item.get("_reduce_of") and units and flow[units[-1][-1]]["step"] == item["_reduce_of"]:
+            units[-1].append(i)
+        else:
+            units.append([i])
+    return units
+
+def _root_keys(iepy: Dict[str, Any]) -> List[str]:
+    """flow 外（contract_checks / guard）から参照される context キー"""
+    texts = []
+    checks = (iepy.get("runtime") or {}).get("contract_checks") or {}
+    for phase in ("pre", "post"):
+        texts.extend(str(t) for t in as_list(checks.get(phase)))
+    texts.extend(str(tr["guard"]) for tr in as_list(iepy.get("transitions")) if tr.get("guard"))
+    return [k for t in texts for k in _CONTRACT_REF_RE.findall(t)]
+
+def optimize_flow(flow: List[Dict[str, Any]], iepy: Dict[str, Any]):
+    """
+    出力割当済み・定義順の flow を最適化する（output 名は振り直さない）。
+      1) 重複統合: ref_step・正規化した args・foreach が同じで、参照する ${context.*} の書き手も同じ
+         step は先頭の 1 つに統合する。side_effect: true の step は対象外
+      2) 未使用削除: 出力が後続 step・contract_checks・guard のどれからも参照されない step を削除する。
+         constraints.must にある step と side_effect: true の step は残す（削除で参照がなくなった step も連鎖して削除）
+    戻り値: (最適化後の flow, 削除報告 [{"step", "output", "reason", "kept"?}])
+    """
+    must = set(as_list((iepy.get("constraints") or {}).get("must")))
+    units = _flow_units(flow)
+    removed: List[Dict[str, Any]] = []
+    writer: Dict[str, int] = {}          # context キー → 最後に書いた単位（統合後の代表）
+    signatures: Dict[str, int] = {}
+    deps: Dict[int, List[int]] = {}
+    kept: List[int] = []
+    for u, idxs in enumerate(units):
+        head = flow[idxs[0]]
+        refs = sorted({writer[k] for k in _context_refs(head.get("_args")) if k in writer})
+        key = f"{head['step']}_result"
+        if not head.get("_side_effect"):
+            sig = json.dumps([[flow[i]["step"] for i in idxs], head.get("_args"), head.get("_foreach"), refs],
+                             sort_keys=True, ensure_ascii=False, default=str)
+            rep = signatures.get(sig)
+            if rep is not None:
+                for i in idxs:
+                    removed.append({"step": flow[i]["step"], "output": flow[i]["output"], "reason": "duplicate",
+                                    "kept": flow[units[rep][idxs.index(i)]]["output"]})
+                writer[key] = rep
+                continue
+            signatures[sig] = u
+        writer[key] = u
+        deps[u] = refs
+        kept.append(u)
+    live = {writer[k] for k in _root_keys(iepy) if k in writer}
+    for u in reversed(kept):
+        if u in live:
+            live.update(deps[u])
+            continue
+        idxs = units[u]
+        if any(flow[i]["step"] in must for i in idxs) or flow[idxs[0]].get("_side_effect"):
+            live.add(u)
+            live.update(deps[u])
+    out: List[Dict[str, Any]] = []
+    for u in kept:
+        if u in live:
+            out.extend(flow[i] for i in units[u])
+        else:
+            removed.extend({"step": flow[i]["step"], "output": flow[i]["output"], "reason": "unused"}
+                           for i in units[u])
+    ensure(len(out) > 0, "Optimized flow is empty: no step is consumed, listed in 'must' or marked side_effect")
+    position = {item["output"]: i for i, item in enumerate(flow)}
+    removed.sort(key=lambda r: position[r["output"]])
+    return out, removed
+
+def schedule_dataflow(flow: List[Dict[str, Any]]):
+    """
+    出力割当済みの flow に stage / depends_on を付け、stage 順（同 stage 内は元の順）に並べ替える。
+      - ${context.X_result} は、それより前で最後に X_result を書いた step に依存する
+        （foreach の reduce step は map step と同じキーを書くため、以降の参照は reduce step に向く）
+      - 前に書き手がいない参照（初期 context など）は依存にしない
+      - stage = 依存先の最大 stage + 1（依存なしは 0）
+    戻り値: (並べ替えた flow, {"stages", "max_parallel", "critical_path"})
+    """
+    writer: Dict[str, int] = {}
+    deps: List[List[int]] = []
+    for i, item in enumerate(flow):
+        if item.get("_reduce_of"):
+            found = [j for j in range(i - 1, -1, -1) if flow[j]["step"] == item["_reduce_of"]]
+            own = found[:1]
+        else:
+            own = []
+        refs = [writer[k] for k in _context_refs(item.get("_args")) if k in writer]
+        deps.append(sorted(set(own + refs)))
+        key = f"{item['_reduce_of'] if item.get('_reduce_of') else item['step']}_result"
+        writer[key] = i
+    stages: List[int] = []
+    for i, item in enumerate(flow):
+        stages.append(max((stages[j] + 1 for j in deps[i]), default=0))
+        item["stage"] = stages[i]
+        item["depends_on"] = [flow[j]["output"] for j in deps[i]]
+    # クリティカルパス: 最大 stage の step から stage - 1 の依存先をたどる
+    end = max(range(len(flow)), key=lambda i: (stages[i], -i))
+    path = [end]
+    while deps[path[-1]]:
+        path.append(max(deps[path[-1]], key=lambda j: (stages[j], j)))
+    width: Dict[int, int] = {}
+    for st in stages:
+        width[st] = width.get(st, 0) + 1
+    info = {"stages": max(stages) + 1, "max_parallel": max(width.values()),
+            "critical_path": [flow[i]["output"] for i in reversed(path)]}
+    order = sorted(range(len(flow)), key=lambda i: (stages[i], i))
+    return [flow[i] for i in order], info
+
 def project_constraints(iepy: Dict[str, Any]) -> Dict[str, Any]:
     c = iepy.get("constraints", {})
     must = as_list(c.get("must"))
@@ -123,7 +405,9 @@ def project_constraints(iepy: Dict[str, Any]) -> Dict[str, Any]:
         v02["error"] = error
     return v02
 
-def build_tool_doc(iepy: Dict[str, Any], flow: List[Dict[str, Any]]) -> Dict[str, Any]:
+def build_tool_doc(iepy: Dict[str, Any], flow: List[Dict[str, Any]],
+                   dataflow: Optional[Dict[str, Any]] = None,
+                   optimized: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
     tool_name = iepy.get("metadata", {}).get("name") or iepy["id"]
     tool = {
         "tool": {
@@ -135,22 +419,136 @@ def build_tool_doc(iepy: Dict[str, Any], flow: List[Dict[str, Any]]) -> Dict[str
     rt = iepy.get("runtime", {}).get("contract_checks")
     if rt:
         tool["tool"]["metadata"] = {"runtime_contracts": rt}
+    if dataflow:
+        tool["tool"].setdefault("metadata", {})["dataflow"] = dataflow
+    if optimized:
+        tool["tool"].setdefault("metadata", {})["optimized"] = optimized
     return tool
 
-def compile_iepy_to_v02(in_path: str, out_path: str) -> None:
-    iepy = load_iepy(in_path)
+def _build(iepy: Dict[str, Any], flow: List[Dict[str, Any]], dataflow: bool, optimize: bool):
+    removed: List[Dict[str, Any]] = []
+    if optimize:
+        flow, removed = optimize_flow(flow, iepy)
+    info = None
+    if dataflow:
+        flow, info = schedule_dataflow(flow)
+    return build_tool_doc(iepy, flow, info, removed), removed
+
+def project(iepy: Dict[str, Any], dataflow: bool = False, optimize: bool = False) -> Dict[str, Any]:
+    """
+    読み込み済みの IEP dict を v0.2 tool dict に射影する（ファイル I/O なし、iepy は変更しない）。
+    失敗時は CompileError。optimize の削除報告は tool.metadata.optimized に入る
+    """
     validate_iepy(iepy)
     flow = linearize_flow(iepy)
-    tool = build_tool_doc(iepy, flow)
-    dump_tool_yaml(tool, out_path)
+    tool, _ = _build(iepy, flow, dataflow, optimize)
+    return tool
+
+def compile_iepy_to_v02(in_path: str, out_path: str, cache: Optional[CompileCache] = None,
+                        dataflow: bool = False, optimize: bool = False) -> List[Dict[str, Any]]:
+    """射影して out_path に書き出し、optimize_flow の削除報告を返す（optimize=False なら空）"""
+    if cache is None:
+        tool = project(load_iepy(in_path), dataflow, optimize)
+        dump_tool_yaml(tool, out_path)
+        return tool["tool"].get("metadata", {}).get("optimized", [])
+    with open(in_path, "rb") as f:
+        data = f.read()
+    key = cache.doc_key(data, "dataflow" if dataflow else "linear", "optimize" if optimize else "")
+    entry = cache.get_doc(key)
+    if entry is None:
+        iepy = yamlio.parse_text(data.decode("utf-8"), in_path)
+        _validate_header(iepy)
+        previous = cache.load_fragments(in_path)
+        flow, table = linearize_flow_incremental(iepy, previous, cache)
+        tool, removed = _build(iepy, flow, dataflow, optimize)
+        entry = {"text": render_tool(tool), "removed": removed}
+        cache.put_doc(key, entry["text"], removed)
+        if table.keys() != previous.keys():
+            cache.save_fragments(in_path, table)
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write(entry["text"])
+    return entry["removed"]
+
+# ===== batch =====
+
+def batch_out_path(in_path: str, base: str, out_dir: str) -> str:
+    """<base からの相対パス>.iep.yaml → <out_dir>/<相対パス>.tool.yaml（YAML がなければ .tool.json）"""
+    rel = os.path.relpath(in_path, base)
+    for suffix in (".iep.yaml", ".iep.yml", ".iep.json", ".yaml", ".yml", ".json"):
+        if rel.endswith(suffix):
+            rel = rel[:-len(suffix)]
+            break
+    return os.path.join(out_dir, rel + (".tool.yaml" if HAVE_YAML else ".tool.json"))
+
+def _compile_task(in_path: str, base: str, out_dir: str, cache_dir: Optional[str],
+                  dataflow: bool, optimize: bool) -> Dict[str, Any]:
+    out_path = batch_out_path(in_path, base, out_dir)
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    cache = CompileCache(cache_dir) if cache_dir else None
+    try:
+        removed = compile_iepy_to_v02(in_path, out_path, cache, dataflow=dataflow, optimize=optimize)
+    except CompileError as e:
+        return {"status": "error", "messages": [f"[compile-error] {e}"]}
+    except (OSError, ValueError) as e:   # 読み込み失敗・YAML / JSON 構文エラー
+        return {"status": "error", "messages": [f"[io-error] {e}"]}
+    return {"status": "ok", "output": out_path, "removed": removed,
+            "messages": [f"[ok] projected {in_path} -> {out_path}"]}
+
+def compile_batch(inputs: List[str], out_dir: str, workers: Optional[int] = None,
+                  cache_dir: Optional[str] = None, dataflow: bool = False, optimize: bool = False):
+    from iep_batch import expand_inputs, run_batch
+    paths = expand_inputs(inputs)
+    base = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths]) if paths else "."
+    task = functools.partial(_compile_task, base=base, out_dir=out_dir, cache_dir=cache_dir,
+                             dataflow=dataflow, optimize=optimize)
+    return run_batch(task, [os.path.abspath(p) for p in paths], workers)
+
+def _batch_main(args) -> int:
+    from iep_batch import print_summary, write_report
+    if not args.out_dir:
+        print("[usage] --batch requires --out-dir", file=sys.stderr)
+        return 2
+    results = compile_batch(args.batch, args.out_dir, args.workers, args.cache_dir, args.dataflow, args.optimize)
+    if not results:
+        print("[io-error] no IEP files matched", file=sys.stderr)
+        return 1
+    print_summary(results, "compile")
+    if args.report:
+        write_report(results, args.report, args.format, suite="iep_to_v02")
+    return 0 if all(r["status"] == "ok" for r in results) else 1
 
 def main(argv: List[str]) -> int:
-    if len(argv) < 3:
-        print("Usage: iep_to_v02.fixed.py <input.iep.yaml|json> <output.tool.yaml|json>", file=sys.stderr)
+    ap = argparse.ArgumentParser(prog=os.path.basename(argv[0]) if argv else "iep_to_v02.py",
+                                 description="IEP (v0.3.2-min) -> v0.2 tool.yaml projector")
+    ap.add_argument("in_path", nargs="?", help="input.iep.yaml|json")
+    ap.add_argument("out_path", nargs="?", help="output.tool.yaml|json")
+    ap.add_argument("--cache-dir", default=None, help="reuse compile results / flow fragments cached in DIR")
+    ap.add_argument("--dataflow", action="store_true",
+                    help="order the flow by data dependencies and annotate stage / depends_on")
+    ap.add_argument("--optimize", action="store_true",
+                    help="merge duplicate steps and drop steps whose outputs are never used (reports removals)")
+    bp = ap.add_argument_group("batch mode")
+    bp.add_argument("--batch", nargs="+", metavar="INPUT", help="IEP files, directories or globs to project")
+    bp.add_argument("--out-dir", default=None, help="output directory (mirrors the input tree)")
+    bp.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    bp.add_argument("--report", default=None, help="write an aggregated report to this path")
+    bp.add_argument("--format", choices=["json", "junit"], default="json", help="report format (default: json)")
+    try:
+        args = ap.parse_args(argv[1:])
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else 2
+    if args.batch:
+        return _batch_main(args)
+    if not args.in_path or not args.out_path:
+        ap.print_usage(sys.stderr)
         return 2
-    in_path, out_path = argv[1], argv[2]
+    in_path, out_path = args.in_path, args.out_path
+    cache = CompileCache(args.cache_dir) if args.cache_dir else None
     try:
-        compile_iepy_to_v02(in_path, out_path)
+        removed = compile_iepy_to_v02(in_path, out_path, cache, dataflow=args.dataflow, optimize=args.optimize)
+        for r in removed:
+            detail = f"duplicate of {r['kept']}" if r["reason"] == "duplicate" else "output never used"
+            print(f"[opt] removed {r['output']} ({detail})")
         print(f"[ok] projected {in_path} -> {out_path}")
         return 0
     except CompileError as e:
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_compile_cache.py — IEP → v0.2 射影のコンパイルキャッシュ（文書単位・断片単位）のテスト
+Usage:
+  python3 -m pytest runtime/v0_3/compiler/test_compile_cache.py -q
+"""
+
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from iep_to_v02 import CompileCache, CompileError, compile_iepy_to_v02, main
+
+
+def make_iep(n_states=3, step_prefix="S"):
+    return {
+        "id": "cached",
+        "states": [{"id": f"s{i}", "entry_action": [{"ref_step": f"{step_prefix}{i}", "args": {"i": i}}]}
+                   for i in range(n_states)],
+        "transitions": [{"from": "s0", "to": "s1", "effects": [{"ref_step": "EFFECT"}]}],
+        "constraints": {"must": ["S0"]},
+    }
+
+
+def write(path, iep):
+    path.write_text(json.dumps(iep), encoding="utf-8")
+    return str(path)
+
+
+def test_second_compile_is_a_document_hit_with_identical_output(tmp_path):
+    src = write(tmp_path / "a.iep.json", make_iep())
+    plain, cached = tmp_path / "plain.tool.yaml", tmp_path / "cached.tool.yaml"
+    compile_iepy_to_v02(src, str(plain))
+    cache = CompileCache(str(tmp_path / "cache"))
+    compile_iepy_to_v02(src, str(cached), cache)
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert cached.read_text(encoding="utf-8") == plain.read_text(encoding="utf-8")
+    cached.unlink()
+    compile_iepy_to_v02(src, str(cached), cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cached.read_text(encoding="utf-8") == plain.read_text(encoding="utf-8")
+
+
+def test_edited_iep_reuses_unchanged_fragments(tmp_path):
+    src = tmp_path / "a.iep.json"
+    cache = CompileCache(str(tmp_path / "cache"))
+    compile_iepy_to_v02(write(src, make_iep()), str(tmp_path / "out1.yaml"), cache)
+    assert (cache.fragment_hits, cache.fragment_misses) == (0, 4)
+    edited = make_iep()
+    edited["states"][2]["entry_action"][0]["args"] = {"i": 99}
+    compile_iepy_to_v02(write(src, edited), str(tmp_path / "out2.yaml"), cache)
+    assert (cache.fragment_hits, cache.fragment_misses) == (3, 5)
+    compile_iepy_to_v02(str(src), str(tmp_path / "plain.yaml"))
+    assert (tmp_path / "out2.yaml").read_text() == (tmp_path / "plain.yaml").read_text()
+
+
+def test_options_are_part_of_the_cache_key(tmp_path):
+    src = write(tmp_path / "a.iep.json", make_iep())
+    cache = CompileCache(str(tmp_path / "cache"))
+    compile_iepy_to_v02(src, str(tmp_path / "linear.yaml"), cache)
+    compile_iepy_to_v02(src, str(tmp_path / "dag.yaml"), cache, dataflow=True)
+    assert cache.hits == 0
+    assert "stage:" in (tmp_path / "dag.yaml").read_text() and "stage:" not in (tmp_path / "linear.yaml").read_text()
+
+
+def test_corrupt_entries_are_misses_and_failures_are_not_cached(tmp_path):
+    src = write(tmp_path / "a.iep.json", make_iep())
+    cache = CompileCache(str(tmp_path / "cache"))
+    compile_iepy_to_v02(src, str(tmp_path / "out.yaml"), cache)
+    for name in os.listdir(tmp_path / "cache" / "doc"):
+        (tmp_path / "cache" / "doc" / name).write_text("{not json")
+    for name in os.listdir(tmp_path / "cache" / "frag"):
+        (tmp_path / "cache" / "frag" / name).write_bytes(b"garbage")
+    compile_iepy_to_v02(src, str(tmp_path / "out.yaml"), cache)
+    assert cache.hits == 0 and cache.misses == 2
+
+    bad = make_iep()
+    bad["states"][0]["entry_action"][0]["ref_step"] = " "
+    write(tmp_path / "a.iep.json", bad)
+    for _ in range(2):
+        with pytest.raises(CompileError, match="requires non-empty ref_step"):
+            compile_iepy_to_v02(src, str(tmp_path / "out.yaml"), cache)
+    assert cache.hits == 0
+
+
+def test_cli_cache_dir(tmp_path, capsys):
+    src = write(tmp_path / "a.iep.json", make_iep())
+    out = str(tmp_path / "out.yaml")
+    assert main(["iep_to_v02.py", src, out, "--cache-dir", str(tmp_path / "cache")]) == 0
+    assert main(["iep_to_v02.py", src, out, "--cache-dir", str(tmp_path / "cache")]) == 0
+    assert capsys.readouterr().out.count("[ok] projected") == 2
+    assert len(os.listdir(tmp_path / "cache" / "doc")) == 1
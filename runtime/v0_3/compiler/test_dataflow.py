@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_dataflow.py — data-flow DAG の stage 付けと並べ替え（--dataflow）のテスト
+Usage:
+  python3 -m pytest runtime/v0_3/compiler/test_dataflow.py -q
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from iep_to_v02 import CompileError, linearize_flow, project, schedule_dataflow
+
+
+def action(step, **args):
+    return {"ref_step": step, "args": args}
+
+
+def diamond_iep():
+    """LOAD → (LEFT, RIGHT) → JOIN → AUDIT、REPORT は初期 context だけを読む"""
+    return {
+        "id": "diamond",
+        "states": [
+            {"id": "load", "entry_action": [action("LOAD")]},
+            {"id": "left", "entry_action": [action("LEFT", rows="${context.LOAD_result}")]},
+            {"id": "right", "entry_action": [action("RIGHT", rows="${ context.LOAD_result.rows }")]},
+            {"id": "join", "entry_action": [action("JOIN", a="${context.LEFT_result}", b="${context.RIGHT_result}")]},
+            {"id": "report", "entry_action": [action("REPORT", cfg="${context.initial_cfg}")]},
+        ],
+        # transition の effects は全 state の entry の後に線形化されるため、JOIN より前の書き手にならない
+        "transitions": [{"from": "load", "to": "left", "effects": [action("AUDIT", rows="${context.JOIN_result}")]}],
+        "constraints": {},
+    }
+
+
+def test_stages_and_depends_on_follow_context_references():
+    flow, info = schedule_dataflow(linearize_flow(diamond_iep()))
+    by_step = {item["step"]: item for item in flow}
+    assert [(i["step"], i["stage"]) for i in flow] == [
+        ("LOAD", 0), ("REPORT", 0), ("LEFT", 1), ("RIGHT", 1), ("JOIN", 2), ("AUDIT", 3)]
+    assert by_step["JOIN"]["depends_on"] == ["out_LEFT_1", "out_RIGHT_1"]
+    assert by_step["REPORT"]["depends_on"] == []   # 前に書き手がいない参照は依存にしない
+    assert info == {"stages": 4, "max_parallel": 2,
+                    "critical_path": ["out_LOAD_1", "out_RIGHT_1", "out_JOIN_1", "out_AUDIT_1"]}
+
+
+def test_reference_binds_to_the_latest_earlier_writer():
+    iep = {"id": "rewrite", "constraints": {}, "states": [
+        {"id": "a", "entry_action": [action("STEP"), action("USE", x="${context.STEP_result}"), action("STEP")]},
+        {"id": "b", "entry_action": [action("USE", x="${context.STEP_result}")]},
+    ]}
+    flow, _ = schedule_dataflow(linearize_flow(iep))
+    uses = [i for i in flow if i["step"] == "USE"]
+    assert [u["depends_on"] for u in uses] == [["out_STEP_1"], ["out_STEP_2"]]
+
+
+def test_reduce_step_follows_its_map_step():
+    iep = {"id": "fe", "constraints": {}, "states": [{"id": "s", "entry_action": [
+        {"ref_step": "MAP", "args": {"rows": []}, "foreach": {"arg": "rows", "reduce": "MERGE"}},
+        action("USE", x="${context.MAP_result}"),
+    ]}]}
+    flow, info = schedule_dataflow(linearize_flow(iep))
+    assert [(i["step"], i["stage"], i["depends_on"]) for i in flow] == [
+        ("MAP", 0, []), ("MERGE", 1, ["out_MAP_1"]), ("USE", 2, ["out_MERGE_1"])]
+    assert info["stages"] == 3
+
+
+def test_project_records_dataflow_metadata_without_touching_the_input():
+    iep = diamond_iep()
+    tool = project(iep, dataflow=True)["tool"]
+    assert tool["metadata"]["dataflow"]["max_parallel"] == 2
+    assert [i["step"] for i in tool["flow"]] == ["LOAD", "REPORT", "LEFT", "RIGHT", "JOIN", "AUDIT"]
+    assert "output" not in iep["states"][0]["entry_action"][0]
+    assert "stage" not in project(iep)["tool"]["flow"][0]
+
+
+def test_empty_flow_is_a_compile_error():
+    with pytest.raises(CompileError, match="flow is empty"):
+        project({"id": "x", "constraints": {}, "states": [{"id": "s"}]}, dataflow=True)
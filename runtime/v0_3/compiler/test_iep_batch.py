@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_iep_batch.py — IEP 一括処理（入力展開・並列実行・レポート・iep_to_v02 --batch）のテスト
+Usage:
+  python3 -m pytest runtime/v0_3/compiler/test_iep_batch.py -q
+"""
+
+import os
+import sys
+import json
+from xml.etree import ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from iep_batch import expand_inputs, run_batch, write_report
+from iep_to_v02 import compile_batch, main
+
+
+def good_iep(name):
+    return {"id": name, "states": [{"id": "s", "entry_action": [{"ref_step": "LOAD"}]}], "constraints": {}}
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """src/a.iep.json, src/sub/b.iep.json, src/sub/broken.iep.json（構文エラー）, src/notes.txt"""
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    (src / "a.iep.json").write_text(json.dumps(good_iep("a")))
+    (src / "sub" / "b.iep.json").write_text(json.dumps(good_iep("b")))
+    (src / "sub" / "broken.iep.json").write_text("{not json")
+    (src / "notes.txt").write_text("ignored")
+    return src
+
+
+def size_of(path):
+    if path.endswith("boom"):
+        raise RuntimeError("unexpected")
+    return {"status": "ok" if os.path.getsize(path) > 10 else "error", "messages": []}
+
+
+def test_expand_inputs_walks_directories_and_globs(tree):
+    assert expand_inputs([str(tree)]) == [str(tree / "a.iep.json"), str(tree / "sub" / "b.iep.json"),
+                                          str(tree / "sub" / "broken.iep.json")]
+    assert expand_inputs([str(tree / "**" / "b.*.json"), str(tree / "sub" / "b.iep.json"), "missing.iep.json"]) == \
+        [str(tree / "sub" / "b.iep.json"), "missing.iep.json"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_run_batch_keeps_input_order_and_isolates_failures(tree, workers):
+    paths = expand_inputs([str(tree)]) + [str(tree / "x.boom")]
+    results = run_batch(size_of, paths, workers)
+    assert [r["path"] for r in results] == paths
+    assert [r["status"] for r in results] == ["ok", "ok", "error", "error"]
+    assert results[-1]["messages"] == ["[RuntimeError] unexpected"]
+    assert all(r["elapsed_ms"] >= 0 for r in results)
+
+
+def test_write_report_json_and_junit(tmp_path):
+    results = [{"path": "a", "status": "ok", "elapsed_ms": 1.0, "messages": ["[ok] a"]},
+               {"path": "b", "status": "error", "elapsed_ms": 2.0, "messages": ["[compile-error] bad"]}]
+    write_report(results, str(tmp_path / "r.json"), "json", suite="s")
+    doc = json.loads((tmp_path / "r.json").read_text())
+    assert (doc["suite"], doc["total"], doc["passed"], doc["failed"]) == ("s", 2, 1, 1)
+    write_report(results, str(tmp_path / "r.xml"), "junit", suite="s")
+    root = ET.parse(str(tmp_path / "r.xml")).getroot()
+    assert (root.get("tests"), root.get("failures")) == ("2", "1")
+    assert root.find("testcase[@name='b']/failure").get("message") == "[compile-error] bad"
+    with pytest.raises(ValueError, match="unknown report format"):
+        write_report(results, str(tmp_path / "r.txt"), "txt")
+
+
+def test_compile_batch_mirrors_the_input_tree(tree, tmp_path):
+    out = tmp_path / "out"
+    results = compile_batch([str(tree)], str(out), workers=2)
+    assert [r["status"] for r in results] == ["ok", "ok", "error"]
+    assert results[2]["messages"][0].startswith("[io-error]")
+    assert sorted(os.path.relpath(os.path.join(d, f), out) for d, _, fs in os.walk(out) for f in fs) == \
+        ["a.tool.yaml", os.path.join("sub", "b.tool.yaml")]
+
+
+def test_batch_cli_exit_codes_and_report(tree, tmp_path, capsys):
+    report = tmp_path / "report.xml"
+    args = ["iep_to_v02.py", "--batch", str(tree), "--out-dir", str(tmp_path / "out"), "--workers", "1"]
+    assert main(args + ["--report", str(report), "--format", "junit"]) == 1
+    assert "[compile] 2/3 passed, 1 failed" in capsys.readouterr().out
+    assert ET.parse(str(report)).getroot().get("failures") == "1"
+    assert main(args[:2] + [str(tree / "a.iep.json")] + args[3:]) == 0
+    assert main(["iep_to_v02.py", "--batch", str(tree)]) == 2   # --out-dir は必須
+    assert main(["iep_to_v02.py", "--batch", str(tmp_path / "none" / "*.iep.json"), "--out-dir", "x"]) == 1
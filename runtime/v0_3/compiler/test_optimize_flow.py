@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_optimize_flow.py — 重複 step の統合と未使用 step の削除（--optimize）のテスト
+Usage:
+  python3 -m pytest runtime/v0_3/compiler/test_optimize_flow.py -q
+"""
+
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from iep_to_v02 import CompileError, linearize_flow, main, optimize_flow, project
+
+
+def action(step, **args):
+    return {"ref_step": step, "args": args}
+
+
+def make_iep(entry, must=(), post=(), guard=None):
+    iep = {"id": "opt", "states": [{"id": "s", "entry_action": entry}], "constraints": {"must": list(must)}}
+    if post:
+        iep["runtime"] = {"contract_checks": {"post": list(post)}}
+    if guard:
+        iep["transitions"] = [{"from": "s", "to": "s", "guard": guard}]
+    return iep
+
+
+def optimize(iep):
+    flow, removed = optimize_flow(linearize_flow(iep), iep)
+    return [i["output"] for i in flow], removed
+
+
+def test_duplicates_are_merged_into_the_first_occurrence():
+    iep = make_iep([action("LOAD", path="a.csv"), action("LOAD", path="a.csv"),
+                    action("EXPORT", rows="${context.LOAD_result}"), action("LOAD", path="b.csv")], must=["EXPORT"])
+    kept, removed = optimize(iep)
+    # EXPORT は統合後の out_LOAD_1 を読む。後から別の引数で読み込んだ LOAD は誰も読まない
+    assert kept == ["out_LOAD_1", "out_EXPORT_1"]
+    assert removed == [{"step": "LOAD", "output": "out_LOAD_2", "reason": "duplicate", "kept": "out_LOAD_1"},
+                       {"step": "LOAD", "output": "out_LOAD_3", "reason": "unused"}]
+
+
+def test_unused_steps_are_dropped_transitively():
+    iep = make_iep([action("LOAD"), action("CLEAN", rows="${context.LOAD_result}"),
+                    action("STATS", rows="${context.CLEAN_result}"), action("EXPORT")], must=["EXPORT"])
+    kept, removed = optimize(iep)
+    assert kept == ["out_EXPORT_1"]
+    assert [(r["output"], r["reason"]) for r in removed] == [
+        ("out_LOAD_1", "unused"), ("out_CLEAN_1", "unused"), ("out_STATS_1", "unused")]
+
+
+def test_contracts_guards_must_and_side_effects_keep_steps_alive():
+    iep = make_iep([action("A"), action("B"), action("C"), action("D"),
+                    {"ref_step": "NOTIFY", "side_effect": True}, {"ref_step": "NOTIFY", "side_effect": True}],
+                   must=["C"], post=["context.A_result exists"], guard="context.B_result == true")
+    kept, removed = optimize(iep)
+    assert kept == ["out_A_1", "out_B_1", "out_C_1", "out_NOTIFY_1", "out_NOTIFY_2"]   # side_effect は統合しない
+    assert removed == [{"step": "D", "output": "out_D_1", "reason": "unused"}]
+
+
+def test_same_args_with_different_upstream_writers_are_not_duplicates():
+    iep = make_iep([action("LOAD"), action("USE", x="${context.LOAD_result}"), action("LOAD", path="other"),
+                    action("USE", x="${context.LOAD_result}")], must=["USE"])
+    kept, removed = optimize(iep)
+    assert kept == ["out_LOAD_1", "out_USE_1", "out_LOAD_2", "out_USE_2"] and removed == []
+
+
+def test_project_reports_removals_and_rejects_an_empty_result():
+    iep = make_iep([action("A"), action("A"), action("B", x="${context.A_result}")], must=["B"])
+    tool = project(iep, optimize=True)["tool"]
+    assert [i["output"] for i in tool["flow"]] == ["out_A_1", "out_B_1"]
+    assert tool["metadata"]["optimized"][0]["reason"] == "duplicate"
+    with pytest.raises(CompileError, match="Optimized flow is empty"):
+        project(make_iep([action("A")]), optimize=True)
+
+
+def test_cli_prints_removals(tmp_path, capsys):
+    src = tmp_path / "a.iep.json"
+    src.write_text(json.dumps(make_iep([action("A"), action("A"), action("UNUSED")], must=["A"])))
+    assert main(["iep_to_v02.py", str(src), str(tmp_path / "out.yaml"), "--optimize"]) == 0
+    out = capsys.readouterr().out
+    assert "[opt] removed out_A_2 (duplicate of out_A_1)" in out
+    assert "[opt] removed out_UNUSED_1 (output never used)" in out
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+codegen.py — IKDD v0.3 IEP → Python ランナーモジュールの生成
+目的:
+  - RuntimeEngine が実行時に行う IEP 解釈（dict 参照・action ごとのログ・文字列整形・hook 呼び出し）を
+    生成時に済ませ、繰り返し実行される計画のオーバーヘッドを削る
+  - 生成モジュールでは state が 1 関数、step 呼び出しは直接呼び出し、
+    args の ${...} 展開と contract は式としてインライン展開される
+  - 生成したモジュールはソースの内容ハッシュをキーにバイトコード（marshal）でキャッシュする
+意味論:
+  - walk モード（定義順に全 state の entry → 全 transition の effects → exit）と同じ実行順・
+    context（<ref_step>_result / _executed_steps）・pre / post contract・must チェック
+  - 連続する independent action は args をまとめて展開してから順に実行する（executor 指定は無視して inline）
+  - 解析できない contract・未解決の名前を含む contract は RuntimeEngine と同様に評価しない
+    （strict_contracts なら後者は偽として失敗）
+  - ログ・hook・StepCache・チェックポイントは持たない（必要なら RuntimeEngine を使う）
+  - machine モード・foreach・コルーチン step・timeouts を含む計画は生成できない（CodegenError）
+Usage:
+  python3 codegen.py <input.iep.yaml|json> --steps <steps.py|module|registry.yaml> [-o runner.py]
+                     [--run] [--params '{"inputs": {...}}'] [--cache-dir .ikdd_codegen]
+  # 生成モジュールの利用
+  import runner; runner.bind(load_step_resolver("steps.py")); ctx = runner.run({"inputs": {...}})
+"""
+
+import os
+import re
+import ast
+import sys
+import json
+import types
+import marshal
+import pickle
+import hashlib
+import keyword
+import argparse
+import tempfile
+import importlib.util
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+if __name__ == "__main__":
+    # スクリプトとして直接実行した場合はリポジトリ直下（共通 runtime パッケージ）を import 可能にする
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+
+from runtime_engine import (BoundAction, CompiledContract, CompiledPlan, RuntimeErrorIKDD, compile_plan,
+                            group_independent, iep_content_hash, load_step_resolver, load_yaml_or_json,
+                            walk_order)  # noqa: E402
+from contract_expr import helpers_source, parse_condition  # noqa: E402
+
+CODEGEN_VERSION = "2"   # 生成コードの形を変えたら上げる（キャッシュキーに含まれる）
+
+_TEMPLATE_RE = re.compile(r"\$\{([^}]+)\}")
+
+
+class CodegenError(RuntimeErrorIKDD):
+    """生成モジュールでは表現できない計画"""
+
+
+# ===== 生成モジュールの前置き =====
+
+_PRELUDE_TAIL = '''
+
+def _arg(name, text, p, c):
+    # args の値全体が ${...} の場合（解決できなければ元の文字列のまま渡す）
+    v = _tmpl_resolve(name, p, c)
+    return text if v is _MISSING else v
+
+
+def _contract(pred, strict):
+    # 未解決の名前を含む contract: strict なら偽、そうでなければ評価しない（RuntimeEngine と同じ）
+    try:
+        return bool(pred())
+    except UnresolvedName:
+        return False if strict else None
+
+
+try:
+    from runtime_engine import RuntimeErrorIKDD
+except ImportError:   # runtime_engine なしで読み込まれた場合
+    class RuntimeErrorIKDD(Exception):
+        pass
+'''
+
+
+# ===== 式の生成 =====
+
+class _Emitter:
+    """生成中のモジュール 1 つ分の状態（step 変数名・リテラルにできない定数）"""
+    def __init__(self):
+        self.step_vars: Dict[str, str] = {}   # ref_step → 生成モジュール内の変数名
+        self.consts: List[Any] = []           # repr で書けない定数（pickle して埋め込む）
+
+    def step_var(self, ref_step: str) -> str:
+        var = self.step_vars.get(ref_step)
+        if var is None:
+            var = self.step_vars[ref_step] = f"_s{len(self.step_vars)}"
+        return var
+
+    def const(self, value: Any) -> str:
+        text = repr(value)
+        try:
+            if type(ast.literal_eval(text)) is type(value) and ast.literal_eval(text) == value:
+                return text
+        except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+            pass
+        try:
+            pickle.dumps(value)
+        except Exception as e:
+            raise CodegenError(f"cannot embed argument value {text[:60]}: {e}")
+        self.consts.append(value)
+        return f"_CONSTS[{len(self.consts) - 1}]"
+
+    def arg_expr(self, value: Any) -> str:
+        """render_template(value, p, c) と同じ値になる式"""
+        if isinstance(value, str):
+            m = _TEMPLATE_RE.fullmatch(value)
+            if m:
+                return f"_arg({m.group(1).strip()!r}, {value!r}, p, c)"
+            if _TEMPLATE_RE.search(value):
+                return f"_tmpl_render({value!r}, p, c)"
+            return repr(value)
+        if isinstance(value, dict) and _has_refs(value):
+            items = ", ".join(f"{self.const(k)}: {self.arg_expr(v)}" for k, v in value.items())
+            return "{" + items + "}"
+        if isinstance(value, list) and _has_refs(value):
+            return "[" + ", ".join(self.arg_expr(v) for v in value) + "]"
+        return self.const(value)
+
+    def kwargs_expr(self, action: BoundAction) -> str:
+        items = ", ".join(f"{self.const(k)}: {self.arg_expr(v)}" for k, v in action.args.items())
+        return "{" + items + "}"
+
+    def call_expr(self, action: BoundAction) -> str:
+        parts, extra = [], []
+        for k, v in action.args.items():
+            expr = self.arg_expr(v) if action.refs else self.const(v)
+            if isinstance(k, str) and k.isidentifier() and not keyword.iskeyword(k):
+                parts.append(f"{k}={expr}")
+            else:
+                extra.append(f"{self.const(k)}: {expr}")
+        if extra:
+            parts.append("**{" + ", ".join(extra) + "}")
+        return f"{self.step_var(action.ref_step)}({', '.join(parts)})"
+
+
+def _has_refs(value: Any) -> bool:
+    if isinstance(value, str):
+        return _TEMPLATE_RE.search(value) is not None
+    if isinstance(value, dict):
+        return any(_has_refs(v) for v in value.values())
+    if isinstance(value, list):
+        return any(_has_refs(v) for v in value)
+    return False
+
+
+def _state_func(sid: Any) -> str:
+    name = re.sub(r"\W", "_", str(sid))
+    return f"state_{name}"
+
+
+def _check_supported(plan: CompiledPlan):
+    if plan.mode != "walk":
+        raise CodegenError(f"runtime mode '{plan.mode}' is not supported by codegen (walk only)")
+    if plan.run_timeout is not None:
+        raise CodegenError("runtime.timeouts is not supported by codegen")
+    for act in walk_order(plan.states):
+        where = f"step '{act.ref_step}' ({act.phase} of {act.state})"
+        if act.is_async:
+            raise CodegenError(f"{where}: coroutine steps are not supported by codegen")
+        if act.foreach is not None:
+            raise CodegenError(f"{where}: foreach is not supported by codegen")
+        if act.timeout is not None:
+            raise CodegenError(f"{where}: timeouts are not supported by codegen")
+
+
+def _emit_actions(em: _Emitter, actions: List[BoundAction], out: List[str]):
+    for group in group_independent(actions):
+        if len(group) == 1:
+            act = group[0]
+            out.append(f"    c[{act.ref_step + '_result'!r}] = {em.call_expr(act)}")
+            out.append(f"    done.append({act.ref_step!r})")
+            continue
+        # independent グループ: 全 action の args を先に展開し、結果は実行後に宣言順で記録する
+        out.append(f"    # independent: {', '.join(repr(a.ref_step) for a in group)}")
+        for i, act in enumerate(group):
+            if act.refs:
+                out.append(f"    a{i} = {em.kwargs_expr(act)}")
+        for i, act in enumerate(group):
+            call = f"{em.step_var(act.ref_step)}(**a{i})" if act.refs else em.call_expr(act)
+            out.append(f"    r{i} = {call}")
+        for i, act in enumerate(group):
+            out.append(f"    c[{act.ref_step + '_result'!r}] = r{i}")
+            out.append(f"    done.append({act.ref_step!r})")
+
+
+def _emit_contracts(contracts: List[CompiledContract], phase: str, out: List[str]):
+    for ct in contracts:
+        if ct.predicate is None:
+            out.append(f"    # unparsed {phase} contract (skipped): {ct.text!r}")
+            continue
+        out.append(f"    if _contract(lambda: {parse_condition(ct.text).source()}, {ct.strict!r}) is False:")
+        out.append(f"        raise RuntimeErrorIKDD({'Contract ' + phase + ' check failed: ' + ct.text!r})")
+
+
+# ===== ソース生成 =====
+
+def generate_source(plan: CompiledPlan) -> str:
+    """CompiledPlan（walk モード）→ 生成モジュールのソース"""
+    _check_supported(plan)
+    em = _Emitter()
+    body: List[str] = []
+    funcs: List[str] = []
+    for st in plan.states:
+        name = _state_func(st.sid)
+        while name in funcs:
+            name += "_"
+        funcs.append(name)
+        out = [f"def {name}(p, c, done):", f"    # state {st.sid!r}"]
+        _emit_actions(em, st.entry, out)
+        for tr in st.transitions:
+            if tr.effects:
+                out.append(f"    # {st.sid!r} -> {tr.to!r}")
+                _emit_actions(em, tr.effects, out)
+        _emit_actions(em, st.exit, out)
+        if len(out) == 2:
+            out.append("    pass")
+        body.append("\n".join(out))
+
+    run = ['def run(params=None, context=None):',
+           '    """walk モードで 1 回実行し、context を返す（params は ${...} 参照の解決元）"""',
+           '    p = dict(params) if params is not None else {}',
+           '    c = dict(context) if context is not None else {}',
+           '    done = c.setdefault("_executed_steps", [])']
+    _emit_contracts(plan.pre, "pre", run)
+    run.extend(f"    {name}(p, c, done)" for name in funcs)
+    _emit_contracts(plan.post, "post", run)
+    run += ['    missing = MUST - set(done)',
+            '    if missing:',
+            '        raise RuntimeErrorIKDD(f"must steps not executed: {set(missing)}")',
+            '    return c']
+
+    names = list(em.step_vars)
+    bind = ['def bind(steps):',
+            '    """ref_step → callable の Mapping（load_step_resolver の戻り値など）から step を束縛する"""',
+            f'    global {", ".join(em.step_vars.values())}' if names else '    pass']
+    for ref_step, var in em.step_vars.items():
+        bind.append(f"    {var} = steps[{ref_step!r}]")
+
+    head = [f"# Generated by codegen.py (IKDD v0.3, codegen {CODEGEN_VERSION}) - do not edit",
+            f"# iep: {plan.iep_id!r}  hash: {plan.iep_hash!r}",
+            helpers_source().rstrip("\n"), _PRELUDE_TAIL.rstrip("\n"), "",
+            "",
+            f"IEP_ID = {plan.iep_id!r}",
+            f"IEP_HASH = {plan.iep_hash!r}",
+            f"MUST = frozenset({sorted(plan.must)!r})",
+            f"STEPS = {tuple(names)!r}"]
+    if em.consts:
+        head += ["import pickle", f"_CONSTS = pickle.loads({pickle.dumps(em.consts)!r})   # repr で書けない引数の定数"]
+    head += [f"{var} = None   # {ref_step!r}" for ref_step, var in em.step_vars.items()]
+    return "\n".join(head) + "\n\n\n" + "\n\n\n".join(["\n".join(bind)] + body + ["\n".join(run)]) + "\n"
+
+
+# ===== バイトコードキャッシュ =====
+
+class CodegenCache:
+    """
+    生成ソースの sha256 → コードオブジェクト。
+    root を指定すると <root>/<key>.py（トレースバック用のソース）と <key>.pyc（magic + marshal）に永続化する。
+    magic が現在のインタプリタと異なるエントリは作り直す。
+    """
+    def __init__(self, root: Optional[str] = ".ikdd_codegen"):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+        self._mem: Dict[str, types.CodeType] = {}
+
+    @staticmethod
+    def key_for(source: str) -> str:
+        h = hashlib.sha256(f"{CODEGEN_VERSION}\0".encode("utf-8"))
+        h.update(source.encode("utf-8"))
+        return h.hexdigest()
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.root, f"{key}{ext}")
+
+    def _load(self, key: str) -> Optional[types.CodeType]:
+        if not self.root:
+            return None
+        try:
+            with open(self._path(key, ".pyc"), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        magic = importlib.util.MAGIC_NUMBER
+        if not data.startswith(magic):
+            return None
+        try:
+            code = marshal.loads(data[len(magic):])
+        except (EOFError, ValueError, TypeError):
+            return None
+        return code if isinstance(code, types.CodeType) else None
+
+    def _write(self, path: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            # 永続化できなくても生成自体は成功させる
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get_code(self, source: str, label: str = "plan") -> types.CodeType:
+        key = self.key_for(source)
+        code = self._mem.get(key)
+        if code is None:
+            code = self._load(key)
+        if code is not None:
+            self.hits += 1
+            self._mem[key] = code
+            return code
+        self.misses += 1
+        filename = self._path(key, ".py") if self.root else f"<ikdd-codegen:{label}>"
+        code = compile(source, filename, "exec")
+        self._mem[key] = code
+        if self.root:
+            os.makedirs(self.root, exist_ok=True)
+            self._write(filename, source.encode("utf-8"))
+            self._write(self._path(key, ".pyc"), importlib.util.MAGIC_NUMBER + marshal.dumps(code))
+        return code
+
+
+_DEFAULT_CACHE = CodegenCache(root=None)
+
+
+# ===== 読み込み =====
+
+def _plan_actions(plan: CompiledPlan) -> Dict[str, Callable[..., Any]]:
+    return {act.ref_step: act.func for act in walk_order(plan.states)}
+
+
+def load_plan(iep: Dict[str, Any], step_resolver: Mapping[str, Callable[..., Any]],
+              cache: Optional[CodegenCache] = None, strict_contracts: bool = False) -> types.ModuleType:
+    """
+    IEP → step を束縛済みの生成モジュール（module.run(params) で実行）。
+    計画の検証（forbidden・ref_step の解決・contract の解析）は compile_plan と同じ。
+    """
+    plan = compile_plan(iep, step_resolver, iep_hash=iep_content_hash(iep), strict_contracts=strict_contracts)
+    return load_compiled(plan, cache)
+
+
+def load_compiled(plan: CompiledPlan, cache: Optional[CodegenCache] = None) -> types.ModuleType:
+    source = generate_source(plan)
+    code = (cache or _DEFAULT_CACHE).get_code(source, label=str(plan.iep_id))
+    module = types.ModuleType(f"ikdd_plan_{plan.iep_hash[:12]}")
+    module.__file__ = code.co_filename
+    exec(code, module.__dict__)
+    module.bind(_plan_actions(plan))
+    return module
+
+
+def write_module(plan: CompiledPlan, path: str) -> str:
+    """生成ソースを .py として書き出す（import 時のバイトコードは Python 標準の __pycache__ に載る）"""
+    source = generate_source(plan)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(source)
+    return source
+
+
+# ===== CLI =====
+
+def main(argv: List[str]) -> int:
+    p = argparse.ArgumentParser(prog="codegen.py", description="IKDD v0.3 IEP -> Python runner module")
+    p.add_argument("iep", help="input .iep.yaml|json")
+    p.add_argument("--steps", required=True,
+                   help="step module (path to .py or import name), step registry (.yaml/.json) or entry_points[:group]")
+    p.add_argument("-o", "--out", default=None, help="write the generated module to this .py file")
+    p.add_argument("--run", action="store_true", help="run the generated module once and print the executed steps")
+    p.add_argument("--params", default=None, help="runtime params for --run (JSON object)")
+    p.add_argument("--cache-dir", default=".ikdd_codegen", help="bytecode cache directory for --run (default: .ikdd_codegen)")
+    args = p.parse_args(argv[1:])
+    try:
+        iep = load_yaml_or_json(args.iep)
+        resolver = load_step_resolver(args.steps)
+        plan = compile_plan(iep, resolver, iep_hash=iep_content_hash(iep))
+        if args.out:
+            write_module(plan, args.out)
+            print(f"[ok] generated {args.out}")
+        if args.run:
+            params = json.loads(args.params) if args.params else None
+            module = load_compiled(plan, CodegenCache(args.cache_dir))
+            context = module.run(params)
+            print(f"[ok] executed: {context['_executed_steps']}")
+        elif not args.out:
+            sys.stdout.write(generate_source(plan))
+    except (RuntimeErrorIKDD, FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"[codegen-error] {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv))
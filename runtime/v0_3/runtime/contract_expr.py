@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+contract_expr.py — IKDD v0.3 contract / guard 式の構文解析とコンパイル
+目的:
+  - contract_checks / guard の文字列を 1 度だけ構文解析し、小さな AST を経て
+    クロージャ（述語）にコンパイルする（文字列処理は評価時に行わない）
+  - eval() は使わない（安全な部分言語のみ）
+言語:
+  expr    := or
+  or      := and ( ("or" | "||") and )*
+  and     := not ( ("and" | "&&") not )*
+  not     := ("not" | "!") not | cmp
+  cmp     := operand [ "exists" | "not" "exists" | "is" ["not"] "empty" | OP operand ]
+  OP      := "==" | "!=" | "<" | "<=" | ">" | ">="
+  operand := NUMBER | 'STRING' | "STRING" | true | false | null | REF | "len" "(" operand ")" | "(" expr ")"
+参照 (REF):
+  - context.<key>[.<sub>...] : RuntimeEngine.context の値（例: context.CSV_LOAD_result）
+  - ${name}                  : 実行時パラメータ / context からのテンプレート参照
+  - name                     : 実行時パラメータ（同名キー、なければ "." 区切りのパス）の値。
+                               見つからなければ評価時に UnresolvedName（文字列は 'STRING' と引用符で書く）。
+                               ただし exists の対象だけは名前そのものをファイルパスとして扱う
+                               （例: "export.json exists"）
+意味:
+  - X exists : context 参照は「値があること」、それ以外はファイルパスの存在
+  - 数値と数値文字列の比較は数値として行い、比較不能な型同士は偽とする
+  - 未解決の名前を含む式の扱いは呼び出し側が決める（RuntimeEngine: 通常は評価を省略、strict_contracts なら偽）
+  - キーワードは大文字小文字を区別しない（AND / and）
+ソース生成:
+  - Node.source() は同じ意味の Python 式（変数 p / c と SOURCE_HELPERS の関数を参照）を返す
+  - codegen.py が生成モジュールへ述語をインライン展開するのに使う
+"""
+
+import os
+import re
+import math
+import inspect
+import operator
+from functools import lru_cache
+from typing import Any, Callable, List, Mapping, Optional, Tuple
+
+Predicate = Callable[[Mapping[str, Any], Mapping[str, Any]], Any]   # (params, context) -> value
+
+_MISSING = object()
+
+
+class ContractSyntaxError(ValueError):
+    pass
+
+
+class UnresolvedName(LookupError):
+    """裸の名前がパラメータに無い（文字列リテラルとみなして推測はしない）"""
+    def __init__(self, name: str):
+        super().__init__(f"unresolved name '{name}' (quote string literals)")
+        self.name = name
+
+
+# ===== 参照解決 =====
+
+def _walk_path(root: Any, parts: List[str]) -> Any:
+    cur = root
+    for part in parts:
+        if isinstance(cur, Mapping) and part in cur:
+            cur = cur[part]
+        elif isinstance(cur, (list, tuple)) and part.isdigit() and int(part) < len(cur):
+            cur = cur[int(part)]
+        else:
+            return _MISSING
+    return cur
+
+
+def _param_value(name: str, params: Mapping[str, Any]) -> Any:
+    if name in params:
+        return params[name]
+    return _walk_path(params, name.split("."))
+
+
+def _present(v: Any) -> Any:
+    return None if v is _MISSING else v
+
+
+def _ref_value(name: str, p: Mapping[str, Any]) -> Any:
+    v = _param_value(name, p) if p else _MISSING
+    if v is _MISSING:
+        raise UnresolvedName(name)
+    return v
+
+
+def _path_value(name: str, p: Mapping[str, Any]) -> Any:
+    # exists の対象: パラメータに無ければ名前そのものをファイルパスとして扱う
+    v = _param_value(name, p) if p else _MISSING
+    return name if v is _MISSING else v
+
+
+_TMPL_RE = re.compile(r"\$\{([^}]+)\}")
+# 数値リテラル（float() が受け付ける inf / nan / 1_000 は名前として扱う）
+_NUMBER_RE = re.compile(r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+
+
+def _tmpl_resolve(name: str, p: Mapping[str, Any], c: Mapping[str, Any]) -> Any:
+    if name.startswith("context."):
+        return _walk_path(c, name.split(".")[1:])
+    return _param_value(name, p) if p else _MISSING
+
+
+def _tmpl_render(text: str, p: Mapping[str, Any], c: Mapping[str, Any]) -> str:
+    def sub(mm):
+        v = _tmpl_resolve(mm.group(1).strip(), p, c)
+        return mm.group(0) if v is _MISSING else str(v)
+    return _TMPL_RE.sub(sub, text)
+
+
+def _length(v: Any) -> int:
+    try:
+        return len(v)
+    except TypeError:
+        return 0
+
+
+def _path_exists(v: Any) -> bool:
+    if isinstance(v, (str, bytes, os.PathLike)):
+        return os.path.exists(v)
+    return v is not None
+
+
+def _num(v: Any) -> Any:
+    if isinstance(v, str):
+        try:
+            return float(v)
+        except ValueError:
+            return v
+    return v
+
+
+def _compare(op: Callable[[Any, Any], bool], a: Any, b: Any) -> bool:
+    if isinstance(a, (int, float)) or isinstance(b, (int, float)):
+        a, b = _num(a), _num(b)
+    try:
+        return op(a, b)
+    except TypeError:
+        return False
+
+
+# source() の式が参照する関数（生成モジュールへはこの順にソースごと書き出す）
+SOURCE_HELPERS = (UnresolvedName, _walk_path, _param_value, _present, _ref_value, _path_value, _tmpl_resolve,
+                  _tmpl_render, _length, _path_exists, _num, _compare)
+
+
+def helpers_source() -> str:
+    """SOURCE_HELPERS を単独で動かすための前置きソース"""
+    head = "import os\nimport re\nimport operator as _op\nfrom typing import Any, Callable, List, Mapping\n\n" \
+           "_MISSING = object()\n_TMPL_RE = re.compile(%r)\n\n" % _TMPL_RE.pattern
+    return head + "\n".join(inspect.getsource(f) for f in SOURCE_HELPERS)
+
+
+# ===== AST =====
+
+class Node:
+    def compile(self) -> Predicate:
+        raise NotImplementedError
+
+    def source(self) -> str:
+        raise NotImplementedError
+
+
+class Lit(Node):
+    def __init__(self, value: Any):
+        self.value = value
+
+    def compile(self) -> Predicate:
+        v = self.value
+        return lambda p, c: v
+
+    def source(self) -> str:
+        v = self.value
+        if isinstance(v, float) and not math.isfinite(v):
+            return f"float({str(v)!r})"   # repr(inf) / repr(nan) は式として評価できない
+        return repr(v)
+
+
+class Ctx(Node):
+    """context.<key>... 参照"""
+    def __init__(self, name: str):
+        self.name = name
+        self.parts = name.split(".")[1:]
+
+    def compile(self) -> Predicate:
+        parts = self.parts
+        key, rest = parts[0], parts[1:]
+        if not rest:
+            return lambda p, c: c.get(key)
+
+        def get(p, c):
+            v = _walk_path(c, parts)
+            return None if v is _MISSING else v
+        return get
+
+    def source(self) -> str:
+        if len(self.parts) == 1:
+            return f"c.get({self.parts[0]!r})"
+        return f"_present(_walk_path(c, {self.parts!r}))"
+
+
+class Ref(Node):
+    """パラメータ参照（無ければ評価時に UnresolvedName）"""
+    def __init__(self, name: str):
+        self.name = name
+
+    def compile(self) -> Predicate:
+        name = self.name
+        return lambda p, c: _ref_value(name, p)
+
+    def source(self) -> str:
+        return f"_ref_value({self.name!r}, p)"
+
+
+class Tmpl(Node):
+    """${...} 参照（完全一致は値、埋め込みは文字列展開）"""
+    def __init__(self, text: str):
+        self.text = text
+
+    def compile(self) -> Predicate:
+        text = self.text
+        m = _TMPL_RE.fullmatch(text)
+        if m:
+            name = m.group(1).strip()
+            return lambda p, c: _present(_tmpl_resolve(name, p, c))
+        return lambda p, c: _tmpl_render(text, p, c)
+
+    def source(self) -> str:
+        m = _TMPL_RE.fullmatch(self.text)
+        if m:
+            return f"_present(_tmpl_resolve({m.group(1).strip()!r}, p, c))"
+        return f"_tmpl_render({self.text!r}, p, c)"
+
+
+class Len(Node):
+    def __init__(self, arg: Node):
+        self.arg = arg
+
+    def compile(self) -> Predicate:
+        f = self.arg.compile()
+        return lambda p, c: _length(f(p, c))
+
+    def source(self) -> str:
+        return f"_length({self.arg.source()})"
+
+
+class Not(Node):
+    def __init__(self, arg: Node):
+        self.arg = arg
+
+    def compile(self) -> Predicate:
+        f = self.arg.compile()
+        return lambda p, c: not f(p, c)
+
+    def source(self) -> str:
+        return f"(not {self.arg.source()})"
+
+
+class And(Node):
+    def __init__(self, items: List[Node]):
+        self.items = items
+
+    def compile(self) -> Predicate:
+        fs = tuple(i.compile() for i in self.items)
+        return lambda p, c: all(f(p, c) for f in fs)
+
+    def source(self) -> str:
+        return "bool(" + " and ".join(i.source() for i in self.items) + ")"
+
+
+class Or(Node):
+    def __init__(self, items: List[Node]):
+        self.items = items
+
+    def compile(self) -> Predicate:
+        fs = tuple(i.compile() for i in self.items)
+        return lambda p, c: any(f(p, c) for f in fs)
+
+    def source(self) -> str:
+        return "bool(" + " or ".join(i.source() for i in self.items) + ")"
+
+
+_CMP_NAMES = {"==": "eq", "!=": "ne", "<": "lt", "<=": "le", ">": "gt", ">=": "ge"}
+_CMP = {op: getattr(operator, name) for op, name in _CMP_NAMES.items()}
+
+
+class Cmp(Node):
+    def __init__(self, op: str, left: Node, right: Node):
+        self.op, self.left, self.right = op, left, right
+
+    def compile(self) -> Predicate:
+        lf, rf, op = self.left.compile(), self.right.compile(), _CMP[self.op]
+        return lambda p, c: _compare(op, lf(p, c), rf(p, c))
+
+    def source(self) -> str:
+        return f"_compare(_op.{_CMP_NAMES[self.op]}, {self.left.source()}, {self.right.source()})"
+
+
+class Exists(Node):
+    def __init__(self, arg: Node, negate: bool = False):
+        self.arg, self.negate = arg, negate
+
+    def compile(self) -> Predicate:
+        f, neg = self.arg.compile(), self.negate
+        if isinstance(self.arg, Ctx):
+            return lambda p, c: (f(p, c) is not None) != neg
+        if isinstance(self.arg, Ref):
+            name = self.arg.name
+            return lambda p, c: _path_exists(_path_value(name, p)) != neg
+        return lambda p, c: _path_exists(f(p, c)) != neg
+
+    def source(self) -> str:
+        arg = f"_path_value({self.arg.name!r}, p)" if isinstance(self.arg, Ref) else self.arg.source()
+        if isinstance(self.arg, Ctx):
+            return f"({arg} is {'' if self.negate else 'not '}None)"
+        return f"({'not ' if self.negate else ''}_path_exists({arg}))"
+
+
+class Empty(Node):
+    def __init__(self, arg: Node, negate: bool = False):
+        self.arg, self.negate = arg, negate
+
+    def compile(self) -> Predicate:
+        f, neg = self.arg.compile(), self.negate
+        return lambda p, c: (not f(p, c)) != neg
+
+    def source(self) -> str:
+        return f"bool({self.arg.source()})" if self.negate else f"(not {self.arg.source()})"
+
+
+# ===== 字句解析 =====
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+      (?P<str>'[^']*'|"[^"]*")
+    | (?P<op>==|!=|<=|>=|<|>|&&|\|\||!|\(|\))
+    | (?P<word>[^\s()'"=!<>&|]+)
+    )""", re.VERBOSE)
+
+_KEYWORDS = {"and", "or", "not", "exists", "is", "empty", "true", "false", "null", "none", "len"}
+
+
+def tokenize(text: str) -> List[Tuple[str, str]]:
+    tokens: List[Tuple[str, str]] = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _TOKEN_RE.match(text, pos)
+        if not m or m.end() == pos:
+            raise ContractSyntaxError(f"unexpected character at {pos}: {text[pos:]!r}")
+        pos = m.end()
+        if m.group("str") is not None:
+            tokens.append(("str", m.group("str")[1:-1]))
+        elif m.group("op") is not None:
+            tokens.append(("op", m.group("op")))
+        else:
+            word = m.group("word")
+            if word.lower() in _KEYWORDS:
+                tokens.append(("kw", word.lower()))
+            else:
+                tokens.append(("word", word))
+    return tokens
+
+
+# ===== 構文解析 =====
+
+class _Parser:
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.i = 0
+
+    def peek(self, k: int = 0) -> Optional[Tuple[str, str]]:
+        j = self.i + k
+        return self.tokens[j] if j < len(self.tokens) else None
+
+    def accept(self, kind: str, *values: str) -> Optional[str]:
+        tok = self.peek()
+        if tok and tok[0] == kind and (not values or tok[1] in values):
+            self.i += 1
+            return tok[1]
+        return None
+
+    def expect(self, kind: str, value: str) -> None:
+        if self.accept(kind, value) is None:
+            raise ContractSyntaxError(f"expected '{value}' in: {self.text}")
+
+    def parse(self) -> Node:
+        if not self.tokens:
+            raise ContractSyntaxError("empty expression")
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise ContractSyntaxError(f"unexpected token '{self.peek()[1]}' in: {self.text}")
+        return node
+
+    def parse_or(self) -> Node:
+        items = [self.parse_and()]
+        while self.accept("kw", "or") or self.accept("op", "||"):
+            items.append(self.parse_and())
+        return items[0] if len(items) == 1 else Or(items)
+
+    def parse_and(self) -> Node:
+        items = [self.parse_not()]
+        while self.accept("kw", "and") or self.accept("op", "&&"):
+            items.append(self.parse_not())
+        return items[0] if len(items) == 1 else And(items)
+
+    def parse_not(self) -> Node:
+        if self.accept("kw", "not") or self.accept("op", "!"):
+            return Not(self.parse_not())
+        return self.parse_cmp()
+
+    def parse_cmp(self) -> Node:
+        left = self.parse_operand()
+        if self.accept("kw", "exists"):
+            return Exists(left)
+        tok, nxt = self.peek(), self.peek(1)
+        if tok == ("kw", "not") and nxt == ("kw", "exists"):
+            self.i += 2
+            return Exists(left, negate=True)
+        if self.accept("kw", "is"):
+            negate = self.accept("kw", "not") is not None
+            self.expect("kw", "empty")
+            return Empty(left, negate)
+        op = self.accept("op", *_CMP)
+        if op:
+            return Cmp(op, left, self.parse_operand())
+        return left
+
+    def parse_operand(self) -> Node:
+        tok = self.peek()
+        if tok is None:
+            raise ContractSyntaxError(f"unexpected end of expression: {self.text}")
+        kind, value = tok
+        if kind == "op" and value == "(":
+            self.i += 1
+            node = self.parse_or()
+            self.expect("op", ")")
+            return node
+        if kind == "str":
+            self.i += 1
+            return Lit(value)
+        if kind == "kw":
+            if value in ("true", "false"):
+                self.i += 1
+                return Lit(value == "true")
+            if value in ("null", "none"):
+                self.i += 1
+                return Lit(None)
+            if value == "len":
+                self.i += 1
+                self.expect("op", "(")
+                arg = self.parse_operand()
+                self.expect("op", ")")
+                return Len(arg)
+            raise ContractSyntaxError(f"unexpected keyword '{value}' in: {self.text}")
+        if kind == "word":
+            self.i += 1
+            if _NUMBER_RE.fullmatch(value):
+                return Lit(float(value) if "." in value or "e" in value.lower() else int(value))
+            if "${" in value:
+                return Tmpl(value)
+            if value.startswith("context.") and len(value) > len("context."):
+                return Ctx(value)
+            return Ref(value)
+        raise ContractSyntaxError(f"unexpected token '{value}' in: {self.text}")
+
+
+# ===== API =====
+
+def parse_condition(text: str) -> Node:
+    return _Parser(text).parse()
+
+
+def context_keys(node: Node) -> List[str]:
+    """式が参照する context のトップレベルキー（context.X / ${context.X}）を列挙する"""
+    keys: List[str] = []
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if isinstance(n, Ctx):
+            keys.append(n.parts[0])
+        elif isinstance(n, Tmpl):
+            keys.extend(m.strip().split(".")[1] for m in _TMPL_RE.findall(n.text)
+                        if m.strip().startswith("context.") and m.strip() != "context.")
+        for attr in ("arg", "left", "right"):
+            child = getattr(n, attr, None)
+            if isinstance(child, Node):
+                stack.append(child)
+        stack.extend(getattr(n, "items", ()))
+    return keys
+
+
+@lru_cache(maxsize=4096)
+def compile_condition(text: str) -> Predicate:
+    """条件式を述語 (params, context) -> value にコンパイルする（同一文字列はキャッシュ）"""
+    return parse_condition(text).compile()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+log_sink.py — IKDD v0.3 Runtime 用 構造化ログシンク
+目的:
+  - ログイベントを逐次ファイルへ書き出す（クラッシュ時も直前までのログが残る）
+      fmt="text"  : 従来どおりの "[YYYY-MM-DD HH:MM:SS] msg" 行（既定。tail / grep 向け）
+      fmt="jsonl" : 1 イベント 1 行の JSON（level やフィールドも含む）
+  - 有界リングバッファ＋バックグラウンド writer スレッドで、step 実行経路から I/O を外す
+  - ログレベル・定期 flush・stdout エコー（任意）・購読コールバック（任意）
+備考:
+  - バッファが満杯の場合、既定 (block=True) では writer が追いつくまで emit が待つ
+  - block=False ではリングバッファとして古いイベントから破棄し、件数を dropped として記録する
+  - 書き出しの失敗（ディスクフル・閉じた fd など）は errors / last_error に記録して writer を続ける。
+    writer スレッドが止まった後の flush / emit は待たずに戻る（未書き出しのイベントは dropped）
+"""
+
+import json
+import time
+import atexit
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+LEVELS = {"debug": 10, "info": 20, "warn": 30, "error": 40}
+FORMATS = ("text", "jsonl")
+
+Event = Dict[str, Any]
+
+
+def format_ts(ts: float) -> str:
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class LogSink:
+    """
+    有界リングバッファ付きのイベントシンク。
+      emit()      : イベントをバッファへ積むだけ（呼び出し側ではファイル I/O・print を行わない）
+      flush()     : バッファが書き出されるまで待つ
+      subscribe() : 書き出し時に呼ばれるコールバックを登録（writer スレッドから呼ばれる）
+    """
+    def __init__(self, path: Optional[str] = "runtime.log", level: str = "info", capacity: int = 10000,
+                 flush_interval: float = 1.0, echo: bool = False, block: bool = True, fmt: str = "text"):
+        if level not in LEVELS:
+            raise ValueError(f"unknown log level: {level}")
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown log format: {fmt}")
+        self.fmt = fmt
+        self.path = path
+        self.level = LEVELS[level]
+        self.flush_interval = flush_interval
+        self.echo = echo
+        self.block = block
+        self.dropped = 0
+        self.errors = 0                                  # 書き出しに失敗したバッチ数
+        self.last_error: Optional[BaseException] = None
+        self._buf: Deque[Event] = deque(maxlen=max(1, capacity))
+        self._high_water = max(1, capacity // 2)
+        self._cond = threading.Condition()
+        self._subscribers: List[Callable[[Event], None]] = []
+        self._busy = False
+        self._flush_req = False
+        self._closed = False
+        self._stopped = False
+        self._fh = open(path, "a", encoding="utf-8") if path else None
+        self._thread = threading.Thread(target=self._run, name="ikdd-log-writer", daemon=True)
+        self._thread.start()
+        _LIVE_SINKS.add(self)
+
+    # ----- producer 側 -----
+
+    def enabled(self, level: str) -> bool:
+        return LEVELS[level] >= self.level
+
+    def emit(self, level: str, msg: str, **fields: Any) -> None:
+        if LEVELS[level] < self.level or self._closed:
+            return
+        event: Event = {"ts": time.time(), "level": level, "msg": msg}
+        if fields:
+            event.update(fields)
+        with self._cond:
+            if len(self._buf) == self._buf.maxlen:
+                if self.block and self._writer_alive():
+                    self._cond.notify_all()
+                    self._cond.wait_for(
+                        lambda: len(self._buf) < self._buf.maxlen or self._closed or not self._writer_alive())
+                if len(self._buf) == self._buf.maxlen:
+                    self.dropped += 1
+            self._buf.append(event)
+            if len(self._buf) >= self._high_water:
+                self._cond.notify_all()
+
+    def subscribe(self, callback: Callable[[Event], None]) -> Callable[[], None]:
+        """イベント購読を登録し、解除用の関数を返す"""
+        with self._cond:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._cond:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._flush_req = True
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: (not self._buf and not self._busy) or not self._writer_alive(),
+                                timeout=timeout)
+
+    def close(self) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        _LIVE_SINKS.discard(self)
+
+    # ----- writer スレッド -----
+
+    def _writer_alive(self) -> bool:
+        return not self._stopped and self._thread.is_alive()
+
+    def _run(self) -> None:
+        try:
+            self._loop()
+        finally:
+            with self._cond:
+                self._stopped = True
+                self._busy = False
+                self._cond.notify_all()
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed or self._flush_req or len(self._buf) >= self._high_water,
+                    timeout=self.flush_interval)
+                batch = list(self._buf)
+                self._buf.clear()
+                dropped, self.dropped = self.dropped, 0
+                subscribers = list(self._subscribers)
+                self._flush_req = False
+                closing = self._closed
+                self._busy = bool(batch)
+            if dropped:
+                batch.insert(0, {"ts": time.time(), "level": "warn",
+                                 "msg": f"log buffer overflow: {dropped} events dropped"})
+            try:
+                if batch:
+                    self._write(batch, subscribers)
+            except Exception as e:   # 1 バッチの失敗で writer を止めない（flush / emit が待ち続けないように）
+                with self._cond:
+                    self.errors += 1
+                    self.last_error = e
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+            if closing:
+                return
+
+    def _write(self, batch: List[Event], subscribers: List[Callable[[Event], None]]) -> None:
+        lines = []
+        for ev in batch:
+            ev["ts"] = format_ts(ev["ts"])
+            text = f"[{ev['ts']}] {ev['msg']}"
+            lines.append(text if self.fmt == "text" else _dumps(ev))
+            if self.echo:
+                print(text)
+            for cb in subscribers:
+                try:
+                    cb(ev)
+                except Exception:
+                    pass   # 購読側の失敗でログ書き出しを止めない
+        if self._fh is not None:
+            self._fh.write("\n".join(lines) + "\n")
+            self._fh.flush()
+
+
+def _dumps(ev: Event) -> str:
+    try:
+        return json.dumps(ev, ensure_ascii=False, default=str)
+    except (TypeError, ValueError):
+        # str 以外のキーを持つ dict・循環参照などは値を文字列にして 1 行に収める
+        return json.dumps({k: v if isinstance(v, (str, int, float, bool, type(None))) else str(v)
+                           for k, v in ev.items()}, ensure_ascii=False)
+
+
+# プロセス終了時に未書き出しのイベントを落とさない
+_LIVE_SINKS: "set[LogSink]" = set()
+
+
+@atexit.register
+def _close_live_sinks() -> None:
+    for sink in list(_LIVE_SINKS):
+        sink.close()
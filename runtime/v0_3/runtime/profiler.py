@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+profiler.py — IKDD v0.3 Runtime 用 step プロファイラ（RuntimeEngine hook）
+目的:
+  - ref_step ごとに wall 時間・CPU 時間・メモリピーク増分・入出力サイズを記録する
+  - Chrome trace-event JSON（chrome://tracing / Perfetto）と
+    flamegraph 用 collapsed-stack 形式で書き出す
+計測:
+  - wall : perf_counter_ns（ns 精度）
+  - cpu  : process_time_ns の差分。並行実行中は他 step の CPU 時間も含む。
+           process executor の step は別プロセスで動くため記録しない (None)
+  - mem  : "tracemalloc" … tracemalloc のピーク（step 開始時に reset_peak）
+           "rss"         … /proc/self/status の VmHWM（clear_refs でリセット可能な場合）、
+                            不可なら VmRSS の差分
+           None          … 計測しない
+           ピークのリセットはプロセス全体に効くため、他の step と実行が重なった step
+           （independent グループ・execute_async）は記録しない (None)。
+           同じプロセスで複数のエンジンを並行して動かす場合（sweep の thread executor など）は
+           memory=None を指定すること
+  - size : bytes 系は長さ、既存ファイルパスはファイルサイズ、それ以外は概算バイト数
+           （入力は args の値ごとに測るため、ファイルパスを渡す引数はファイルサイズになる）
+Usage:
+  prof = StepProfiler(memory="tracemalloc")
+  engine = RuntimeEngine(resolver, hooks=[prof])
+  engine.execute(iep)
+  prof.export_chrome_trace("trace.json"); prof.export_collapsed("steps.folded")
+"""
+
+import os
+import sys
+import json
+import time
+import tracemalloc
+from collections.abc import Iterator, Mapping
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+MEMORY_MODES = (None, "tracemalloc", "rss")
+
+_SIZE_SAMPLE = 1000   # コンテナのサイズ概算で実際に見る要素数の上限
+
+
+@dataclass
+class StepRecord:
+    ref_step: str
+    state: str
+    phase: str
+    executor: str
+    start_ns: int                 # プロファイラ生成時点からの相対時刻
+    wall_ns: int
+    cpu_ns: Optional[int]
+    mem_peak_bytes: Optional[int]
+    in_bytes: int
+    out_bytes: Optional[int]
+    cached: bool
+    error: Optional[str]
+
+
+@dataclass
+class SpanRecord:
+    name: str
+    kind: str                     # "run" | "state"
+    start_ns: int
+    wall_ns: int
+
+
+# ===== サイズ概算 =====
+
+def approx_size(obj: Any, _depth: int = 0) -> int:
+    """オブジェクトのおおよそのバイト数（大きなコンテナは先頭要素から外挿）"""
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, memoryview):
+        return obj.nbytes
+    if isinstance(obj, os.PathLike):
+        obj = os.fspath(obj)
+    if isinstance(obj, str):
+        if _depth == 0 and obj and os.path.isfile(obj):
+            return os.path.getsize(obj)
+        return len(obj.encode("utf-8", "surrogatepass"))
+    nbytes = getattr(obj, "nbytes", None)   # numpy / pandas など
+    if isinstance(nbytes, int):
+        return nbytes
+    if isinstance(obj, Iterator):
+        return 0   # ストリームは消費しない
+    if _depth < 3 and isinstance(obj, (Mapping, list, tuple, set, frozenset)):
+        items = obj.items() if isinstance(obj, Mapping) else obj
+        total = sys.getsizeof(obj)
+        n = len(obj)
+        seen = 0
+        sub = 0
+        for item in items:
+            if seen >= _SIZE_SAMPLE:
+                break
+            sub += approx_size(item, _depth + 1)
+            seen += 1
+        if seen:
+            total += sub * n // seen
+        return total
+    return sys.getsizeof(obj)
+
+
+def args_size(args: Mapping[str, Any]) -> int:
+    """step 引数のおおよそのバイト数（値ごとに測り、ファイルパスの引数はファイルサイズで数える）"""
+    return sys.getsizeof(args) + sum(approx_size(v) for v in args.values())
+
+
+# ===== メモリ計測 =====
+
+def _read_status(field: str) -> Optional[int]:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _reset_hwm() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")   # VmHWM を現在の RSS にリセット
+        return True
+    except OSError:
+        return False
+
+
+# ===== プロファイラ =====
+
+class StepProfiler:
+    """
+    RuntimeEngine の hook として登録して使う。記録は records / spans に溜まる。
+    同じエンジンで複数回実行すると、記録は追記される（reset() で破棄）。
+    """
+    def __init__(self, memory: Optional[str] = "tracemalloc", sizes: bool = True):
+        if memory not in MEMORY_MODES:
+            raise ValueError(f"unknown memory mode: {memory}")
+        self.memory = memory
+        self.sizes = sizes
+        self.records: List[StepRecord] = []
+        self.spans: List[SpanRecord] = []
+        self._t0 = time.perf_counter_ns()
+        self._pending: Dict[int, Tuple[int, int, Optional[int], int]] = {}   # id(action) → 開始時の計測値
+        self._overlapped: Set[int] = set()                                     # 他の step と重なった id(action)
+        self._open: Dict[Tuple[str, str], int] = {}                            # (kind, name) → 開始時刻
+        self._run_name = "run"
+        self._started_tracemalloc = False
+        self._hwm_ok = False
+
+    def reset(self):
+        self.records.clear()
+        self.spans.clear()
+        self._pending.clear()
+        self._overlapped.clear()
+        self._open.clear()
+
+    def _now(self) -> int:
+        return time.perf_counter_ns() - self._t0
+
+    # ----- メモリ -----
+
+    def _mem_start(self) -> Optional[int]:
+        if self.memory == "tracemalloc":
+            tracemalloc.reset_peak()
+            return tracemalloc.get_traced_memory()[0]
+        if self.memory == "rss":
+            if self._hwm_ok and _reset_hwm():
+                return _read_status("VmHWM")
+            return _read_status("VmRSS")
+        return None
+
+    def _mem_peak(self, base: Optional[int]) -> Optional[int]:
+        if base is None:
+            return None
+        if self.memory == "tracemalloc":
+            return max(0, tracemalloc.get_traced_memory()[1] - base)
+        now = _read_status("VmHWM" if self._hwm_ok else "VmRSS")
+        return None if now is None else max(0, now - base)
+
+    # ----- hooks -----
+
+    def run_start(self, plan):
+        self._run_name = plan.iep_id or "run"
+        self._open[("run", self._run_name)] = self._now()
+        if self.memory == "tracemalloc" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        elif self.memory == "rss":
+            self._hwm_ok = _reset_hwm()
+
+    def run_end(self, plan, error):
+        for (kind, name), start in list(self._open.items()):
+            # 失敗時に閉じられなかった state も含めて閉じる
+            self.spans.append(SpanRecord(name, kind, start, self._now() - start))
+        self._open.clear()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def state_enter(self, state):
+        self._open[("state", state.sid)] = self._now()
+
+    def state_exit(self, state):
+        start = self._open.pop(("state", state.sid), None)
+        if start is not None:
+            self.spans.append(SpanRecord(state.sid, "state", start, self._now() - start))
+
+    def before_step(self, action, args):
+        in_bytes = args_size(args) if self.sizes else 0
+        if self._pending:
+            # 実行中の step がある: ピークをリセットすると互いの計測を壊すので、重なった step は測らない
+            self._overlapped.update(self._pending)
+            self._overlapped.add(id(action))
+            mem = None
+        else:
+            mem = self._mem_start()
+        self._pending[id(action)] = (self._now(), time.process_time_ns(), mem, in_bytes)
+
+    def after_step(self, action, args, result, error, cached):
+        end = self._now()
+        cpu_end = time.process_time_ns()
+        started = self._pending.pop(id(action), None)
+        if started is None:
+            return   # 開始前に取り消された step
+        start, cpu_start, mem, in_bytes = started
+        if id(action) in self._overlapped:
+            self._overlapped.discard(id(action))
+            mem = None
+        self.records.append(StepRecord(
+            ref_step=action.ref_step,
+            state=action.state,
+            phase=action.phase,
+            executor=action.executor,
+            start_ns=start,
+            wall_ns=end - start,
+            cpu_ns=None if action.executor == "process" else cpu_end - cpu_start,
+            mem_peak_bytes=self._mem_peak(mem),
+            in_bytes=in_bytes,
+            out_bytes=approx_size(result) if self.sizes and error is None else None,
+            cached=cached,
+            error=None if error is None else f"{type(error).__name__}: {error}",
+        ))
+
+    def shard(self, action, index, count, elapsed, error):
+        """foreach の shard（実行時間は worker 側で計測した値。開始時刻は完了時刻から逆算）"""
+        end = self._now()
+        wall = int((elapsed or 0.0) * 1e9)
+        self.records.append(StepRecord(
+            ref_step=f"{action.ref_step}[{index}]",
+            state=action.state,
+            phase=action.phase,
+            executor=action.executor,
+            start_ns=end - wall,
+            wall_ns=wall,
+            cpu_ns=None,
+            mem_peak_bytes=None,
+            in_bytes=0,
+            out_bytes=None,
+            cached=False,
+            error=None if error is None else f"{type(error).__name__}: {error}",
+        ))
+
+    # ----- 集計 -----
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """ref_step ごとの集計（呼び出し回数・合計 / 最大 wall・合計 CPU・最大メモリピーク）"""
+        out: Dict[str, Dict[str, Any]] = {}
+        for r in self.records:
+            s = out.setdefault(r.ref_step, {"calls": 0, "wall_ms": 0.0, "max_wall_ms": 0.0,
+                                            "cpu_ms": 0.0, "max_mem_peak_bytes": None, "cached": 0})
+            s["calls"] += 1
+            s["wall_ms"] += r.wall_ns / 1e6
+            s["max_wall_ms"] = max(s["max_wall_ms"], r.wall_ns / 1e6)
+            if r.cpu_ns is not None:
+                s["cpu_ms"] += r.cpu_ns / 1e6
+            if r.mem_peak_bytes is not None:
+                s["max_mem_peak_bytes"] = max(s["max_mem_peak_bytes"] or 0, r.mem_peak_bytes)
+            s["cached"] += int(r.cached)
+        return dict(sorted(out.items(), key=lambda kv: -kv[1]["wall_ms"]))
+
+    # ----- export -----
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """trace-event 形式（"X" 完了イベント、単位 µs）。重なる step は別レーン (tid) に並べる"""
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = []
+        for sp in sorted(self.spans, key=lambda s: (s.start_ns, s.kind != "run")):
+            events.append({"name": sp.name, "cat": sp.kind, "ph": "X", "pid": pid, "tid": 0,
+                           "ts": sp.start_ns / 1000, "dur": sp.wall_ns / 1000})
+        lanes: List[int] = []   # レーンごとの最終終了時刻
+        for r in sorted(self.records, key=lambda r: r.start_ns):
+            for tid, busy_until in enumerate(lanes):
+                if busy_until <= r.start_ns:
+                    lanes[tid] = r.start_ns + r.wall_ns
+                    break
+            else:
+                tid = len(lanes)
+                lanes.append(r.start_ns + r.wall_ns)
+            rec = asdict(r)
+            events.append({"name": r.ref_step, "cat": f"step,{r.phase}", "ph": "X", "pid": pid,
+                           "tid": tid + 1, "ts": r.start_ns / 1000, "dur": r.wall_ns / 1000,
+                           "args": {k: v for k, v in rec.items() if k not in ("ref_step", "start_ns", "wall_ns")}})
+        meta = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "states"}}]
+        meta += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": i + 1, "args": {"name": f"steps-{i}"}}
+                 for i in range(len(lanes))]
+        return {"traceEvents": meta + events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False, default=str)
+
+    def collapsed(self) -> List[str]:
+        """run;state;step <µs> 形式の行（state 自身の時間は run;state として出す）"""
+        totals: Dict[str, int] = {}
+        step_ns: Dict[str, int] = {}
+        for r in self.records:
+            stack = f"{self._run_name};{r.state};{r.ref_step}"
+            totals[stack] = totals.get(stack, 0) + r.wall_ns
+            step_ns[r.state] = step_ns.get(r.state, 0) + r.wall_ns
+        for sp in self.spans:
+            if sp.kind == "state":
+                own = sp.wall_ns - step_ns.get(sp.name, 0)
+                if own > 0:
+                    stack = f"{self._run_name};{sp.name}"
+                    totals[stack] = totals.get(stack, 0) + own
+        return [f"{stack} {ns // 1000}" for stack, ns in totals.items() if ns >= 1000]
+
+    def export_collapsed(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for line in self.collapsed():
+                f.write(line + "\n")
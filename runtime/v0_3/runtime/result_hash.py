@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+result_hash.py — IKDD v0.3 Runtime 用 結果ハッシュ層
+目的:
+  - step 結果を str() で丸ごと文字列化せず、逐次 (incremental) にハッシュする
+  - bytes / memoryview はコピーせずに hasher へ渡す
+  - dict / list などは正規化シリアライザで直接 hasher へ流す（キー順に依存しない）
+  - pathlib.Path などのファイルパス結果はファイル内容をチャンク単位でストリーム
+    （str は結果そのもの（トップレベル）が既存ファイルを指す場合のみファイルとして扱い、
+      dict / list の中の str は常に文字列としてハッシュする）
+  - JSON 往復で型が変わらない要素（str キーの dict・list・スカラー）だけを C エンコーダへまとめて渡し、
+    tuple / 非 str キー / サブクラスを含む要素は型タグ付きで 1 つずつ流す
+  - 型ごとの feeder は functools.singledispatch で差し替え・追加可能
+使い方:
+  from result_hash import hash_result, feed
+
+  @feed.register(MyFrame)
+  def _(obj, update):
+      update(b"MyFrame")
+      feed(obj.to_records(), update)
+"""
+
+import os
+import json
+import hashlib
+from collections.abc import Iterable, Iterator, Mapping
+from functools import singledispatch
+from typing import Any, Callable, Optional
+
+Update = Callable[[Any], None]   # hashlib の update（bytes-like を受け取る）
+
+HASH_LEN = 12            # ログに残す短縮ハッシュ長
+CHUNK_SIZE = 1 << 16     # 文字列エンコード・ファイル読込の単位
+BATCH_SIZE = 1024        # list / dict を C 実装の JSON エンコーダへまとめて渡す要素数
+
+# JSON 表現可能な要素はバッチ単位で C エンコーダに任せる（要素ごとの dispatch を避ける）
+_JSON = json.JSONEncoder(sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+# ===== 型別 feeder =====
+
+@singledispatch
+def feed(obj: Any, update: Update) -> None:
+    """未登録型のフォールバック: repr をチャンク単位で流す"""
+    update(b"R")
+    _feed_text(repr(obj), update)
+
+
+def _feed_text(text: str, update: Update) -> None:
+    update(b"%d:" % len(text))
+    for i in range(0, len(text), CHUNK_SIZE):
+        update(text[i:i + CHUNK_SIZE].encode("utf-8", "surrogatepass"))
+
+
+_JSON_SCALARS = (str, int, float, bool, type(None))
+
+
+def _json_exact(obj: Any) -> bool:
+    """JSON にしても型が失われない値か（tuple → list、1 → "1" キーのような潰れが起きない）"""
+    t = type(obj)
+    if t in _JSON_SCALARS:
+        return True
+    if t is list:
+        return all(map(_json_exact, obj))
+    if t is dict:
+        return all(type(k) is str and _json_exact(v) for k, v in obj.items())
+    return False
+
+
+def _feed_json_batch(batch: Any, values: Any, update: Update) -> bool:
+    if not all(map(_json_exact, values)):
+        return False
+    try:
+        text = _JSON.encode(batch)
+    except (TypeError, ValueError):
+        return False
+    update(b"J")
+    update(text.encode("utf-8", "surrogatepass"))
+    return True
+
+
+def _sorted_items(items):
+    items = list(items)
+    try:
+        return sorted(items, key=lambda kv: kv[0])
+    except TypeError:
+        # 比較不能なキーが混在する場合は型名＋repr で順序付け
+        return sorted(items, key=lambda kv: (type(kv[0]).__name__, repr(kv[0])))
+
+
+@feed.register(type(None))
+def _(obj, update: Update) -> None:
+    update(b"N")
+
+
+@feed.register(bool)
+def _(obj, update: Update) -> None:
+    update(b"T" if obj else b"F")
+
+
+@feed.register(int)
+def _(obj, update: Update) -> None:
+    update(b"I%d;" % obj)
+
+
+@feed.register(float)
+def _(obj, update: Update) -> None:
+    update(b"D")
+    update(repr(obj).encode("ascii"))
+    update(b";")
+
+
+@feed.register(str)
+def _(obj, update: Update) -> None:
+    update(b"S")
+    _feed_text(obj, update)
+
+
+@feed.register(bytes)
+@feed.register(bytearray)
+def _(obj, update: Update) -> None:
+    update(b"B%d:" % len(obj))
+    update(obj)   # バッファをそのまま渡す（コピーなし）
+
+
+@feed.register(memoryview)
+def _(obj, update: Update) -> None:
+    update(b"B%d:" % obj.nbytes)
+    if obj.contiguous:
+        update(obj.cast("B"))
+    else:
+        update(obj.tobytes())
+
+
+@feed.register(os.PathLike)
+def _(obj, update: Update) -> None:
+    path = os.fspath(obj)
+    if isinstance(path, bytes):
+        path = os.fsdecode(path)
+    if not os.path.isfile(path):
+        update(b"P")
+        _feed_text(path, update)
+        return
+    _feed_file(path, update)
+
+
+def _feed_file(path: str, update: Update) -> None:
+    update(b"@")   # False の "F" と区別する
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            update(view[:n])
+
+
+@feed.register(Mapping)
+def _(obj, update: Update) -> None:
+    update(b"{")
+    items = _sorted_items(obj.items())
+    for i in range(0, len(items), BATCH_SIZE):
+        batch = items[i:i + BATCH_SIZE]
+        if all(type(k) is str for k, _v in batch) and \
+                _feed_json_batch(dict(batch), [v for _k, v in batch], update):
+            continue
+        for k, v in batch:
+            feed(k, update)
+            feed(v, update)
+    update(b"}")
+
+
+def _feed_sequence(obj, update: Update, open_tag: bytes, close_tag: bytes) -> None:
+    update(open_tag)
+    for i in range(0, len(obj), BATCH_SIZE):
+        batch = obj[i:i + BATCH_SIZE]
+        if not _feed_json_batch(batch, batch, update):
+            for item in batch:
+                feed(item, update)
+    update(close_tag)
+
+
+@feed.register(list)
+def _(obj, update: Update) -> None:
+    _feed_sequence(obj, update, b"[", b"]")
+
+
+@feed.register(tuple)
+def _(obj, update: Update) -> None:
+    _feed_sequence(obj, update, b"(", b")")
+
+
+@feed.register(set)
+@feed.register(frozenset)
+def _(obj, update: Update) -> None:
+    update(b"{")
+    for k, _v in _sorted_items((item, None) for item in obj):
+        feed(k, update)
+    update(b"}")
+
+
+@feed.register(Iterable)
+def _(obj, update: Update) -> None:
+    # ジェネレータ等の汎用 iterable は要素単位で流す（one-shot イテレータは消費される）
+    update(b"<")
+    for item in obj:
+        feed(item, update)
+    update(b">")
+
+
+# ===== API =====
+
+def hash_result(obj: Any) -> str:
+    """step 結果の短縮ハッシュ（sha256 先頭 HASH_LEN 桁）"""
+    h = hashlib.sha256()
+    if type(obj) is str and obj and os.path.isfile(obj):
+        # パス文字列を返す step（例: JSON_EXPORT）は内容の変化をハッシュに反映する
+        _feed_file(obj, h.update)
+    else:
+        feed(obj, h.update)
+    return h.hexdigest()[:HASH_LEN]
+
+
+class HashingIterator(Iterator):
+    """
+    one-shot イテレータ（ジェネレータ等）の結果を包み、消費されるたびに要素を hasher へ流す。
+    結果を保持したまま全体を実体化せずにハッシュを得るためのラッパ。
+    消費し終えた時点で digest が確定し、on_done(digest) が呼ばれる。
+    """
+    def __init__(self, it: Iterable, on_done: Optional[Callable[[str], None]] = None):
+        self._it = iter(it)
+        self._h = hashlib.sha256()
+        self._h.update(b"<")
+        self._on_done = on_done
+        self.digest: Optional[str] = None
+
+    def __next__(self) -> Any:
+        try:
+            item = next(self._it)
+        except StopIteration:
+            if self.digest is None:
+                self._h.update(b">")
+                self.digest = self._h.hexdigest()[:HASH_LEN]
+                if self._on_done is not None:
+                    self._on_done(self.digest)
+            raise
+        feed(item, self._h.update)
+        return item
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+run_ledger.py — IKDD v0.3 Runtime 用 実行台帳（SQLite）
+目的:
+  - run / state / step / contract の実行履歴を SQLite に記録し、索引付きで問い合わせられるようにする
+  - RuntimeEngine の hook として動き、書き込みはバッファしてまとめて 1 トランザクションで行う
+  - 「直近 N run で遅い step」「step X が遅くなった run」を答える小さな CLI
+テーブル:
+  runs(run_id, iep_id, iep_hash, mode, started_at, ended_at, duration_ms, status, error)
+  states(run_id, seq, state, started_at, duration_ms)
+  steps(run_id, seq, state, phase, ref_step, executor, shard, started_at, duration_ms,
+        status, error, result_hash)                    # status: ok / error / cached
+  contracts(run_id, phase, text, outcome)              # outcome: pass / fail / skipped
+Usage:
+  ledger = RunLedger("runs.db")
+  engine = RuntimeEngine(resolver, hooks=[ledger])
+  python3 run_ledger.py runs.db slowest [--runs 50] [--limit 10] [--iep ID]
+  python3 run_ledger.py runs.db regressions --step FILTER_ROWS [--runs 50] [--window 10] [--factor 1.5]
+  python3 run_ledger.py runs.db runs [--limit 20]
+備考:
+  - run 行は run_start で即時に挿入して run_id を採番する（複数プロセスから同じ DB に書ける。WAL モード）
+  - それ以外の行は batch_size 件または flush_interval 秒ごと、および run_end / close() で書き出す
+"""
+
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from statistics import median
+from typing import Any, Dict, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    iep_id      TEXT,
+    iep_hash    TEXT,
+    mode        TEXT,
+    started_at  REAL NOT NULL,
+    ended_at    REAL,
+    duration_ms REAL,
+    status      TEXT NOT NULL DEFAULT 'running',
+    error       TEXT
+);
+CREATE TABLE IF NOT EXISTS states (
+    run_id      INTEGER NOT NULL REFERENCES runs(run_id),
+    seq         INTEGER NOT NULL,
+    state       TEXT NOT NULL,
+    started_at  REAL NOT NULL,
+    duration_ms REAL
+);
+CREATE TABLE IF NOT EXISTS steps (
+    run_id      INTEGER NOT NULL REFERENCES runs(run_id),
+    seq         INTEGER NOT NULL,
+    state       TEXT,
+    phase       TEXT,
+    ref_step    TEXT NOT NULL,
+    executor    TEXT,
+    shard       INTEGER,
+    started_at  REAL,
+    duration_ms REAL,
+    status      TEXT NOT NULL,
+    error       TEXT,
+    result_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS contracts (
+    run_id      INTEGER NOT NULL REFERENCES runs(run_id),
+    phase       TEXT NOT NULL,
+    text        TEXT NOT NULL,
+    outcome     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_iep ON runs(iep_id, run_id);
+CREATE INDEX IF NOT EXISTS states_by_run ON states(run_id);
+CREATE INDEX IF NOT EXISTS steps_by_run ON steps(run_id);
+CREATE INDEX IF NOT EXISTS steps_by_name ON steps(ref_step, run_id);
+CREATE INDEX IF NOT EXISTS contracts_by_run ON contracts(run_id);
+"""
+
+_INSERT = {
+    "states": "INSERT INTO states VALUES (?, ?, ?, ?, ?)",
+    "steps": "INSERT INTO steps VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+    "contracts": "INSERT INTO contracts VALUES (?, ?, ?, ?)",
+}
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# ===== 記録（hook） =====
+
+class RunLedger:
+    """
+    RuntimeEngine の hook として登録して使う。
+      batch_size    : この件数が溜まったら書き出す
+      flush_interval: 前回の書き出しからこの秒数が経っていたら書き出す
+    """
+    def __init__(self, path: str = "runs.db", batch_size: int = 500, flush_interval: float = 2.0):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._conn = connect(path)
+        self._lock = threading.RLock()
+        self._buf: Dict[str, List[Tuple[Any, ...]]] = {name: [] for name in _INSERT}
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._runs: Dict[int, Tuple[int, float]] = {}        # id(plan) → (run_id, 開始 perf_counter)
+        self._run_id: Optional[int] = None
+        self._seq = 0
+        self._states: Dict[str, Tuple[int, float, float]] = {}   # state id → (seq, 開始時刻, 開始 perf_counter)
+        self._started: Dict[int, Tuple[float, float]] = {}       # id(action) → (開始時刻, 開始 perf_counter)
+        self._awaiting: Dict[int, List[Any]] = {}                # id(action) → result ハッシュ待ちの step 行
+
+    @property
+    def run_id(self) -> Optional[int]:
+        """実行中（または直前）の run_id"""
+        return self._run_id
+
+    # ----- バッファ -----
+
+    def _add(self, table: str, row: Tuple[Any, ...]):
+        with self._lock:
+            self._buf[table].append(row)
+            self._pending += 1
+            if self._pending >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._pending:
+                return
+            with self._conn:
+                for table, rows in self._buf.items():
+                    if rows:
+                        self._conn.executemany(_INSERT[table], rows)
+                        rows.clear()
+            self._pending = 0
+
+    def close(self):
+        with self._lock:
+            for row in self._awaiting.values():
+                self._add("steps", tuple(row))
+            self._awaiting.clear()
+            self.flush()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ----- hooks -----
+
+    def run_start(self, plan):
+        with self._lock:
+            with self._conn:
+                cur = self._conn.execute(
+                    "INSERT INTO runs (iep_id, iep_hash, mode, started_at) VALUES (?, ?, ?, ?)",
+                    (plan.iep_id, plan.iep_hash, plan.mode, time.time()))
+            self._run_id = cur.lastrowid
+            self._runs[id(plan)] = (self._run_id, time.perf_counter())
+            self._seq = 0
+            self._states.clear()
+
+    def run_end(self, plan, error):
+        with self._lock:
+            run_id, t0 = self._runs.pop(id(plan), (self._run_id, None))
+            for row in self._awaiting.values():   # 結果を記録する前に失敗した step
+                self._add("steps", tuple(row))
+            self._awaiting.clear()
+            now = time.perf_counter()
+            for sid, (seq, at, st0) in self._states.items():   # 失敗で閉じられなかった state
+                self._add("states", (run_id, seq, sid, at, (now - st0) * 1000))
+            self._states.clear()
+            self.flush()
+            duration = None if t0 is None else (time.perf_counter() - t0) * 1000
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE runs SET ended_at = ?, duration_ms = ?, status = ?, error = ? WHERE run_id = ?",
+                    (time.time(), duration, "ok" if error is None else "error",
+                     None if error is None else f"{type(error).__name__}: {error}", run_id))
+
+    def state_enter(self, state):
+        with self._lock:
+            self._seq += 1
+            self._states[state.sid] = (self._seq, time.time(), time.perf_counter())
+
+    def state_exit(self, state):
+        started = self._states.pop(state.sid, None)
+        if started is not None:
+            seq, at, t0 = started
+            self._add("states", (self._run_id, seq, state.sid, at, (time.perf_counter() - t0) * 1000))
+
+    def before_step(self, action, args):
+        self._started[id(action)] = (time.time(), time.perf_counter())
+
+    def after_step(self, action, args, result, error, cached):
+        at, t0 = self._started.pop(id(action), (time.time(), None))
+        with self._lock:
+            self._seq += 1
+            row = [self._run_id, self._seq, action.state, action.phase, action.ref_step, action.executor, None,
+                   at, None if t0 is None else (time.perf_counter() - t0) * 1000,
+                   "error" if error is not None else "cached" if cached else "ok",
+                   None if error is None else f"{type(error).__name__}: {error}", None]
+            if error is None:
+                self._awaiting[id(action)] = row   # result イベントでハッシュを埋めてから書く
+            else:
+                self._add("steps", tuple(row))
+
+    def result(self, action, key, hash):
+        with self._lock:
+            row = self._awaiting.pop(id(action), None)
+            if row is not None:
+                row[-1] = hash
+                self._add("steps", tuple(row))
+
+    def shard(self, action, index, count, elapsed, error):
+        with self._lock:
+            self._seq += 1
+            self._add("steps", (self._run_id, self._seq, action.state, action.phase, action.ref_step,
+                                action.executor, index, None, None if elapsed is None else elapsed * 1000,
+                                "error" if error is not None else "ok",
+                                None if error is None else f"{type(error).__name__}: {error}", None))
+
+    def contract(self, phase, text, ok):
+        self._add("contracts", (self._run_id, phase, text,
+                                "skipped" if ok is None else "pass" if ok else "fail"))
+
+
+# ===== 問い合わせ =====
+
+def _run_filter(iep: Optional[str]) -> Tuple[str, Tuple[Any, ...]]:
+    return ("WHERE iep_id = ?", (iep,)) if iep else ("", ())
+
+
+def recent_runs(conn: sqlite3.Connection, limit: int = 20, iep: Optional[str] = None) -> List[Dict[str, Any]]:
+    where, params = _run_filter(iep)
+    cur = conn.execute(f"SELECT run_id, iep_id, mode, started_at, duration_ms, status, error FROM runs {where} "
+                       f"ORDER BY run_id DESC LIMIT ?", params + (limit,))
+    cols = [c[0] for c in cur.description]
+    return [dict(zip(cols, row)) for row in cur]
+
+
+def slowest_steps(conn: sqlite3.Connection, runs: int = 50, limit: int = 10,
+                  iep: Optional[str] = None) -> List[Dict[str, Any]]:
+    """直近 runs 件の run で、step ごとの平均 / 最大 / 合計時間（shard 行・キャッシュ命中は除く）"""
+    where, params = _run_filter(iep)
+    cur = conn.execute(f"""
+        SELECT ref_step, COUNT(*) AS calls, AVG(duration_ms) AS avg_ms, MAX(duration_ms) AS max_ms,
+               SUM(duration_ms) AS total_ms, SUM(status = 'error') AS errors
+        FROM steps
+        WHERE run_id IN (SELECT run_id FROM runs {where} ORDER BY run_id DESC LIMIT ?)
+          AND shard IS NULL AND status != 'cached'
+        GROUP BY ref_step ORDER BY avg_ms DESC LIMIT ?""", params + (runs, limit))
+    cols = [c[0] for c in cur.description]
+    return [dict(zip(cols, row)) for row in cur]
+
+
+def step_regressions(conn: sqlite3.Connection, step: str, runs: int = 50, window: int = 10,
+                     factor: float = 1.5, min_ms: float = 1.0,
+                     iep: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    step の run ごとの所要時間（同一 run 内は合計）を古い順に並べ、
+    直前 window 件の中央値より factor 倍以上かつ min_ms 以上遅い run を返す
+    """
+    where, params = _run_filter(iep)
+    cur = conn.execute(f"""
+        SELECT s.run_id, r.started_at, SUM(s.duration_ms)
+        FROM steps s JOIN runs r ON r.run_id = s.run_id
+        WHERE s.ref_step = ? AND s.shard IS NULL AND s.status = 'ok'
+          AND s.run_id IN (SELECT run_id FROM runs {where} ORDER BY run_id DESC LIMIT ?)
+        GROUP BY s.run_id ORDER BY s.run_id""", (step,) + params + (runs,))
+    series = list(cur)
+    out = []
+    for i, (run_id, started_at, ms) in enumerate(series):
+        previous = [row[2] for row in series[max(0, i - window):i]]
+        if not previous or ms is None:
+            continue
+        baseline = median(previous)
+        if ms >= baseline * factor and ms - baseline >= min_ms:
+            out.append({"run_id": run_id, "started_at": started_at, "duration_ms": ms,
+                        "baseline_ms": baseline, "ratio": ms / baseline if baseline else None})
+    return out
+
+
+# ===== CLI =====
+
+def _print_table(rows: List[Dict[str, Any]]):
+    if not rows:
+        print("(no rows)")
+        return
+    cols = list(rows[0])
+    cells = [[_cell(r[c]) for c in cols] for r in rows]
+    widths = [max(len(c), *(len(row[i]) for row in cells)) for i, c in enumerate(cols)]
+    print("  ".join(c.ljust(w) for c, w in zip(cols, widths)))
+    for row in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Query the IKDD v0.3 SQLite run ledger")
+    ap.add_argument("db", help="ledger database (RunLedger path)")
+    ap.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("runs", help="most recent runs")
+    p.add_argument("--limit", type=int, default=20)
+    p.add_argument("--iep", default=None, help="only runs of this IEP id")
+    p = sub.add_parser("slowest", help="slowest steps over the last N runs")
+    p.add_argument("--runs", type=int, default=50)
+    p.add_argument("--limit", type=int, default=10)
+    p.add_argument("--iep", default=None, help="only runs of this IEP id")
+    p = sub.add_parser("regressions", help="runs where a step got slower than its recent median")
+    p.add_argument("--step", required=True, help="ref_step name")
+    p.add_argument("--runs", type=int, default=50)
+    p.add_argument("--window", type=int, default=10, help="number of previous runs forming the baseline")
+    p.add_argument("--factor", type=float, default=1.5, help="slowdown ratio that counts as a regression")
+    p.add_argument("--min-ms", type=float, default=1.0, help="ignore slowdowns smaller than this")
+    p.add_argument("--iep", default=None, help="only runs of this IEP id")
+    args = ap.parse_args(argv)
+
+    conn = connect(args.db)
+    try:
+        if args.cmd == "runs":
+            rows = recent_runs(conn, args.limit, args.iep)
+        elif args.cmd == "slowest":
+            rows = slowest_steps(conn, args.runs, args.limit, args.iep)
+        else:
+            rows = step_regressions(conn, args.step, args.runs, args.window, args.factor, args.min_ms, args.iep)
+    finally:
+        conn.close()
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        _print_table(rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
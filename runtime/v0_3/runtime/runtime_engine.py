@@ -10,27 +10,40 @@ runtime_engine.py — IKDD v0.3.2-min 最小実行系 (MVP)
   - dryrun_validator.py で事前検証済みであること
 """
 
+import os
+import re
 import sys
 import json
+import time
+import pickle
+import asyncio
+import inspect
+import glob
 import hashlib
+import threading
+import weakref
+import multiprocessing
+from collections.abc import Iterator as IteratorABC
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any, Dict, Callable, List
+from typing import Any, Dict, Callable, Iterator, List, Mapping, Optional, FrozenSet, Tuple, Union
 
-try:
-    import yaml  # type: ignore
-    HAVE_YAML = True
-except Exception:
-    HAVE_YAML = False
+from result_hash import hash_result, HashingIterator
+from log_sink import LogSink
+from state_store import Checkpoint, StateStore
+from step_cache import StepCache
+from contract_expr import (ContractSyntaxError, Predicate, UnresolvedName, compile_condition, context_keys,
+                           parse_condition)
+from step_registry import ENTRY_POINT_GROUP, LazyStepResolver, StepImportError, import_step_module
+from runtime import yamlio   # 共通ローダ（libyaml・パースキャッシュ）
 
 
 # ===== ユーティリティ =====
 
 def load_yaml_or_json(path: str) -> Dict[str, Any]:
-    with open(path, "r", encoding="utf-8") as f:
-        text = f.read()
-    if path.endswith((".yaml", ".yml")) and HAVE_YAML:
-        return yaml.safe_load(text)
-    return json.loads(text)
+    return yamlio.load_file(path)
 
 
 def sha256_str(s: str) -> str:
@@ -41,121 +54,1308 @@ def now_str() -> str:
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 
+def iep_content_hash(iep: Dict[str, Any]) -> str:
+    """IEP 内容のハッシュ（キー順に依存しない正規化 JSON に対して計算）"""
+    canon = json.dumps(iep, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canon.encode("utf-8")).hexdigest()
+
+
 class RuntimeErrorIKDD(Exception):
     pass
 
 
+class StepTimeoutError(RuntimeErrorIKDD):
+    """step が timeout 予算（runtime.timeouts.step / per_step）を超過した"""
+    def __init__(self, msg: str, ref_step: Optional[str] = None, state: Optional[str] = None,
+                 timeout: Optional[float] = None):
+        super().__init__(msg)
+        self.ref_step = ref_step
+        self.state = state
+        self.timeout = timeout
+
+
+class RunTimeoutError(StepTimeoutError):
+    """実行全体の timeout 予算（runtime.timeouts.run）を超過した"""
+
+
+def load_step_resolver(spec: str) -> Mapping[str, Callable[..., Any]]:
+    """
+    step 実装の指定から resolver を作る。
+      - *.yaml / *.yml / *.json          : step レジストリ（遅延 import、step_registry.LazyStepResolver）
+      - "entry_points" / "entry_points:<group>" : entry_points（既定 group: ikdd.steps）から遅延 import
+      - それ以外（*.py パスまたは import 名）: モジュール内の大文字の識別子に束縛された callable
+        （例: CSV_LOAD = load_csv）を ref_step とみなす
+    """
+    try:
+        if spec.endswith((".yaml", ".yml", ".json")):
+            return LazyStepResolver.from_file(spec)
+        if spec == "entry_points" or spec.startswith("entry_points:"):
+            group = spec.partition(":")[2] or ENTRY_POINT_GROUP
+            return LazyStepResolver.from_entry_points(group)
+        module = import_step_module(spec)
+    except StepImportError as e:
+        raise RuntimeErrorIKDD(str(e))
+    return {k: v for k, v in vars(module).items() if k.isupper() and callable(v)}
+
+
+# ===== テンプレート引数 =====
+# args 中の "${inputs.csv_file}" などを実行時パラメータ / context から解決する。
+#   - 値全体が ${...} の場合は参照先の値をそのまま渡す
+#   - 文字列に埋め込まれている場合は str() で展開する
+#   - 解決できない参照は従来どおりリテラルのまま残す
+
+_TEMPLATE_RE = re.compile(r"\$\{([^}]+)\}")
+
+
+def template_refs(value: Any) -> Tuple[str, ...]:
+    """値（dict / list を含む）に現れる ${...} 参照名を列挙する"""
+    refs: List[str] = []
+
+    def walk(v):
+        if isinstance(v, str):
+            refs.extend(m.strip() for m in _TEMPLATE_RE.findall(v))
+        elif isinstance(v, dict):
+            for x in v.values():
+                walk(x)
+        elif isinstance(v, (list, tuple)):
+            for x in v:
+                walk(x)
+    walk(value)
+    return tuple(refs)
+
+
+def lookup_ref(name: str, params: Mapping[str, Any], context: Mapping[str, Any]) -> Any:
+    """参照名を解決する。"context." で始まる名前は context、それ以外は params（平坦キー優先）"""
+    if name.startswith("context."):
+        root, rest = context, name[len("context."):]
+    else:
+        if name in params:
+            return params[name]
+        root, rest = params, name
+    cur: Any = root
+    for part in rest.split("."):
+        if isinstance(cur, Mapping) and part in cur:
+            cur = cur[part]
+        elif isinstance(cur, (list, tuple)) and part.isdigit() and int(part) < len(cur):
+            cur = cur[int(part)]
+        else:
+            raise KeyError(name)
+    return cur
+
+
+def render_template(value: Any, params: Mapping[str, Any], context: Mapping[str, Any]) -> Any:
+    if isinstance(value, str):
+        m = _TEMPLATE_RE.fullmatch(value)
+        if m:
+            try:
+                return lookup_ref(m.group(1).strip(), params, context)
+            except KeyError:
+                return value
+
+        def sub(mm):
+            try:
+                return str(lookup_ref(mm.group(1).strip(), params, context))
+            except KeyError:
+                return mm.group(0)
+        return _TEMPLATE_RE.sub(sub, value)
+    if isinstance(value, dict):
+        return {k: render_template(v, params, context) for k, v in value.items()}
+    if isinstance(value, list):
+        return [render_template(v, params, context) for v in value]
+    return value
+
+
+# action.executor に指定できる値
+EXECUTORS = ("inline", "thread", "process")
+
+# 実行モード: walk = 定義順に全 state・全 transition を実行 / machine = guard で遷移を選ぶ状態機械
+MODES = ("walk", "machine")
+DEFAULT_MAX_STEPS = 10000   # machine モードの state 訪問回数の上限（runtime.max_steps で上書き）
+
+# RuntimeEngine の hook で受け取れるイベント（hook オブジェクトの同名メソッドを呼ぶ）
+HOOK_EVENTS = ("run_start", "run_end", "state_enter", "state_exit", "before_step", "after_step", "shard",
+               "contract", "result")
+
+# foreach.by に指定できる分割方法
+SHARD_BY = ("rows", "files", "bytes")
+
+
+# ===== Compiled Plan =====
+
+@dataclass
+class ForeachSpec:
+    """
+    action の foreach 指定（入力を shard に分割し、同じ ref_step を shard ごとに並列実行する）
+      by=rows  : args[arg] の列を連続区間に shards 分割し、各 shard に部分リストを渡す
+      by=files : args[arg] のファイル列（または glob 文字列）を 1 ファイルずつ渡す
+      by=bytes : args[arg] のファイルを行境界に揃えたバイト範囲に分割し、offset / length を追加で渡す
+    reduce があれば shard 結果のリストを reduce_arg として渡して 1 つにまとめる
+    """
+    arg: str
+    by: str = "rows"
+    shards: Optional[int] = None          # None ならワーカ数（max_workers / CPU 数）
+    reduce: Optional[str] = None
+    reduce_func: Optional[Callable[..., Any]] = None
+    reduce_arg: str = "results"
+
+
+@dataclass
+class BoundAction:
+    """ref_step を解決済みの callable・引数と束縛した実行単位"""
+    ref_step: str
+    func: Callable[..., Any]
+    args: Dict[str, Any]
+    phase: str
+    state: str
+    independent: bool = False   # 同一リスト内で他の independent action と並行実行可
+    executor: str = "inline"    # inline / thread / process
+    cacheable: bool = True      # StepCache の対象か（side_effect / cache: false で除外）
+    is_async: bool = False      # ref_step がコルーチン関数か
+    refs: Tuple[str, ...] = ()  # args 中の ${...} 参照（空なら args は実行時に展開不要）
+    timeout: Optional[float] = None   # 秒（runtime.timeouts の per_step / step から解決）
+    foreach: Optional[ForeachSpec] = None
+    log_msg: str = ""
+
+    def __post_init__(self):
+        self.log_msg = f"[{self.phase}] step={self.ref_step} args={self.args}"
+        self.is_async = inspect.iscoroutinefunction(self.func)
+        self.refs = template_refs(self.args)
+
+
+@dataclass
+class CompiledContract:
+    """構文解析・コンパイル済みの contract / guard（解析できない自然言語式は predicate=None）"""
+    text: str
+    predicate: Optional[Predicate]
+    error: Optional[str] = None
+    keys: Tuple[str, ...] = ()   # 参照する context キー（liveness 解析用）
+    strict: bool = False         # 未解決の名前を含む式を偽とする（False なら評価を省略）
+
+
+def compile_contract(text: str, strict: bool = False) -> CompiledContract:
+    try:
+        keys = tuple(context_keys(parse_condition(text)))
+        return CompiledContract(text, compile_condition(text), keys=keys, strict=strict)
+    except ContractSyntaxError as e:
+        if strict:
+            raise RuntimeErrorIKDD(f"cannot parse condition '{text}': {e}")
+        return CompiledContract(text, None, str(e))
+
+
+@dataclass
+class CompiledTransition:
+    to: Optional[str]
+    guard: Optional[str]
+    effects: List[BoundAction]
+    guard_check: Optional[CompiledContract] = None
+
+
+@dataclass
+class CompiledState:
+    sid: str
+    entry: List[BoundAction]
+    transitions: List[CompiledTransition]
+    exit: List[BoundAction]
+
+
+@dataclass
+class CompiledPlan:
+    """
+    IEP を 1 度だけ解釈した実行計画。
+      - transitions は from state で索引化済み
+      - ref_step は callable に解決済み、args は束縛済み
+      - constraints は読み出し済み、contract_checks / guard は述語にコンパイル済み
+    """
+    iep_id: Optional[str]
+    iep_hash: str
+    must: FrozenSet[str]
+    forbidden: FrozenSet[str]
+    pre: List[CompiledContract]
+    post: List[CompiledContract]
+    states: List[CompiledState] = field(default_factory=list)
+    run_timeout: Optional[float] = None   # 秒（runtime.timeouts.run）
+    # ---- machine モード ----
+    mode: str = "walk"                    # runtime.mode（execute(mode=...) で上書き可）
+    initial: Optional[str] = None         # 開始 state（initial、省略時は先頭 state）
+    index: Dict[str, CompiledState] = field(default_factory=dict)   # state id → CompiledState
+    reachable: FrozenSet[str] = frozenset()                          # initial から到達可能な state
+    max_steps: Optional[int] = None       # runtime.max_steps
+    loop_detection: bool = False          # runtime.loop_detection（opt-in）
+    # ---- liveness（walk モード）----
+    releases: Dict[int, Tuple[str, ...]] = field(default_factory=dict)   # id(BoundAction) → 実行後に解放できる context キー
+
+
+def _timeout_value(value: Any, where: str) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise RuntimeErrorIKDD(f"invalid timeout for {where}: {value!r} (positive seconds expected)")
+    return float(value)
+
+
+def _bind_action(action: Dict[str, Any], phase: str, state: str,
+                 step_resolver: Mapping[str, Callable[..., Any]],
+                 timeouts: Optional[Dict[str, Any]] = None) -> BoundAction:
+    ref_step = action.get("ref_step")
+    if not ref_step:
+        raise RuntimeErrorIKDD(f"{phase} missing ref_step in state {state}")
+    if ref_step not in step_resolver:
+        raise RuntimeErrorIKDD(f"step '{ref_step}' not found in resolver")
+    args = dict(action.get("args", {}) or {})
+    executor = action.get("executor") or "inline"
+    if executor not in EXECUTORS:
+        raise RuntimeErrorIKDD(f"unknown executor '{executor}' for step '{ref_step}' in state {state}")
+    try:
+        func = step_resolver[ref_step]   # LazyStepResolver ならここで初めて import される
+    except StepImportError as e:
+        raise RuntimeErrorIKDD(str(e))
+    bound = BoundAction(ref_step, func, args, phase, state,
+                        independent=bool(action.get("independent", False)), executor=executor,
+                        cacheable=bool(action.get("cache", True)) and not action.get("side_effect", False))
+    if timeouts:
+        per_step = timeouts.get("per_step") or {}
+        bound.timeout = _timeout_value(per_step.get(ref_step, timeouts.get("step")), f"step '{ref_step}'")
+    if bound.is_async and executor != "inline":
+        raise RuntimeErrorIKDD(f"coroutine step '{ref_step}' cannot use executor '{executor}'")
+    if action.get("foreach"):
+        bound.foreach = _bind_foreach(action["foreach"], bound, step_resolver)
+    return bound
+
+
+def _bind_foreach(spec: Any, bound: BoundAction, step_resolver: Mapping[str, Callable[..., Any]]) -> ForeachSpec:
+    where = f"foreach of step '{bound.ref_step}' in state {bound.state}"
+    if not isinstance(spec, dict) or not spec.get("arg"):
+        raise RuntimeErrorIKDD(f"{where}: 'arg' is required")
+    if spec["arg"] not in bound.args:
+        raise RuntimeErrorIKDD(f"{where}: arg '{spec['arg']}' is not in args")
+    by = spec.get("by") or "rows"
+    if by not in SHARD_BY:
+        raise RuntimeErrorIKDD(f"{where}: unknown by '{by}' (expected one of {SHARD_BY})")
+    shards = spec.get("shards")
+    if shards is not None and (isinstance(shards, bool) or not isinstance(shards, int) or shards <= 0):
+        raise RuntimeErrorIKDD(f"{where}: invalid shards {shards!r}")
+    if bound.is_async:
+        raise RuntimeErrorIKDD(f"{where}: coroutine steps cannot be sharded")
+    reduce = spec.get("reduce")
+    reduce_func = None
+    if reduce:
+        if reduce not in step_resolver:
+            raise RuntimeErrorIKDD(f"{where}: reduce step '{reduce}' not found in resolver")
+        try:
+            reduce_func = step_resolver[reduce]
+        except StepImportError as e:
+            raise RuntimeErrorIKDD(str(e))
+    return ForeachSpec(spec["arg"], by, shards, reduce, reduce_func, spec.get("reduce_arg") or "results")
+
+
+def _byte_ranges(path: str, n: int) -> List[Tuple[int, int]]:
+    """ファイルを約 n 等分し、各境界を次の改行の直後に揃えた (offset, length) の列"""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as f:
+        for i in range(1, n):
+            pos = max(size * i // n, bounds[-1])
+            f.seek(pos)
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(a, b - a) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+def split_shards(args: Dict[str, Any], spec: ForeachSpec, default_shards: int) -> List[Dict[str, Any]]:
+    """展開済み args を foreach 指定に従って shard ごとの args に分割する"""
+    value = args.get(spec.arg)
+    n = spec.shards or default_shards
+    if spec.by == "rows":
+        if isinstance(value, (str, bytes)) or not hasattr(value, "__len__"):
+            raise RuntimeErrorIKDD(f"foreach by=rows needs a sequence for '{spec.arg}', got {type(value).__name__}")
+        n = max(1, min(n, len(value)))
+        size, extra = divmod(len(value), n)
+        out, start = [], 0
+        for i in range(n):
+            end = start + size + (1 if i < extra else 0)
+            out.append(dict(args, **{spec.arg: value[start:end]}))
+            start = end
+        return out
+    if spec.by == "files":
+        paths = sorted(glob.glob(value)) if isinstance(value, str) else list(value)
+        return [dict(args, **{spec.arg: p}) for p in paths]
+    ranges = _byte_ranges(os.fspath(value), n) or [(0, 0)]
+    return [dict(args, offset=off, length=length) for off, length in ranges]
+
+
+def _call_shard(func: Callable[..., Any], kwargs: Dict[str, Any]) -> Tuple[Any, float]:
+    """shard 1 つ分の実行（process プールへ渡すためモジュールレベルに置く）"""
+    t0 = time.perf_counter()
+    result = func(**kwargs)
+    return result, time.perf_counter() - t0
+
+
+class _StepCall:
+    """実行中 step 1 回分の状態（展開済み引数・キャッシュ参照結果・timeout 予算・計測値）"""
+    __slots__ = ("action", "args", "key", "hit", "cached", "t0", "deadline", "by_run", "elapsed")
+
+    def __init__(self, action: BoundAction, args: Dict[str, Any], key: Optional[str], hit: bool, cached: Any):
+        self.action, self.args, self.key, self.hit, self.cached = action, args, key, hit, cached
+        self.t0 = 0.0
+        self.deadline: Optional[float] = None   # time.monotonic() 基準の期限（None なら無期限）
+        self.by_run = False                     # 期限が run 全体の予算で決まっているか
+        self.elapsed: Optional[float] = None
+
+    def remaining(self) -> Optional[float]:
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+
+def _spawn_daemon(func: Callable[..., Any], args: Dict[str, Any], name: str) -> Future:
+    """
+    timeout 付き step 用。daemon スレッドで実行し Future を返す。
+    超過時はスレッドを放棄する（プールのスレッドと違い、プロセス終了を妨げない）。
+    """
+    fut: Future = Future()
+    fut.set_running_or_notify_cancel()
+
+    def run():
+        try:
+            result = func(**args)
+        except BaseException as e:
+            fut.set_exception(e)
+        else:
+            fut.set_result(result)
+    threading.Thread(target=run, name=f"ikdd-timed-{name}", daemon=True).start()
+    return fut
+
+
+class _TrackingContext:
+    """
+    ProcessPoolExecutor の mp_context。起動した worker プロセスの handle を保持し、
+    timeout 時に停止できるようにする（executor の内部属性には触れない）
+    """
+    def __init__(self, ctx=None):
+        self._ctx = ctx or multiprocessing.get_context()
+        self.processes: "weakref.WeakSet[Any]" = weakref.WeakSet()
+
+    def Process(self, *args: Any, **kw: Any):
+        proc = self._ctx.Process(*args, **kw)
+        self.processes.add(proc)
+        return proc
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._ctx, name)
+
+    def terminate(self):
+        for proc in list(self.processes):
+            if proc.is_alive():
+                proc.terminate()
+
+
+def group_independent(actions: List[BoundAction]) -> List[List[BoundAction]]:
+    """
+    action 列を実行グループに分割する。
+    連続する independent action は 1 グループにまとめ、それ以外は単独グループとする
+    （非 independent action は前後の並行実行に対するバリアになる）。
+    """
+    groups: List[List[BoundAction]] = []
+    for act in actions:
+        if act.independent and groups and groups[-1][-1].independent:
+            groups[-1].append(act)
+        else:
+            groups.append([act])
+    return groups
+
+
+def compile_plan(iep: Dict[str, Any], step_resolver: Mapping[str, Callable[..., Any]],
+                 iep_hash: Optional[str] = None, strict_contracts: bool = False) -> CompiledPlan:
+    """
+    IEP → CompiledPlan。states / transitions を 1 回ずつ走査するだけなので
+    O(states + transitions) で構築できる。
+    """
+    constraints = iep.get("constraints", {}) or {}
+    forbidden = frozenset(constraints.get("forbidden", []) or [])
+
+    # forbidden check upfront
+    for step_name in step_resolver:
+        if step_name in forbidden:
+            raise RuntimeErrorIKDD(f"forbidden step present in resolver: {step_name}")
+
+    runtime = iep.get("runtime", {}) or {}
+    rt = runtime.get("contract_checks", {}) or {}
+    timeouts = runtime.get("timeouts", {}) or {}
+
+    # transitions を from state で索引化（記述順は保持）
+    by_from: Dict[Any, List[Dict[str, Any]]] = {}
+    for tr in iep.get("transitions", []) or []:
+        by_from.setdefault(tr.get("from"), []).append(tr)
+
+    states: List[CompiledState] = []
+    for state in iep.get("states", []) or []:
+        sid = state.get("id")
+        entry = [_bind_action(a, "entry", sid, step_resolver, timeouts) for a in state.get("entry_action", []) or []]
+        transitions = []
+        for tr in by_from.get(sid, []):
+            label = f"{sid}->{tr.get('to')}"
+            effects = [_bind_action(e, "effect", label, step_resolver, timeouts) for e in tr.get("effects", []) or []]
+            guard = tr.get("guard")
+            guard_check = compile_contract(guard) if guard else None
+            transitions.append(CompiledTransition(tr.get("to"), guard, effects, guard_check))
+        exit_ = [_bind_action(a, "exit", sid, step_resolver, timeouts) for a in state.get("exit_action", []) or []]
+        states.append(CompiledState(sid, entry, transitions, exit_))
+
+    post = [compile_contract(c, strict_contracts) for c in rt.get("post") or []]
+    index = {st.sid: st for st in states}
+    initial = iep.get("initial") or (states[0].sid if states else None)
+    if initial is not None and initial not in index:
+        raise RuntimeErrorIKDD(f"initial state '{initial}' is not defined")
+    mode = runtime.get("mode") or "walk"
+    if mode not in MODES:
+        raise RuntimeErrorIKDD(f"unknown runtime mode: {mode}")
+    max_steps = runtime.get("max_steps")
+    if max_steps is not None and (isinstance(max_steps, bool) or not isinstance(max_steps, int) or max_steps <= 0):
+        raise RuntimeErrorIKDD(f"invalid max_steps: {max_steps!r} (positive integer expected)")
+
+    return CompiledPlan(
+        iep_id=iep.get("id"),
+        iep_hash=iep_hash or iep_content_hash(iep),
+        must=frozenset(constraints.get("must", []) or []),
+        forbidden=forbidden,
+        pre=[compile_contract(c, strict_contracts) for c in rt.get("pre") or []],
+        post=post,
+        states=states,
+        run_timeout=_timeout_value(timeouts.get("run"), "run"),
+        mode=mode,
+        initial=initial,
+        index=index,
+        reachable=reachable_states(index, initial),
+        max_steps=max_steps,
+        loop_detection=bool(runtime.get("loop_detection", False)),
+        releases=compute_releases(states, post),
+    )
+
+
+def walk_order(states: List[CompiledState]) -> Iterator[BoundAction]:
+    """walk モードでの action 実行順"""
+    for st in states:
+        yield from st.entry
+        for tr in st.transitions:
+            yield from tr.effects
+        yield from st.exit
+
+
+def compute_releases(states: List[CompiledState], post: List[CompiledContract]) -> Dict[int, Tuple[str, ...]]:
+    """
+    walk 順の data flow（args の ${context.X...} 参照・post contract）から各結果の最終利用位置を求め、
+    「この action の結果記録後に解放してよい context キー」を返す。
+      - 後続の step が読む結果だけが対象（誰も読まない結果は計画の出力とみなして残す）
+      - post contract が読む結果は最後まで残す
+      - 同じ step が再実行されて上書きされる場合は、上書き前の値の最終利用で区切る
+    """
+    keep = {k for ct in post for k in ct.keys}
+    last_reader: Dict[str, BoundAction] = {}   # キー → 現在の値を最後に読んだ action
+    produced: set = set()
+    releases: Dict[int, List[str]] = {}
+
+    def close(key: str, producer: Optional[BoundAction]):
+        reader = last_reader.pop(key, None)
+        if reader is not None and key in produced and key not in keep and reader is not producer:
+            releases.setdefault(id(reader), []).append(key)
+
+    for act in walk_order(states):
+        for ref in act.refs:
+            if ref.startswith("context.") and len(ref) > len("context."):
+                last_reader[ref.split(".")[1]] = act
+        key = f"{act.ref_step}_result"
+        close(key, act)
+        produced.add(key)
+    for key in list(last_reader):
+        close(key, None)
+    return {k: tuple(v) for k, v in releases.items()}
+
+
+def reachable_states(index: Dict[str, CompiledState], initial: Optional[str]) -> FrozenSet[str]:
+    """initial から transition をたどって到達できる state（guard は考慮しない）"""
+    if initial is None:
+        return frozenset()
+    seen = {initial}
+    stack = [initial]
+    while stack:
+        for tr in index[stack.pop()].transitions:
+            if tr.to in index and tr.to not in seen:
+                seen.add(tr.to)
+                stack.append(tr.to)
+    return frozenset(seen)
+
+
 # ===== Runtime Engine =====
 
+def _release_engine(pools: Dict[str, Executor], sink: Optional[LogSink]):
+    """close() / weakref.finalize から呼ぶ後始末（engine 自身は参照しない）"""
+    for pool in list(pools.values()):
+        pool.shutdown(wait=False)
+    pools.clear()
+    if sink is not None:
+        sink.close()
+
+
 class RuntimeEngine:
     """
     MVP Runtime:
       - IEP(state) を解釈し、各 ref_step に対応する関数を呼び出す
+      - IEP は CompiledPlan に 1 度だけ変換し、内容ハッシュでキャッシュ
+      - execute_async: コルーチン step と independent action の並行実行
+      - action.executor (inline / thread / process) により常駐プールへ step を投入
       - fail-fast: forbidden / contract / error
-      - logging: state 遷移＋I/O ハッシュ
+      - logging: state 遷移＋I/O ハッシュ（result_hash による逐次ハッシュ）
+                 LogSink によるバックグラウンド書き出し（既定はテキスト行、log_format="jsonl" で JSONL）
+      - State Store: state 完了ごとのチェックポイントと resume
+      - StepCache: step 結果のメモ化 (opt-in)
+      - args の ${...} 参照を params / context から展開
+      - contract / guard は contract_expr で 1 度だけ構文解析し、述語として評価
+      - hooks: run / state / step / contract の各イベントを購読（profiler.StepProfiler など）
     """
-    def __init__(self, step_resolver: Dict[str, Callable[..., Any]], log_path: str = "runtime.log"):
+    def __init__(self, step_resolver: Mapping[str, Callable[..., Any]], log_path: str = "runtime.log",
+                 max_concurrency: int = 8, max_workers: Optional[int] = None,
+                 result_hasher: Callable[[Any], str] = hash_result,
+                 sink: Optional[LogSink] = None, log_level: str = "info", echo: bool = True,
+                 log_format: str = "text",
+                 state_store: Optional[StateStore] = None, cache: Optional[StepCache] = None,
+                 strict_contracts: bool = False, hooks: Optional[List[Any]] = None,
+                 max_steps: int = DEFAULT_MAX_STEPS, release_results: bool = False,
+                 pinned_results: Optional[List[str]] = None):
         self.step_resolver = step_resolver
         self.log_path = log_path
-        self.log_lines: List[str] = []
+        self.max_concurrency = max(1, max_concurrency)   # execute_async の同時実行上限
+        self.max_workers = max_workers                   # thread / process プールのワーカ数（None=既定）
+        self._pools: Dict[str, Executor] = {}            # executor 種別 → 常駐プール
+        self._workers: Optional[_TrackingContext] = None   # process プールの worker handle
+        self.result_hasher = result_hasher               # ログ用の結果ハッシュ関数（差し替え可）
+        # ログシンク。console エコーも writer スレッド側で行う
+        self._owns_sink = sink is None
+        self.sink = sink if sink is not None else LogSink(log_path, level=log_level, echo=echo, fmt=log_format)
+        # close() されないまま破棄されても、常駐プールと自前のシンク（スレッド・ファイル）を止める
+        self._finalizer = weakref.finalize(self, _release_engine, self._pools,
+                                           self.sink if self._owns_sink else None)
         self.context: Dict[str, Any] = {}   # 状態変数など
+        self.params: Dict[str, Any] = {}    # ${...} テンプレート引数の解決元（execute(params=...)）
+        self._params_hash = ""              # チェックポイントのキー（params が違う実行からは再開しない）
+        self.result_hashes: Dict[str, str] = {}   # context キー → 結果ハッシュ
+        self.state_store = state_store             # None ならチェックポイントを取らない
+        self.cache = cache                         # None ならメモ化しない（opt-in）
+        self.strict_contracts = strict_contracts   # True なら解析できない contract をコンパイルエラーにする
+        self.max_steps = max_steps                 # machine モードの state 訪問回数の上限（IEP 側が優先）
+        # 最終利用後に中間結果を context から解放する（walk モードのみ、opt-in）。
+        # pinned_results は解放しないキー（"CSV_LOAD" / "CSV_LOAD_result" どちらでも可）
+        self.release_results = release_results
+        self.pinned_results = {k if k.endswith("_result") else f"{k}_result" for k in pinned_results or []}
+        self._releases: Dict[int, Tuple[str, ...]] = {}
+        self._run_plan: Optional[CompiledPlan] = None
+        self._completed_states: List[str] = []
+        self._next_state: Optional[str] = None      # machine モードで次に入る state（チェックポイント用）
+        self._ckpt_dirty = False
+        self._ckpt_saved_at = 0.0
+        self._plans: Dict[str, CompiledPlan] = {}   # IEP 内容ハッシュ → CompiledPlan
+        self._deadline: Optional[float] = None      # run 全体の期限（time.monotonic() 基準）
+        self._hooks: Dict[str, List[Callable[..., Any]]] = {}   # イベント名 → 登録済みコールバック
+        for hook in hooks or []:
+            self.add_hook(hook)
+
+    def log(self, msg: str, level: str = "info", **fields: Any):
+        self.sink.emit(level, msg, **fields)
+
+    # ===== Hooks =====
 
-    def log(self, msg: str):
-        line = f"[{now_str()}] {msg}"
-        self.log_lines.append(line)
-        print(line)
+    def add_hook(self, hook: Any):
+        """
+        hook オブジェクトを登録する。HOOK_EVENTS と同名のメソッドを持つものだけが呼ばれる:
+          run_start(plan) / run_end(plan, error)
+          state_enter(state) / state_exit(state)
+          before_step(action, args) / after_step(action, args, result, error, cached)
+          contract(phase, text, ok)   # ok=None は解析できず評価を省略した式
+          result(action, key, hash)   # context へ記録した結果のハッシュ（after_step の後）
+        hook 内の例外は実行を中断する（fail-fast）。
+        """
+        for name in HOOK_EVENTS:
+            fn = getattr(hook, name, None)
+            if callable(fn):
+                self._hooks.setdefault(name, []).append(fn)
+
+    def remove_hook(self, hook: Any):
+        for name in HOOK_EVENTS:
+            fn = getattr(hook, name, None)
+            fns = self._hooks.get(name)
+            if fns and fn in fns:
+                fns.remove(fn)
+                if not fns:
+                    del self._hooks[name]
+
+    def _emit(self, event: str, **kw: Any):
+        fns = self._hooks.get(event)
+        if fns:
+            for fn in fns:
+                fn(**kw)
 
     def write_log(self):
-        with open(self.log_path, "a", encoding="utf-8") as f:
-            f.write("\n".join(self.log_lines) + "\n")
+        """バッファ済みのログを log_path へ書き出す（途中経過も逐次書き出し済み）"""
+        self.sink.flush()
 
-    def execute(self, iep: Dict[str, Any]):
-        self.log(f"--- Runtime start: {iep.get('id')} ---")
+    def close(self):
+        """常駐ワーカプールと（自前で作成した）ログシンクを停止する"""
+        pools = list(self._pools.values())
+        self._pools.clear()
+        for pool in pools:
+            pool.shutdown(wait=True)
+        self._finalizer()
 
-        constraints = iep.get("constraints", {})
-        must = set(constraints.get("must", []))
-        forbidden = set(constraints.get("forbidden", []))
+    def __enter__(self):
+        return self
 
-        # forbidden check upfront
-        for step_name in self.step_resolver:
-            if step_name in forbidden:
-                raise RuntimeErrorIKDD(f"forbidden step present in resolver: {step_name}")
+    def __exit__(self, *exc):
+        self.close()
 
-        # pre-contract
-        rt = iep.get("runtime", {}).get("contract_checks", {})
-        self._check_contracts(rt.get("pre"), phase="pre")
+    def _pool(self, kind: str) -> Executor:
+        pool = self._pools.get(kind)
+        if pool is None:
+            if kind == "process":
+                self._workers = _TrackingContext()
+                pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._workers)
+            else:
+                pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ikdd-step")
+            self._pools[kind] = pool
+        return pool
 
-        # ===== state 実行 =====
-        for state in iep.get("states", []):
-            sid = state.get("id")
-            self.log(f"Enter state: {sid}")
+    def compile(self, iep: Dict[str, Any]) -> CompiledPlan:
+        """IEP を CompiledPlan に変換する（内容ハッシュ単位でキャッシュ）"""
+        iep_hash = iep_content_hash(iep)
+        plan = self._plans.get(iep_hash)
+        if plan is None:
+            plan = compile_plan(iep, self.step_resolver, iep_hash=iep_hash,
+                                strict_contracts=self.strict_contracts)
+            self._plans[iep_hash] = plan
+        return plan
 
-            for act in state.get("entry_action", []) or []:
-                self._exec_action(act, phase="entry", state=sid)
+    def execute(self, iep: Dict[str, Any], resume: bool = False, params: Optional[Dict[str, Any]] = None,
+                mode: Optional[str] = None):
+        """
+        resume=True なら state_store のチェックポイントから完了済み state をスキップして再開する。
+        params は args 中の ${...} 参照の解決に使う。
+        mode は "walk"（既定、定義順に全 state を実行）または "machine"（guard で遷移を選ぶ）。
+        省略時は IEP の runtime.mode に従う。
+        """
+        self.execute_plan(self.compile(iep), resume=resume, params=params, mode=mode)
 
-            # transition check
-            for tr in iep.get("transitions", []) or []:
-                if tr.get("from") == sid:
-                    guard = tr.get("guard")
-                    self.log(f"Transition guard={guard or '(none)'}")
-                    for eff in tr.get("effects", []) or []:
-                        self._exec_action(eff, phase="effect", state=f"{sid}->{tr.get('to')}")
-                    self.log(f"State transition: {sid} → {tr.get('to')}")
+    def execute_plan(self, plan: CompiledPlan, resume: bool = False, params: Optional[Dict[str, Any]] = None,
+                     seed: Optional[Checkpoint] = None, mode: Optional[str] = None):
+        """seed を与えると、その実行状態（context / 完了済み state）から開始する"""
+        try:
+            for actions in self._walk(plan, resume, params, seed, mode):
+                for group in group_independent(actions):
+                    if len(group) == 1:
+                        self._exec_action(group[0])
+                    else:
+                        self._exec_group(group)
+        except BaseException as e:
+            self._log_failure(e)
+            self._emit("run_end", plan=plan, error=e)
+            raise
+        self._emit("run_end", plan=plan, error=None)
+
+    async def execute_async(self, iep: Dict[str, Any], resume: bool = False,
+                            params: Optional[Dict[str, Any]] = None, mode: Optional[str] = None):
+        """
+        asyncio 実行モード:
+          - コルーチン関数の ref_step は await で実行
+          - 同一リスト内の連続する independent action は max_concurrency を上限に並行実行
+          - fail-fast / contract / must の意味論は execute() と同一
+        """
+        await self.execute_plan_async(self.compile(iep), resume=resume, params=params, mode=mode)
+
+    async def execute_plan_async(self, plan: CompiledPlan, resume: bool = False,
+                                 params: Optional[Dict[str, Any]] = None, seed: Optional[Checkpoint] = None,
+                                 mode: Optional[str] = None):
+        sem = asyncio.Semaphore(self.max_concurrency)
+        try:
+            for actions in self._walk(plan, resume, params, seed, mode):
+                for group in group_independent(actions):
+                    if len(group) == 1:
+                        call = self._begin_step(group[0])
+                        self._record_result(call, await self._call_async(call, sem, concurrent=False))
+                    else:
+                        await self._exec_group_async(group, sem)
+        except BaseException as e:
+            self._log_failure(e)
+            self._emit("run_end", plan=plan, error=e)
+            raise
+        self._emit("run_end", plan=plan, error=None)
+
+    def _log_failure(self, e: BaseException):
+        # 失敗時も直前までのログ・完了済み state のチェックポイントを確実に残す
+        self.log(f"--- Runtime failed: {type(e).__name__}: {e} ---", level="error")
+        if self._ckpt_dirty:
+            self._save_checkpoint(force=True)
+        self.write_log()
+
+    def _log_action(self, action: BoundAction, args: Dict[str, Any]):
+        msg = f"[{action.phase}] step={action.ref_step} args={args}" if action.refs else action.log_msg
+        self.log(msg, step=action.ref_step, phase=action.phase, state=action.state)
 
-            for act in state.get("exit_action", []) or []:
-                self._exec_action(act, phase="exit", state=sid)
+    def _args(self, action: BoundAction) -> Dict[str, Any]:
+        """実行時の引数（${...} 参照を params / context から展開）"""
+        if not action.refs:
+            return action.args
+        return render_template(action.args, self.params, self.context)
+
+    def _walk(self, plan: CompiledPlan, resume: bool = False, params: Optional[Dict[str, Any]] = None,
+              seed: Optional[Checkpoint] = None, mode: Optional[str] = None) -> Iterator[List[BoundAction]]:
+        """
+        state 実行の骨格。実行すべき action 列を順に yield し、
+        実際の呼び出しは execute_plan / execute_plan_async 側が行う。
+        """
+        mode = mode or plan.mode
+        if mode not in MODES:
+            raise RuntimeErrorIKDD(f"unknown runtime mode: {mode}")
+        self.log(f"--- Runtime start: {plan.iep_id} ---", iep_hash=plan.iep_hash, mode=mode)
+        self._run_plan = plan
+        self._deadline = time.monotonic() + plan.run_timeout if plan.run_timeout else None
+        self._emit("run_start", plan=plan)
+        self._completed_states = []
+        self._next_state = None
+        self._ckpt_dirty = False
+        # machine モードは実行順が入力で変わるため、静的な最終利用位置は使えない
+        self._releases = plan.releases if self.release_results and mode == "walk" else {}
+        if params is not None:
+            self.params = dict(params)
+        self._params_hash = iep_content_hash(self.params)
+        done = set()
+        if seed is not None:
+            done = self._apply_checkpoint(seed)
+        if resume:
+            done = self._restore_checkpoint(plan)
+
+        # pre-contract
+        self._check_contracts(plan.pre, phase="pre")
+
+        # ===== state 実行 =====
+        if mode == "machine":
+            yield from self._run_machine(plan)
+        else:
+            yield from self._run_walk(plan, done)
 
         # post-contract
-        self._check_contracts(rt.get("post"), phase="post")
+        self._check_deadline("post contracts")
+        self._check_contracts(plan.post, phase="post")
 
         # must check
         executed = set(self.context.get("_executed_steps", []))
-        missing = must - executed
+        missing = plan.must - executed
         if missing:
-            raise RuntimeErrorIKDD(f"must steps not executed: {missing}")
+            raise RuntimeErrorIKDD(f"must steps not executed: {set(missing)}")
 
+        if self.state_store is not None:
+            self.state_store.clear(plan.iep_hash, self._params_hash)
+            self._ckpt_dirty = False
         self.log(f"--- Runtime completed successfully ---")
         self.write_log()
 
-    def _exec_action(self, action: Dict[str, Any], phase: str, state: str):
-        ref_step = action.get("ref_step")
-        args = action.get("args", {}) or {}
-        if not ref_step:
-            raise RuntimeErrorIKDD(f"{phase} missing ref_step in state {state}")
-        if ref_step not in self.step_resolver:
-            raise RuntimeErrorIKDD(f"step '{ref_step}' not found in resolver")
-        func = self.step_resolver[ref_step]
-        self.log(f"[{phase}] step={ref_step} args={args}")
-        result = func(**args)
-        self.context[f"{ref_step}_result"] = result
-        self.context.setdefault("_executed_steps", []).append(ref_step)
-        # ハッシュ生成（単純な文字列変換）
-        result_hash = sha256_str(str(result))
-        self.log(f"→ result[{ref_step}] hash={result_hash}")
-
-    def _check_contracts(self, clauses, phase="pre"):
-        if not clauses:
+    def _run_walk(self, plan: CompiledPlan, done: set) -> Iterator[List[BoundAction]]:
+        """walk モード: 定義順に全 state を実行し、各 state の transition effects をすべて発火する"""
+        for state in plan.states:
+            sid = state.sid
+            if sid in done:
+                self.log(f"Skip state (checkpoint): {sid}", state=sid)
+                continue
+            self._check_deadline(f"state {sid}")
+            self.log(f"Enter state: {sid}", state=sid)
+            self._emit("state_enter", state=state)
+
+            yield state.entry
+
+            # transition check
+            for tr in state.transitions:
+                self.log(f"Transition guard={tr.guard or '(none)'}")
+                yield tr.effects
+                self.log(f"State transition: {sid} → {tr.to}")
+
+            yield state.exit
+
+            self._completed_states.append(sid)
+            self._ckpt_dirty = True
+            self._save_checkpoint()
+            self._emit("state_exit", state=state)
+
+    def _run_machine(self, plan: CompiledPlan) -> Iterator[List[BoundAction]]:
+        """
+        machine モード: initial（再開時はチェックポイントの次 state）から開始し、
+        entry → guard 評価で遷移を 1 本選択 → exit → effects → 遷移先へ、を繰り返す。
+          - guard は記述順に評価し最初に真になったものを採用、guard なしの transition は他が全て偽のときの既定
+          - 発火する transition がなければその state で停止する
+          - state 訪問回数が max_steps を超えたら停止する
+          - loop_detection 指定時は、同じ state に同じ結果（result_hashes）で戻ってきたらループとして停止する
+            （ファイルやジョブの完了を guard で待つポーリングは結果が変わらないため、既定では無効）
+        """
+        self._check_machine_plan(plan)
+        max_steps = plan.max_steps or self.max_steps
+        # 再開時はチェックポイントの次 state から（停止済みなら None）
+        sid = self._next_state if self._completed_states else plan.initial
+        pruned = len(plan.index) - len(plan.reachable)
+        if pruned:
+            self.log(f"[machine] {pruned} unreachable states pruned", level="debug", pruned=pruned)
+        visited: set = set()
+        visits = 0
+        while sid is not None:
+            visits += 1
+            if visits > max_steps:
+                raise RuntimeErrorIKDD(f"state machine exceeded max_steps={max_steps} (at state {sid})")
+            if plan.loop_detection:
+                fingerprint = (sid, hash(frozenset(self.result_hashes.items())))
+                if fingerprint in visited:
+                    raise RuntimeErrorIKDD(f"loop detected: re-entered state {sid} with unchanged results")
+                visited.add(fingerprint)
+            state = plan.index[sid]
+            self._check_deadline(f"state {sid}")
+            self.log(f"Enter state: {sid}", state=sid)
+            self._emit("state_enter", state=state)
+
+            yield state.entry
+
+            tr = self._choose_transition(state)
+
+            yield state.exit
+
+            if tr is not None:
+                yield tr.effects
+                self.log(f"State transition: {sid} → {tr.to}")
+            else:
+                level = "warn" if state.transitions else "info"
+                self.log(f"No transition fired from {sid}; halting", level=level, state=sid)
+
+            self._completed_states.append(sid)
+            self._next_state = tr.to if tr is not None else None
+            self._ckpt_dirty = True
+            self._save_checkpoint()
+            self._emit("state_exit", state=state)
+            sid = self._next_state
+
+    def _check_machine_plan(self, plan: CompiledPlan):
+        """machine モードの事前検査: 到達可能な state の guard は評価可能で、遷移先は定義済みであること"""
+        if plan.initial is None:
+            raise RuntimeErrorIKDD("machine mode requires at least one state")
+        errors = []
+        reachable_steps = set()
+        for sid in plan.reachable:
+            state = plan.index[sid]
+            for act in state.entry + state.exit:
+                reachable_steps.add(act.ref_step)
+            for tr in state.transitions:
+                if tr.to not in plan.index:
+                    errors.append(f"transition {sid} → {tr.to}: unknown target state")
+                if tr.guard_check is not None and tr.guard_check.predicate is None:
+                    errors.append(f"guard '{tr.guard}' ({sid} → {tr.to}) cannot be evaluated: {tr.guard_check.error}")
+                reachable_steps.update(act.ref_step for act in tr.effects)
+        unreachable_must = plan.must - reachable_steps - set(self.context.get("_executed_steps", []))
+        if unreachable_must:
+            errors.append(f"must steps unreachable from initial state '{plan.initial}': {sorted(unreachable_must)}")
+        if errors:
+            raise RuntimeErrorIKDD("machine mode: " + "; ".join(errors))
+
+    def _choose_transition(self, state: CompiledState) -> Optional[CompiledTransition]:
+        fallback = None
+        for tr in state.transitions:
+            if tr.guard_check is None:
+                if fallback is None:
+                    fallback = tr
+                continue
+            try:
+                ok = bool(tr.guard_check.predicate(self.params, self.context))
+                self.log(f"Transition guard={tr.guard} → {ok}", state=state.sid, to=tr.to, guard=ok)
+            except UnresolvedName as e:
+                ok = False   # 未解決の名前を含む guard は成立しない
+                self.log(f"Transition guard={tr.guard} → False ({e})", level="warn", state=state.sid, to=tr.to,
+                         guard=False)
+            if ok:
+                return tr
+        if fallback is not None:
+            self.log(f"Transition guard=(none) → {fallback.to}", state=state.sid, to=fallback.to)
+        return fallback
+
+    # ===== State Store =====
+
+    def _restore_checkpoint(self, plan: CompiledPlan) -> set:
+        if self.state_store is None:
+            raise RuntimeErrorIKDD("resume requested but no state_store is configured")
+        ckpt = self.state_store.load(plan.iep_hash, self._params_hash)
+        if ckpt is None:
+            others = self.state_store.params_hashes(plan.iep_hash)
+            if self.state_store.last_error:
+                self.log(f"Unreadable checkpoint ignored ({self.state_store.last_error}); starting from scratch",
+                         level="warn")
+            elif others:
+                self.log(f"No checkpoint for these params ({len(others)} checkpoint(s) recorded with other params); "
+                         f"starting from scratch", level="warn")
+            else:
+                self.log("No checkpoint found; starting from scratch")
+            return set()
+        self.log(f"Resume from checkpoint: {len(ckpt.completed_states)} states done",
+                 completed_states=ckpt.completed_states)
+        return self._apply_checkpoint(ckpt)
+
+    def _apply_checkpoint(self, ckpt: Checkpoint) -> set:
+        self.context = dict(ckpt.context)
+        self.context["_executed_steps"] = list(ckpt.executed_steps)
+        self.result_hashes = dict(ckpt.result_hashes)
+        self._completed_states = list(ckpt.completed_states)
+        self._next_state = ckpt.next_state
+        return set(ckpt.completed_states)
+
+    def snapshot(self) -> Checkpoint:
+        """現在の実行状態を Checkpoint として取り出す（seed として別の実行に引き継げる）"""
+        plan = self._run_plan
+        return Checkpoint(
+            iep_hash=plan.iep_hash if plan else "",
+            iep_id=plan.iep_id if plan else None,
+            completed_states=list(self._completed_states),
+            context={k: v for k, v in self.context.items() if k != "_executed_steps"},
+            executed_steps=list(self.context.get("_executed_steps", [])),
+            result_hashes=dict(self.result_hashes),
+            next_state=self._next_state,
+            params_hash=self._params_hash,
+        )
+
+    def _save_checkpoint(self, force: bool = False):
+        store = self.state_store
+        if store is None:
+            return
+        now = time.monotonic()
+        if not force and store.min_interval and now - self._ckpt_saved_at < store.min_interval:
+            return
+        ckpt = self.snapshot()
+        try:
+            store.save(ckpt)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            # 永続化できない結果（ジェネレータ等）がある場合は前回のチェックポイントを維持
+            self.log(f"[checkpoint] skipped: {e}", level="warn")
             return
-        for cond in clauses:
-            ok = self._evaluate_condition(cond)
+        self._ckpt_saved_at = now
+        self._ckpt_dirty = False
+        self.log(f"[checkpoint] saved after state {self._completed_states[-1] if self._completed_states else '-'}",
+                 level="debug")
+
+    # ===== step 実行 =====
+    # どの経路（同期 / independent グループ / asyncio）でも
+    #   _begin_step → _start_step → 呼び出し → _end_step → _record_result
+    # の順に処理し、ログ・hook・キャッシュ・timeout の扱いを揃える。
+
+    def _begin_step(self, action: BoundAction) -> "_StepCall":
+        args = self._args(action)
+        self._log_action(action, args)
+        key, hit, cached = self._cache_lookup(action, args)
+        return _StepCall(action, args, key, hit, cached)
+
+    def _start_step(self, call: "_StepCall"):
+        """step の実際の開始直前（プール投入・セマフォ取得後）に呼ぶ"""
+        self._emit("before_step", action=call.action, args=call.args)
+        call.t0 = time.perf_counter()
+        if call.hit:
+            return
+        # timeout 予算: step 自身の timeout と run 全体の残り時間の小さい方
+        now = time.monotonic()
+        timeout = call.action.timeout
+        if timeout is not None:
+            call.deadline = now + timeout
+        if self._deadline is not None and (call.deadline is None or self._deadline < call.deadline):
+            call.deadline, call.by_run = self._deadline, True
+        if call.by_run and call.deadline <= now:
+            self._timeout(call)
+
+    def _end_step(self, call: "_StepCall", result: Any = None, error: Optional[BaseException] = None):
+        if call.t0:
+            call.elapsed = time.perf_counter() - call.t0
+        if error is None and not call.hit:
+            self._cache_store(call.key, result)
+        self._emit("after_step", action=call.action, args=call.args, result=result, error=error, cached=call.hit)
+
+    def _submit(self, call: "_StepCall") -> Future:
+        """thread / process プール、または（timeout 付きの inline / thread step は）daemon スレッドへ投入する"""
+        action = call.action
+        if action.executor == "process":
+            return self._pool("process").submit(action.func, **call.args)
+        if call.deadline is not None:
+            return _spawn_daemon(action.func, call.args, action.ref_step)
+        return self._pool("thread").submit(action.func, **call.args)
+
+    def _wait(self, call: "_StepCall", fut: Future) -> Any:
+        try:
+            return fut.result(timeout=call.remaining())
+        except FutureTimeoutError:
+            fut.cancel()
+            self._timeout(call)
+
+    def _timeout(self, call: "_StepCall"):
+        """watchdog: 超過した step を放棄（process は worker を停止）し、経過時間を残して fail-fast する"""
+        action = call.action
+        elapsed = time.perf_counter() - call.t0
+        if action.executor == "process":
+            self._kill_pool("process")
+        budget = "run" if call.by_run else "step"
+        self.log(f"[timeout] step={action.ref_step} state={action.state} budget={budget} elapsed={elapsed:.3f}s",
+                 level="error", step=action.ref_step, state=action.state, budget=budget,
+                 elapsed_ms=round(elapsed * 1000, 3))
+        if call.by_run:
+            raise RunTimeoutError(f"run timed out ({self._run_plan.run_timeout}s) during step '{action.ref_step}'",
+                                  action.ref_step, action.state, self._run_plan.run_timeout)
+        raise StepTimeoutError(f"step '{action.ref_step}' timed out after {action.timeout}s (state {action.state})",
+                               action.ref_step, action.state, action.timeout)
+
+    def _kill_pool(self, kind: str):
+        """実行中の worker ごとプールを破棄する（次回の投入時に作り直す）"""
+        pool = self._pools.pop(kind, None)
+        if pool is None:
+            return
+        if kind == "process" and self._workers is not None:
+            self._workers.terminate()
+            self._workers = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _check_deadline(self, where: str):
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            self.log(f"[timeout] run budget exhausted before {where}", level="error")
+            raise RunTimeoutError(f"run timed out ({self._run_plan.run_timeout}s) before {where}",
+                                  timeout=self._run_plan.run_timeout)
+
+    def _exec_action(self, action: BoundAction):
+        if action.is_async:
+            raise RuntimeErrorIKDD(f"step '{action.ref_step}' is a coroutine function; use execute_async()")
+        call = self._begin_step(action)
+        result = call.cached
+        try:
+            self._start_step(call)
+            if not call.hit:
+                if action.foreach is not None:
+                    result = self._run_foreach(call)
+                elif action.executor == "inline" and call.deadline is None:
+                    result = action.func(**call.args)
+                else:
+                    result = self._wait(call, self._submit(call))
+        except BaseException as e:
+            self._end_step(call, error=e)
+            raise
+        self._end_step(call, result)
+        self._record_result(call, result)
+
+    def _exec_group(self, group: List[BoundAction]):
+        """independent グループ: プール指定の action を一括投入し、inline の action はその間に実行する"""
+        for act in group:
+            if act.is_async:
+                raise RuntimeErrorIKDD(f"step '{act.ref_step}' is a coroutine function; use execute_async()")
+        calls = [self._begin_step(act) for act in group]
+        futures: List[Optional[Future]] = []
+        results = []
+        try:
+            for call in calls:
+                if call.hit or call.action.executor == "inline" or call.action.foreach is not None:
+                    futures.append(None)
+                else:
+                    self._start_step(call)
+                    futures.append(self._submit(call))
+            for call, fut in zip(calls, futures):
+                result = call.cached
+                try:
+                    if fut is None:
+                        self._start_step(call)
+                        if call.hit:
+                            pass
+                        elif call.action.foreach is not None:
+                            result = self._run_foreach(call)
+                        else:
+                            result = (call.action.func(**call.args) if call.deadline is None
+                                      else self._wait(call, self._submit(call)))
+                    else:
+                        result = self._wait(call, fut)
+                except BaseException as e:
+                    self._end_step(call, error=e)
+                    raise
+                self._end_step(call, result)
+                results.append(result)
+        except BaseException:
+            for fut in futures:
+                if fut is not None:
+                    fut.cancel()
+            raise
+        for call, result in zip(calls, results):
+            self._record_result(call, result)
+
+    async def _call_async(self, call: "_StepCall", sem: asyncio.Semaphore, concurrent: bool) -> Any:
+        action, args = call.action, call.args
+        try:
+            if call.hit:
+                self._start_step(call)
+                self._end_step(call, call.cached)
+                return call.cached
+            async with sem:
+                self._start_step(call)
+                if action.foreach is not None:
+                    # shard の投入・待ち合わせ・timeout は _run_foreach が行う
+                    aw = None
+                    result = await asyncio.to_thread(self._run_foreach, call)
+                elif action.is_async:
+                    aw = action.func(**args)
+                elif action.executor != "inline" or call.deadline is not None:
+                    aw = asyncio.wrap_future(self._submit(call))
+                elif concurrent:
+                    # 同期 step はスレッドへ逃がし、イベントループを塞がない
+                    aw = asyncio.to_thread(action.func, **args)
+                else:
+                    aw = None
+                    result = action.func(**args)
+                if aw is not None:
+                    if call.deadline is None:
+                        result = await aw
+                    else:
+                        try:
+                            result = await asyncio.wait_for(aw, call.remaining())
+                        except asyncio.TimeoutError:
+                            self._timeout(call)
+        except BaseException as e:
+            self._end_step(call, error=e)
+            raise
+        self._end_step(call, result)
+        return result
+
+    # ===== foreach（shard 分割実行） =====
+
+    def _run_foreach(self, call: "_StepCall") -> Any:
+        """
+        shard を常駐プールへ投入し、結果を shard 順に集めて（reduce があれば）まとめる。
+        executor=inline の action は thread プールで実行する。shard の失敗は残りを取り消して fail-fast。
+        """
+        action, spec = call.action, call.action.foreach
+        default_shards = self.max_workers or os.cpu_count() or 1
+        shards = split_shards(call.args, spec, default_shards)
+        kind = "thread" if action.executor == "inline" else action.executor
+        futures: List[Future] = []
+        for i, kwargs in enumerate(shards):
+            if kind == "thread" and call.deadline is not None:
+                # timeout 付きは放棄可能な daemon スレッドで実行する
+                futures.append(_spawn_daemon(_call_shard, {"func": action.func, "kwargs": kwargs},
+                                             f"{action.ref_step}-{i}"))
+            else:
+                futures.append(self._pool(kind).submit(_call_shard, action.func, kwargs))
+        self.log(f"[foreach] step={action.ref_step} by={spec.by} shards={len(shards)} executor={kind}",
+                 step=action.ref_step, shards=len(shards))
+        results: List[Any] = []
+        try:
+            for i, fut in enumerate(futures):
+                try:
+                    result, elapsed = self._wait(call, fut)
+                except StepTimeoutError:
+                    raise
+                except BaseException as e:
+                    self.log(f"[shard {i + 1}/{len(shards)}] step={action.ref_step} failed: {type(e).__name__}: {e}",
+                             level="error", step=action.ref_step, shard=i)
+                    self._emit("shard", action=action, index=i, count=len(shards), elapsed=None, error=e)
+                    raise
+                results.append(result)
+                self.log(f"[shard {i + 1}/{len(shards)}] step={action.ref_step} elapsed={elapsed * 1000:.3f}ms",
+                         step=action.ref_step, shard=i, elapsed_ms=round(elapsed * 1000, 3))
+                self._emit("shard", action=action, index=i, count=len(shards), elapsed=elapsed, error=None)
+        except BaseException:
+            for fut in futures:
+                fut.cancel()
+            raise
+        if spec.reduce_func is None:
+            return results
+        self.log(f"[reduce] step={spec.reduce} shards={len(results)}", step=spec.reduce)
+        return spec.reduce_func(**{spec.reduce_arg: results})
+
+    # ===== Step Cache =====
+
+    def _cache_lookup(self, action: BoundAction, args: Dict[str, Any]):
+        """(key, hit, value) を返す。キャッシュ無効・対象外なら key=None"""
+        if self.cache is None or not action.cacheable:
+            return None, False, None
+        key = self.cache.key_for(action.ref_step, args)
+        hit, value = self.cache.get(key)
+        if hit:
+            self.log(f"[cache-hit] step={action.ref_step} key={key[:12]}", step=action.ref_step, cache="hit")
+        return key, hit, value
+
+    def _cache_store(self, key: Optional[str], result: Any):
+        if key is not None and not self.cache.put(key, result):
+            self.log(f"[cache] result not cacheable (key={key[:12]})", level="debug")
+
+    async def _exec_group_async(self, group: List[BoundAction], sem: asyncio.Semaphore):
+        calls = [self._begin_step(act) for act in group]
+        tasks = [asyncio.ensure_future(self._call_async(call, sem, concurrent=True)) for call in calls]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # fail-fast: 残りの action は取り消してから例外を伝播
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        # context / 実行履歴への反映は宣言順で行う（結果の決定性を保つ）
+        for call, result in zip(calls, results):
+            self._record_result(call, result)
+
+    def _record_result(self, call: "_StepCall", result: Any):
+        ref_step = call.action.ref_step
+        key = f"{ref_step}_result"
+        if isinstance(result, IteratorABC):
+            # one-shot イテレータは消費せず、利用側が読み進めるのに合わせてハッシュする
+            def on_done(digest: str):
+                self.result_hashes[key] = digest
+                self.log(f"→ result[{ref_step}] stream hash={digest}", step=ref_step, hash=digest)
+            result = HashingIterator(result, on_done=on_done)
+            result_hash = "(stream)"
+        else:
+            result_hash = self.result_hasher(result)
+        self.context[key] = result
+        self.result_hashes[key] = result_hash
+        executed = self.context.setdefault("_executed_steps", [])
+        executed.append(ref_step)
+        if call.action.foreach is not None and call.action.foreach.reduce:
+            executed.append(call.action.foreach.reduce)
+        fields = {} if call.elapsed is None else {"elapsed_ms": round(call.elapsed * 1000, 3)}
+        self.log(f"→ result[{ref_step}] hash={result_hash}", step=ref_step, hash=result_hash, **fields)
+        self._emit("result", action=call.action, key=key, hash=result_hash)
+        if self._releases:
+            self._release(call.action)
+
+    def _release(self, action: BoundAction):
+        """この action が最終利用者である結果を context から外す（result_hashes は残す）"""
+        for key in self._releases.get(id(action), ()):
+            if key in self.pinned_results or key not in self.context:
+                continue
+            del self.context[key]
+            self.log(f"[release] {key} (last use: {action.ref_step})", level="debug", key=key)
+
+    def _check_contracts(self, contracts: List[CompiledContract], phase="pre"):
+        for ct in contracts:
+            if ct.predicate is None:
+                # 自然言語式は dryrun で扱う（評価せず警告のみ）
+                self.log(f"[contract-{phase}] {ct.text} (unparsed, skipped: {ct.error})", level="warn",
+                         contract=ct.text, phase=phase)
+                self._emit("contract", phase=phase, text=ct.text, ok=None)
+                continue
+            try:
+                ok = bool(ct.predicate(self.params, self.context))
+            except UnresolvedName as e:
+                if not ct.strict:
+                    # 解析できない式と同じく評価せず警告のみ（strict_contracts なら偽として失敗させる）
+                    self.log(f"[contract-{phase}] {ct.text} (unresolved, skipped: {e})", level="warn",
+                             contract=ct.text, phase=phase)
+                    self._emit("contract", phase=phase, text=ct.text, ok=None)
+                    continue
+                ok = False
+            self._emit("contract", phase=phase, text=ct.text, ok=ok)
             if not ok:
-                raise RuntimeErrorIKDD(f"Contract {phase} check failed: {cond}")
-            self.log(f"[contract-{phase}] {cond} ✅")
+                raise RuntimeErrorIKDD(f"Contract {phase} check failed: {ct.text}")
+            self.log(f"[contract-{phase}] {ct.text} ✅", contract=ct.text, phase=phase)
 
     def _evaluate_condition(self, cond: str) -> bool:
-        # 実際の評価はシンプルに模倣
-        # “exists” / “== true” / “not exists” など簡易表現のみ
-        text = cond.lower()
-        if "exists" in text:
-            # 簡易チェック: ファイル存在などを模倣
-            import os
-            token = cond.split()[0]
-            return os.path.exists(token) if os.path.exists(".") else True
-        if "==" in text:
-            try:
-                left, right = [t.strip() for t in cond.split("==", 1)]
-                return left == right
-            except Exception:
-                return False
-        # デフォルトは true (自然言語式は dryrun で扱う)
-        return True
+        ct = compile_contract(cond)
+        # 解析できない式・未解決の名前を含む式はデフォルト true (自然言語式は dryrun で扱う)
+        if ct.predicate is None:
+            return True
+        try:
+            return bool(ct.predicate(self.params, self.context))
+        except UnresolvedName:
+            return True
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+state_store.py — IKDD v0.3 Runtime 用 State Store（チェックポイント）
+目的:
+  - state 完了ごとに実行状態（context / 実行済み step / 結果ハッシュ）を永続化する
+  - 同一 IEP（内容ハッシュ一致）・同一 params の再実行時に、完了済み state をスキップして再開できるようにする
+    （params が異なる実行は別のチェックポイントになる。別 params の context から再開しない）
+対応:
+  - docs/IntentOS/Blueprint.yaml の State Store (Before / After) の最小実装
+保存形式:
+  - <root>/<iep_hash>-<params_hash 先頭 16 桁>.ckpt （pickle、一時ファイル経由で原子的に置換）
+"""
+
+import os
+import time
+import pickle
+import tempfile
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class Checkpoint:
+    iep_hash: str
+    iep_id: Optional[str]
+    completed_states: List[str] = field(default_factory=list)
+    context: Dict[str, Any] = field(default_factory=dict)
+    executed_steps: List[str] = field(default_factory=list)
+    result_hashes: Dict[str, str] = field(default_factory=dict)
+    updated_at: float = 0.0
+    next_state: Optional[str] = None   # machine モードで次に入る state（walk モードでは None）
+    params_hash: str = ""              # 実行時 params の内容ハッシュ
+
+
+class StateStore:
+    """
+    (IEP 内容ハッシュ, params 内容ハッシュ) 単位のチェックポイント保存先。
+      min_interval: 連続保存の最小間隔（秒）。0 なら state 完了ごとに毎回保存する
+    """
+    def __init__(self, root: str = ".ikdd_state", min_interval: float = 0.0):
+        self.root = root
+        self.min_interval = min_interval
+        self.last_error: Optional[str] = None   # 直近の load で読めなかったチェックポイントの理由
+
+    def path_for(self, iep_hash: str, params_hash: str = "") -> str:
+        return os.path.join(self.root, f"{iep_hash}-{params_hash[:16]}.ckpt")
+
+    def params_hashes(self, iep_hash: str) -> List[str]:
+        """この IEP のチェックポイントが残っている params ハッシュ（先頭 16 桁）"""
+        prefix = f"{iep_hash}-"
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return []
+        return sorted(n[len(prefix):-len(".ckpt")] for n in names if n.startswith(prefix) and n.endswith(".ckpt"))
+
+    def save(self, ckpt: Checkpoint) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        ckpt.updated_at = time.time()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(ckpt, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path_for(ckpt.iep_hash, ckpt.params_hash))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load(self, iep_hash: str, params_hash: str = "") -> Optional[Checkpoint]:
+        path = self.path_for(iep_hash, params_hash)
+        self.last_error = None
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                ckpt = pickle.load(f)
+        except Exception as e:
+            # 壊れたファイル・消えたクラスなど。不一致と同様に「チェックポイントなし」として扱う
+            self.last_error = f"{path}: {type(e).__name__}: {e}"
+            return None
+        if not isinstance(ckpt, Checkpoint) or ckpt.iep_hash != iep_hash or \
+                getattr(ckpt, "params_hash", "") != params_hash:
+            return None
+        return ckpt
+
+    def clear(self, iep_hash: str, params_hash: str = "") -> None:
+        path = self.path_for(iep_hash, params_hash)
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+step_cache.py — IKDD v0.3 Runtime 用 step 結果メモ化キャッシュ (opt-in)
+目的:
+  - 入力が変わっていない step の再実行を避け、保存済みの結果を返す
+キー:
+  - ref_step + 正規化した args（result_hash の正規シリアライザ）
+  - args 中のファイルパスの指紋（stat: サイズ＋mtime / content: 内容ハッシュ）
+保存:
+  - <root>/<key>.pkl（pickle）。ヒット時に mtime を更新し、LRU の基準とする
+  - max_entries / max_bytes を超えたら最終利用が古いものから削除
+  - 件数・合計バイトは最初の put で一度だけ走査して求め、以後は put ごとに加算する
+    （上限を超えたときだけ再走査する。他プロセスとの共有で生じたずれも再走査で補正される）
+  - 読めないエントリ（壊れた pickle・消えたクラス等）はミス扱いにして削除する
+"""
+
+import os
+import pickle
+import hashlib
+import tempfile
+import threading
+from collections.abc import Iterator, Mapping
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from result_hash import feed
+
+FINGERPRINTS = ("stat", "content")
+
+
+class StepCache:
+    def __init__(self, root: str = ".ikdd_cache", max_entries: int = 1000, max_bytes: int = 1 << 30,
+                 fingerprint: str = "stat", salt: str = ""):
+        if fingerprint not in FINGERPRINTS:
+            raise ValueError(f"unknown fingerprint mode: {fingerprint}")
+        self.root = root
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.fingerprint = fingerprint
+        self.salt = salt   # step 実装を変更したときに手動で無効化するための値
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = None   # 件数（None = 未走査）
+        self._bytes = 0
+
+    # ===== キー =====
+
+    def key_for(self, ref_step: str, args: Dict[str, Any]) -> str:
+        h = hashlib.sha256()
+        h.update(f"{self.salt}\0{ref_step}\0".encode("utf-8"))
+        feed(args, h.update)
+        for path in sorted(set(_file_paths(args))):
+            h.update(b"\0file:")
+            h.update(path.encode("utf-8", "surrogatepass"))
+            if self.fingerprint == "content":
+                h.update(b"\0")
+                feed(Path(path), h.update)   # ファイル内容をストリームでハッシュ
+            else:
+                st = os.stat(path)
+                h.update(b"\0%d:%d" % (st.st_size, st.st_mtime_ns))
+        return h.hexdigest()
+
+    # ===== 取得・保存 =====
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.pkl")
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return False, None
+        except Exception:
+            self.misses += 1
+            self._discard(path)
+            return False, None
+        try:
+            os.utime(path)   # LRU: 最終利用時刻を更新
+        except OSError:
+            pass
+        self.hits += 1
+        return True, value
+
+    def put(self, key: str, value: Any) -> bool:
+        """結果を保存する。pickle できない結果・イテレータは保存しない"""
+        if isinstance(value, Iterator):
+            return False
+        os.makedirs(self.root, exist_ok=True)
+        if self._entries is None:
+            self._scan()
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = os.path.getsize(tmp_path)
+            old = _size_of(path)
+            os.replace(tmp_path, path)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            os.remove(tmp_path)
+            return False
+        with self._lock:
+            if old is None:
+                self._entries += 1
+                self._bytes += size
+            else:
+                self._bytes += size - old
+            over = self._entries > self.max_entries or self._bytes > self.max_bytes
+        if over:
+            self.evict()
+        return True
+
+    def _discard(self, path: str) -> None:
+        """読めないエントリを削除し、件数・合計バイトから差し引く"""
+        size = _size_of(path)
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._entries is not None and size is not None:
+                self._entries -= 1
+                self._bytes -= size
+
+    def _scan(self) -> Tuple[list, int]:
+        """キャッシュディレクトリを走査し、(mtime, size, path) の一覧を返す（件数・合計も更新）"""
+        entries = []
+        total = 0
+        with os.scandir(self.root) as it:
+            for ent in it:
+                if ent.name.endswith(".pkl"):
+                    try:
+                        st = ent.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime_ns, st.st_size, ent.path))
+                    total += st.st_size
+        with self._lock:
+            self._entries = len(entries)
+            self._bytes = total
+        return entries, total
+
+    def evict(self) -> int:
+        """max_entries / max_bytes を超えた分を LRU 順に削除し、削除件数を返す"""
+        entries, total = self._scan()
+        removed = 0
+        if len(entries) <= self.max_entries and total <= self.max_bytes:
+            return removed
+        entries.sort()
+        count = len(entries)
+        for _mtime, size, path in entries:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            count -= 1
+            total -= size
+            removed += 1
+        with self._lock:
+            self._entries = count
+            self._bytes = total
+        return removed
+
+
+def _size_of(path: str) -> Optional[int]:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+def _file_paths(obj: Any) -> Iterable[str]:
+    """args 中に現れる既存ファイルのパスを列挙する"""
+    if isinstance(obj, os.PathLike):
+        obj = os.fspath(obj)
+    if isinstance(obj, str):
+        if obj and os.path.isfile(obj):
+            yield os.path.abspath(obj)
+    elif isinstance(obj, Mapping):
+        for v in obj.values():
+            yield from _file_paths(v)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for v in obj:
+            yield from _file_paths(v)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+step_registry.py — IKDD v0.3 Runtime 用 遅延 import の step resolver
+目的:
+  - ref_step 名 → "module:function" の対応だけを持ち、step 実装は初回参照時に import する
+  - 対応表はレジストリファイル（YAML / JSON）または entry_points（group: ikdd.steps）から読む
+  - IEP が参照する step だけを事前に読み込む preload()
+レジストリファイル:
+  steps:
+    CSV_LOAD: mypkg.io:load_csv          # import 名:属性
+    FILTER_ROWS: ./steps.py:filter_rows  # .py パス（レジストリファイルからの相対）:属性
+    JSON_EXPORT: mypkg.io                # 属性省略時は ref_step 名と同じ属性
+備考:
+  - RuntimeEngine.compile() は CompiledPlan 構築時に参照 step を解決するため、
+    import されるのは実行する IEP が参照する step だけになる
+"""
+
+import os
+import sys
+import hashlib
+import threading
+import importlib
+import importlib.util
+from types import ModuleType
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Union
+
+from runtime import yamlio   # 共通ローダ（libyaml・パースキャッシュ）
+
+ENTRY_POINT_GROUP = "ikdd.steps"
+
+
+class StepImportError(ImportError):
+    pass
+
+
+# ===== モジュール読み込み =====
+
+def import_step_module(spec: str) -> ModuleType:
+    """ファイルパス（*.py）または import 名から step 実装モジュールを読み込む"""
+    if spec.endswith(".py") or os.path.sep in spec:
+        path = os.path.abspath(spec)
+        name = "ikdd_steps_" + hashlib.sha256(path.encode("utf-8")).hexdigest()[:8]
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+        mod_spec = importlib.util.spec_from_file_location(name, path)
+        if mod_spec is None or mod_spec.loader is None:
+            raise StepImportError(f"cannot load step module: {spec}")
+        module = importlib.util.module_from_spec(mod_spec)
+        sys.modules[name] = module
+        try:
+            mod_spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[name]
+            raise
+        return module
+    return importlib.import_module(spec)
+
+
+def _split_target(target: str, ref_step: str):
+    # "C:\\x\\steps.py:f" のようなドライブ文字を壊さないよう、最後の ":" で分割する
+    module, sep, attr = target.rpartition(":")
+    if not sep or not module or os.sep in attr or attr.endswith(".py"):
+        return target, ref_step
+    return module, attr
+
+
+# ===== Resolver =====
+
+class LazyStepResolver(Mapping):
+    """
+    ref_step 名 → callable の Mapping。
+      - in / len / 反復は名前だけを見る（import しない）
+      - resolver[name] で初めて import し、結果をキャッシュする
+    """
+    def __init__(self, targets: Optional[Mapping[str, str]] = None, base_dir: Optional[str] = None):
+        self._targets: Dict[str, str] = dict(targets or {})
+        self._base_dir = base_dir
+        self._loaded: Dict[str, Callable[..., Any]] = {}
+        self._lock = threading.Lock()
+
+    # ----- 構築 -----
+
+    @classmethod
+    def from_file(cls, path: str) -> "LazyStepResolver":
+        if path.endswith((".yaml", ".yml")) and not yamlio.HAVE_YAML:
+            raise StepImportError("PyYAML is required to read YAML step registries")
+        data = yamlio.load_file(path) or {}
+        steps = data.get("steps", data) if isinstance(data, dict) else None
+        if not isinstance(steps, dict) or not all(isinstance(v, str) for v in steps.values()):
+            raise StepImportError(f"invalid step registry (expected 'steps: {{NAME: module:function}}'): {path}")
+        return cls(steps, base_dir=os.path.dirname(os.path.abspath(path)))
+
+    @classmethod
+    def from_entry_points(cls, group: str = ENTRY_POINT_GROUP) -> "LazyStepResolver":
+        from importlib.metadata import entry_points
+        eps = entry_points()
+        selected = eps.select(group=group) if hasattr(eps, "select") else eps.get(group, [])
+        return cls({ep.name: ep.value for ep in selected})
+
+    def register(self, name: str, target: str) -> None:
+        with self._lock:
+            self._targets[name] = target
+            self._loaded.pop(name, None)
+
+    # ----- Mapping -----
+
+    def __getitem__(self, name: str) -> Callable[..., Any]:
+        func = self._loaded.get(name)
+        if func is not None:
+            return func
+        if name not in self._targets:
+            raise KeyError(name)
+        with self._lock:
+            func = self._loaded.get(name)
+            if func is None:
+                func = self._load(name)
+                self._loaded[name] = func
+        return func
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._targets
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._targets)
+
+    def __len__(self) -> int:
+        return len(self._targets)
+
+    def _load(self, name: str) -> Callable[..., Any]:
+        module_spec, attr = _split_target(self._targets[name], name)
+        if module_spec.endswith(".py") and self._base_dir and not os.path.isabs(module_spec):
+            module_spec = os.path.join(self._base_dir, module_spec)
+        try:
+            module = import_step_module(module_spec)
+        except StepImportError:
+            raise
+        except Exception as e:
+            raise StepImportError(f"cannot import step '{name}' from '{module_spec}': {e}") from e
+        func = getattr(module, attr, None)
+        if not callable(func):
+            raise StepImportError(f"step '{name}': '{module_spec}' has no callable '{attr}'")
+        return func
+
+    # ----- 事前読み込み -----
+
+    @property
+    def loaded(self) -> List[str]:
+        return list(self._loaded)
+
+    def preload(self, iep_or_names: Union[Mapping[str, Any], Iterable[str]]) -> List[str]:
+        """IEP（または ref_step 名の列）が参照する step だけを import し、読み込んだ名前を返す"""
+        names = referenced_steps(iep_or_names) if isinstance(iep_or_names, Mapping) else list(iep_or_names)
+        out = []
+        for name in names:
+            if name in self._targets:
+                self[name]
+                out.append(name)
+        return out
+
+
+def referenced_steps(iep: Mapping[str, Any]) -> List[str]:
+    """IEP 中の ref_step を記述順（重複なし）で列挙する"""
+    seen: Dict[str, None] = {}
+    actions: List[Mapping[str, Any]] = []
+    for st in iep.get("states", []) or []:
+        for sec in ("entry_action", "exit_action"):
+            actions.extend(st.get(sec, []) or [])
+    for tr in iep.get("transitions", []) or []:
+        actions.extend(tr.get("effects", []) or [])
+    for act in actions:
+        if act.get("ref_step"):
+            seen.setdefault(act["ref_step"], None)
+        reduce = (act.get("foreach") or {}).get("reduce")
+        if reduce:
+            seen.setdefault(reduce, None)
+    return list(seen)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sweep.py — IKDD v0.3 パラメータスイープ実行
+目的:
+  - 1 つの IEP を多数の引数セット（例: threshold / filter_column の組み合わせ）で実行する
+  - どの引数セットでも同じになる先頭 state 群（共有 prefix）は 1 回だけ実行する
+  - 以降の state はワーカプール（process / thread）に引数セットごとに分配する
+  - 引数セットごとに 1 行の結果（JSONL）を書き出す
+共有 prefix の判定:
+  - 引数セット間で値が異なるキーを「可変キー」とし、
+    args の ${...} が可変キーを参照しない先頭 state 群を prefix とする
+Usage:
+  python3 sweep.py <input.iep.yaml|json> <argsets.csv|jsonl|json|yaml> --steps <steps.py|module|registry.yaml>
+                   [--workers N] [--executor process|thread] [--out results.jsonl] [--emit KEY ...]
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import replace
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Set, Union
+
+if __name__ == "__main__":
+    # スクリプトとして直接実行した場合はリポジトリ直下（共通 runtime パッケージ）を import 可能にする
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+
+from runtime_engine import (CompiledPlan, RuntimeEngine, RuntimeErrorIKDD, load_step_resolver,
+                            load_yaml_or_json)  # noqa: E402
+from state_store import Checkpoint  # noqa: E402
+
+StepsSpec = Union[str, Dict[str, Callable[..., Any]]]
+
+
+# ===== 引数セット =====
+
+def _coerce(value: str) -> Any:
+    """CSV の値を数値に寄せる（変換できなければ文字列のまま）"""
+    for conv in (int, float):
+        try:
+            return conv(value)
+        except ValueError:
+            pass
+    return value
+
+
+def load_arg_sets(path: str) -> List[Dict[str, Any]]:
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            return [{k: _coerce(v) for k, v in row.items()} for row in csv.DictReader(f)]
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    data = load_yaml_or_json(path)
+    if not isinstance(data, list):
+        raise RuntimeErrorIKDD("argument sets must be a list of objects")
+    return data
+
+
+def varying_keys(arg_sets: List[Dict[str, Any]]) -> Set[str]:
+    keys: Set[str] = set()
+    for a in arg_sets:
+        keys.update(a)
+    first = arg_sets[0] if arg_sets else {}
+    return {k for k in keys if any(k not in a or a[k] != first.get(k) for a in arg_sets)}
+
+
+def _depends_on(ref: str, varying: Set[str]) -> bool:
+    if ref.startswith("context."):
+        return False
+    return any(ref == k or ref.startswith(k + ".") or k.startswith(ref + ".") for k in varying)
+
+
+def shared_prefix_len(plan: CompiledPlan, varying: Set[str]) -> int:
+    """可変キーに依存しない先頭 state の数"""
+    n = 0
+    for state in plan.states:
+        actions = list(state.entry) + list(state.exit)
+        for tr in state.transitions:
+            actions.extend(tr.effects)
+        if any(_depends_on(ref, varying) for act in actions for ref in act.refs):
+            break
+        n += 1
+    return n
+
+
+# ===== ワーカ =====
+
+# プロセスプール専用（initializer が各ワーカプロセスに設定する）。スレッドでは partial で状態を束縛する
+_WORKER: Dict[str, Any] = {}
+
+
+def _worker_state(iep: Dict[str, Any], steps: StepsSpec, seed: Optional[Checkpoint],
+                  log_dir: Optional[str], emit: List[str]) -> Dict[str, Any]:
+    resolver = load_step_resolver(steps) if isinstance(steps, str) else steps
+    return dict(iep=iep, resolver=resolver, seed=seed, log_dir=log_dir, emit=emit)
+
+
+def _init_worker(iep: Dict[str, Any], steps: StepsSpec, seed: Optional[Checkpoint],
+                 log_dir: Optional[str], emit: List[str]) -> None:
+    _WORKER.update(_worker_state(iep, steps, seed, log_dir, emit))
+
+
+def _run_one(index: int, params: Dict[str, Any]) -> Dict[str, Any]:
+    return _run_one_with(_WORKER, index, params)
+
+
+def _run_one_with(w: Dict[str, Any], index: int, params: Dict[str, Any]) -> Dict[str, Any]:
+    log_path = os.path.join(w["log_dir"], f"sweep_{index}.log") if w["log_dir"] else None
+    engine = RuntimeEngine(w["resolver"], log_path=log_path, echo=False)
+    t0 = time.perf_counter()
+    out: Dict[str, Any] = {"index": index, "params": params}
+    try:
+        engine.execute_plan(engine.compile(w["iep"]), params=params, seed=w["seed"])
+        out["status"] = "ok"
+    except Exception as e:
+        out["status"] = "error"
+        out["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        engine.close()
+    out["elapsed"] = round(time.perf_counter() - t0, 6)
+    out["executed_steps"] = engine.context.get("_executed_steps", [])
+    out["result_hashes"] = engine.result_hashes
+    if w["emit"]:
+        out["results"] = {k: engine.context.get(k) for k in w["emit"]}
+    return out
+
+
+# ===== API =====
+
+def run_sweep(iep: Dict[str, Any], arg_sets: List[Dict[str, Any]], steps: StepsSpec,
+              workers: Optional[int] = None, executor: str = "process",
+              out_path: Optional[str] = None, log_dir: Optional[str] = None,
+              emit: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    共有 prefix を 1 回だけ実行し、残りを引数セットごとにワーカへ分配する。
+    steps は step モジュール指定（各ワーカで読み込む）または resolver dict。
+    """
+    if executor not in ("process", "thread"):
+        raise RuntimeErrorIKDD(f"unknown sweep executor: {executor}")
+    if not arg_sets:
+        return []
+    emit = list(emit or [])
+    resolver = load_step_resolver(steps) if isinstance(steps, str) else steps
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+
+    # ---- 共有 prefix ----
+    varying = varying_keys(arg_sets)
+    shared = {k: v for k, v in arg_sets[0].items() if k not in varying}
+    seed: Optional[Checkpoint] = None
+    with RuntimeEngine(resolver, log_path=os.path.join(log_dir, "sweep_prefix.log") if log_dir else None,
+                       echo=False) as engine:
+        plan = engine.compile(iep)
+        # machine モードは到達する state が引数セットごとに異なるため prefix を共有しない
+        n_prefix = shared_prefix_len(plan, varying) if plan.mode == "walk" else 0
+        if n_prefix:
+            # pre / post / must は各ワーカが引数セットごとの params で検査する
+            # （pre を共有 params だけで評価すると、可変キーを参照する pre で sweep 全体が止まる）
+            prefix = replace(plan, states=plan.states[:n_prefix], pre=[], post=[], must=frozenset())
+            engine.execute_plan(prefix, params=shared)
+            seed = engine.snapshot()
+
+    # ---- fan-out ----
+    if executor == "process":
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(iep, steps, seed, log_dir, emit))
+        run_one = _run_one
+    else:
+        # 同一プロセス内で複数の sweep が並行しても互いの状態を上書きしないよう、グローバルを使わない
+        pool = ThreadPoolExecutor(max_workers=workers)
+        run_one = partial(_run_one_with, _worker_state(iep, resolver, seed, log_dir, emit))
+    results: List[Dict[str, Any]] = []
+    out_f = open(out_path, "w", encoding="utf-8") if out_path else None
+    try:
+        with pool:
+            futures = [pool.submit(run_one, i, dict(a)) for i, a in enumerate(arg_sets)]
+            for fut in futures:
+                res = fut.result()
+                res["shared_prefix_states"] = n_prefix
+                results.append(res)
+                if out_f is not None:
+                    out_f.write(json.dumps(res, ensure_ascii=False, default=str) + "\n")
+    finally:
+        if out_f is not None:
+            out_f.close()
+    return results
+
+
+def main(argv: List[str]) -> int:
+    p = argparse.ArgumentParser(prog="sweep.py", description="IKDD v0.3 parameter sweep")
+    p.add_argument("iep", help="input .iep.yaml|json")
+    p.add_argument("argsets", help="argument sets (.csv | .jsonl | .json | .yaml)")
+    p.add_argument("--steps", required=True,
+                   help="step module (path to .py or import name), step registry (.yaml/.json) or entry_points[:group]")
+    p.add_argument("--workers", type=int, default=None, help="worker count (default: CPU count)")
+    p.add_argument("--executor", choices=["process", "thread"], default="process")
+    p.add_argument("--out", default="sweep_results.jsonl", help="output JSONL (default: sweep_results.jsonl)")
+    p.add_argument("--log-dir", default=None, help="per-run runtime logs directory (default: none)")
+    p.add_argument("--emit", nargs="*", default=[], help="context keys to include in each result")
+    args = p.parse_args(argv[1:])
+    try:
+        iep = load_yaml_or_json(args.iep)
+        arg_sets = load_arg_sets(args.argsets)
+        results = run_sweep(iep, arg_sets, args.steps, workers=args.workers, executor=args.executor,
+                            out_path=args.out, log_dir=args.log_dir, emit=args.emit)
+    except (RuntimeErrorIKDD, FileNotFoundError) as e:
+        print(f"[sweep-error] {e}", file=sys.stderr)
+        return 1
+    failed = sum(1 for r in results if r["status"] != "ok")
+    print(f"[ok] {len(results) - failed}/{len(results)} runs succeeded -> {args.out}")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_codegen.py — IEP → 生成ランナーモジュール（codegen）のテスト
+Usage:
+  python3 -m pytest runtime/v0_3/runtime/test_codegen.py -q
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from codegen import CodegenCache, CodegenError, generate_source, load_plan
+from contract_expr import Lit, Ref, parse_condition
+from runtime_engine import RuntimeEngine, RuntimeErrorIKDD, compile_plan
+
+
+def load(n=3):
+    return list(range(n))
+
+
+def double(rows):
+    return [r * 2 for r in rows]
+
+
+STEPS = {"LOAD": load, "DOUBLE": double}
+
+
+def make_iep(**runtime):
+    iep = {
+        "id": "gen",
+        "states": [
+            {"id": "loaded", "entry_action": [{"ref_step": "LOAD", "args": {"n": "${n}"}}]},
+            {"id": "doubled", "entry_action": [{"ref_step": "DOUBLE", "args": {"rows": "${context.LOAD_result}"}}]},
+        ],
+        "constraints": {"must": ["LOAD", "DOUBLE"]},
+    }
+    if runtime:
+        iep["runtime"] = runtime
+    return iep
+
+
+def test_generated_module_matches_the_engine(tmp_path):
+    iep = make_iep(contract_checks={"pre": ["${n} > 0"], "post": ["len(context.DOUBLE_result) == ${n}"]})
+    with RuntimeEngine(STEPS, log_path=str(tmp_path / "runtime.log"), echo=False) as engine:
+        engine.execute(iep, params={"n": 4})
+        expected = engine.context
+    ctx = load_plan(iep, STEPS).run({"n": 4})
+    assert ctx["DOUBLE_result"] == expected["DOUBLE_result"] == [0, 2, 4, 6]
+    assert ctx["_executed_steps"] == expected["_executed_steps"] == ["LOAD", "DOUBLE"]
+    with pytest.raises(RuntimeErrorIKDD, match="Contract pre check failed"):
+        load_plan(iep, STEPS).run({"n": 0})
+
+
+def test_newlines_in_ids_stay_inside_comments():
+    evil = "X\nINJECTED = 1\n#"
+    iep = {
+        "id": "gen" + evil,
+        "states": [{"id": "a" + evil, "entry_action": [{"ref_step": "LOAD" + evil, "args": {"n": 2}}]},
+                   {"id": "b"}],
+        "transitions": [{"from": "a" + evil, "to": "b" + evil,
+                         "effects": [{"ref_step": "LOAD" + evil, "args": {"n": 1}}]}],
+        "constraints": {},
+    }
+    steps = {"LOAD" + evil: load}
+    plan = compile_plan(iep, steps)
+    source = generate_source(plan)
+    assert not any(line.startswith("INJECTED") for line in source.splitlines())
+    module = load_plan(iep, steps)
+    assert not hasattr(module, "INJECTED")
+    assert module.run()["_executed_steps"] == ["LOAD" + evil] * 2
+
+
+def test_number_literals_and_non_finite_floats():
+    assert isinstance(parse_condition("${n} < 1e999").right, Lit)
+    for word in ("inf", "nan", "1_000"):
+        assert isinstance(parse_condition(f"${{n}} < {word}").right, Ref)
+    assert parse_condition("${n} < 1.5").right.value == 1.5
+    assert parse_condition("${n} < 10").right.value == 10
+    assert Lit(float("inf")).source() == "float('inf')"
+    assert Lit(float("-inf")).source() == "float('-inf')"
+    assert Lit(float("nan")).source() == "float('nan')"
+
+    module = load_plan(make_iep(contract_checks={"pre": ["${n} < 1e999"]}), STEPS)
+    assert module.run({"n": 2})["DOUBLE_result"] == [0, 2]
+
+
+def test_bytecode_cache_hits_in_memory_and_on_disk(tmp_path):
+    cache = CodegenCache(str(tmp_path / "cg"))
+    load_plan(make_iep(), STEPS, cache=cache)
+    load_plan(make_iep(), STEPS, cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    fresh = CodegenCache(str(tmp_path / "cg"))
+    assert load_plan(make_iep(), STEPS, cache=fresh).run({"n": 1})["DOUBLE_result"] == [0]
+    assert (fresh.hits, fresh.misses) == (1, 0)
+
+
+@pytest.mark.parametrize("iep, message", [
+    (dict(make_iep(), runtime={"mode": "machine"}), "walk only"),
+    (dict(make_iep(), runtime={"timeouts": {"run": 5}}), "timeouts"),
+    ({"id": "fe", "constraints": {}, "states": [{"id": "s", "entry_action": [
+        {"ref_step": "DOUBLE", "args": {"rows": [1, 2]}, "foreach": {"arg": "rows"}}]}]}, "foreach"),
+])
+def test_unsupported_plans_raise_codegen_error(iep, message):
+    with pytest.raises(CodegenError, match=message):
+        load_plan(iep, STEPS)
+
+
+def test_unresolved_contract_names_match_the_engine():
+    iep = make_iep(contract_checks={"pre": ["rows > threshold"]})
+    assert load_plan(iep, STEPS).run({"n": 1})["DOUBLE_result"] == [0]   # 評価せずに続行
+    with pytest.raises(RuntimeErrorIKDD, match="Contract pre check failed"):
+        load_plan(iep, STEPS, strict_contracts=True).run({"n": 1})
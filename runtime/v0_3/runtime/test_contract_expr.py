@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_contract_expr.py — contract / guard 式の構文解析・コンパイルのテスト
+Usage:
+  python3 -m pytest runtime/v0_3/runtime/test_contract_expr.py -q
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from contract_expr import ContractSyntaxError, UnresolvedName, compile_condition, context_keys, parse_condition
+from runtime_engine import RuntimeEngine, RuntimeErrorIKDD, compile_contract
+
+
+def check(text, params=None, context=None):
+    return bool(compile_condition(text)(params or {}, context or {}))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("context.rows exists", True),
+    ("context.missing not exists", True),
+    ("len(context.rows) >= 3", True),
+    ("len(context.rows) > 3", False),
+    ("context.rows is not empty AND threshold == 0.5", True),
+    ("context.empty is empty", True),
+    ("not (threshold > 1 || mode == 'fast')", True),
+    ("mode == \"slow\" && !(context.flag == false)", True),
+    ("${threshold} < 1", True),
+    ("context.cfg.limit == '10'", True),   # 数値文字列は数値として比較
+    ("context.cfg.limit < 'abc'", False),  # 比較不能な型同士は偽
+    ("context.nothing == null", True),
+])
+def test_condition_semantics(text, expected):
+    params = {"threshold": 0.5, "mode": "slow"}
+    context = {"rows": [1, 2, 3], "empty": [], "flag": True, "cfg": {"limit": 10}}
+    assert check(text, params, context) is expected
+
+
+def test_exists_on_non_context_operand_checks_the_file(tmp_path):
+    path = tmp_path / "export.json"
+    text = f"{path} exists"
+    assert check(text) is False
+    path.write_text("{}")
+    assert check(text) is True
+    # パラメータ名ならその値をパスとして扱う
+    assert check("out exists", {"out": str(path)}) is True
+
+
+def test_compile_condition_is_cached_per_text():
+    assert compile_condition("a == 1") is compile_condition("a == 1")
+
+
+def test_context_keys_lists_top_level_context_references():
+    node = parse_condition("context.A_result exists and len(${context.B_result.rows}) > 0 or x == 1")
+    assert sorted(context_keys(node)) == ["A_result", "B_result"]
+
+
+@pytest.mark.parametrize("text", ["", "a ==", "(a == 1", "a == 1 )", "len a", "a is full", "a = 1"])
+def test_syntax_errors(text):
+    with pytest.raises(ContractSyntaxError):
+        parse_condition(text)
+
+
+def test_unparsed_contract_is_skipped_unless_strict():
+    ct = compile_contract("the output looks reasonable")   # 自然言語式
+    assert ct.predicate is None and "unexpected token" in ct.error
+    with pytest.raises(RuntimeErrorIKDD, match="cannot parse condition"):
+        compile_contract("the output looks reasonable", strict=True)
+
+
+def test_engine_skips_unparsed_contract_and_fails_on_false_one(tmp_path):
+    iep = {"id": "c", "states": [{"id": "s", "entry_action": [{"ref_step": "ONE"}]}],
+           "runtime": {"contract_checks": {"pre": ["rows >= "], "post": ["context.ONE_result == 2"]}}}
+    steps = {"ONE": lambda: 1}
+    with RuntimeEngine(steps, log_path=str(tmp_path / "runtime.log"), echo=False) as engine:
+        with pytest.raises(RuntimeErrorIKDD, match="Contract post check failed"):
+            engine.execute(iep)
+    assert "unparsed, skipped" in (tmp_path / "runtime.log").read_text(encoding="utf-8")
+    with RuntimeEngine(steps, log_path=str(tmp_path / "strict.log"), echo=False, strict_contracts=True) as engine:
+        with pytest.raises(RuntimeErrorIKDD, match="cannot parse condition"):
+            engine.execute(iep)
+
+
+def test_unresolved_bare_names_are_not_string_literals(tmp_path):
+    with pytest.raises(UnresolvedName, match="'rows'"):
+        check("rows > threshold", {"threshold": 1})
+    with pytest.raises(UnresolvedName, match="'done'"):
+        check("status == done", {"status": "done"})
+    assert check("status == 'done'", {"status": "done"}) is True
+    assert check("rows > threshold", {"rows": 3, "threshold": 1}) is True
+    # exists の対象は従来どおりファイルパスとして扱う
+    assert check(f"{tmp_path} exists") is True
+
+
+def test_engine_skips_unresolved_contracts_unless_strict(tmp_path):
+    iep = {"id": "u", "states": [{"id": "s", "entry_action": [{"ref_step": "ONE"}]}],
+           "runtime": {"contract_checks": {"pre": ["rows > threshold"], "post": ["status == done"]}}}
+    steps = {"ONE": lambda: 1}
+    with RuntimeEngine(steps, log_path=str(tmp_path / "runtime.log"), echo=False) as engine:
+        engine.execute(iep, params={"threshold": 1})
+    log = (tmp_path / "runtime.log").read_text(encoding="utf-8")
+    assert log.count("unresolved, skipped") == 2
+    with RuntimeEngine(steps, log_path=str(tmp_path / "strict.log"), echo=False, strict_contracts=True) as engine:
+        with pytest.raises(RuntimeErrorIKDD, match="Contract pre check failed: rows > threshold"):
+            engine.execute(iep, params={"threshold": 1})
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_log_sink.py — LogSink と RuntimeEngine のログ出力・後始末のテスト
+Usage:
+  python3 -m pytest runtime/v0_3/runtime/test_log_sink.py -q
+"""
+
+import gc
+import os
+import re
+import sys
+import json
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from log_sink import LogSink
+from runtime_engine import RuntimeEngine
+
+TEXT_LINE = re.compile(r"^\[\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\] ")
+
+
+def writer_threads():
+    return [t for t in threading.enumerate() if t.name == "ikdd-log-writer"]
+
+
+def noop():
+    return "ok"
+
+
+IEP = {"id": "log", "states": [{"id": "s", "entry_action": [{"ref_step": "NOOP"}]}]}
+
+
+def test_default_format_is_plain_text_lines(tmp_path):
+    path = tmp_path / "runtime.log"
+    with RuntimeEngine({"NOOP": noop}, log_path=str(path), echo=False) as engine:
+        engine.execute(IEP)
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert lines and all(TEXT_LINE.match(line) for line in lines)
+    assert any(line.endswith("--- Runtime start: log ---") for line in lines)
+
+
+def test_jsonl_format_is_opt_in(tmp_path):
+    path = tmp_path / "runtime.jsonl"
+    with RuntimeEngine({"NOOP": noop}, log_path=str(path), echo=False, log_format="jsonl") as engine:
+        engine.execute(IEP)
+    events = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    steps = [ev for ev in events if ev.get("step") == "NOOP"]
+    assert steps and steps[0]["level"] == "info"
+
+
+def test_unknown_format_and_level_are_rejected():
+    with pytest.raises(ValueError, match="log format"):
+        LogSink(None, fmt="xml")
+    with pytest.raises(ValueError, match="log level"):
+        LogSink(None, level="trace")
+
+
+def test_engines_release_their_sink_on_close_and_on_garbage_collection(tmp_path):
+    before = len(writer_threads())
+    for i in range(20):
+        engine = RuntimeEngine({"NOOP": noop}, log_path=str(tmp_path / f"{i}.log"), echo=False)
+        engine.execute(IEP)
+        if i % 2:
+            engine.close()
+        del engine
+    gc.collect()
+    assert len(writer_threads()) == before
+
+
+def test_close_flushes_and_closes_the_file(tmp_path):
+    path = tmp_path / "sink.log"
+    sink = LogSink(str(path), flush_interval=60)
+    sink.emit("info", "hello")
+    sink.emit("debug", "filtered out")
+    sink.close()
+    assert sink._fh is None
+    assert path.read_text(encoding="utf-8").splitlines()[-1].endswith("] hello")
+    sink.emit("info", "after close")   # 閉じた後の emit は無視される
+    assert "after close" not in path.read_text(encoding="utf-8")
+
+
+def test_non_blocking_sink_reports_dropped_events(tmp_path):
+    path = tmp_path / "drop.log"
+    gate = threading.Event()
+    sink = LogSink(str(path), capacity=4, flush_interval=60, block=False)
+    sink.subscribe(lambda ev: gate.wait(5))   # writer を止めてバッファを溢れさせる
+    for i in range(50):
+        sink.emit("info", f"m{i}")
+    gate.set()
+    sink.close()
+    text = path.read_text(encoding="utf-8")
+    assert "events dropped" in text
+    assert "m49" in text
+
+
+class FailingFile:
+    def __init__(self):
+        self.fail = True
+        self.lines = []
+
+    def write(self, text):
+        if self.fail:
+            raise OSError(28, "No space left on device")
+        self.lines.append(text)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_write_errors_are_counted_and_do_not_stop_the_writer():
+    sink = LogSink(None, flush_interval=60)
+    sink._fh = fh = FailingFile()
+    sink.emit("info", "lost")
+    sink.flush()   # timeout なし: writer が失敗しても戻る
+    assert sink.errors == 1 and isinstance(sink.last_error, OSError)
+    fh.fail = False
+    sink.emit("info", "kept")
+    sink.flush()
+    assert sink.errors == 1 and "kept" in "".join(fh.lines)
+    sink.close()
+
+
+def test_unserializable_fields_are_written_as_strings(tmp_path):
+    path = tmp_path / "keys.jsonl"
+    sink = LogSink(str(path), fmt="jsonl")
+    sink.emit("info", "tuple keys", shards={(0, 1): "a"})
+    sink.close()
+    event = json.loads(path.read_text(encoding="utf-8"))
+    assert sink.errors == 0 and event["shards"] == "{(0, 1): 'a'}"
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_flush_and_blocking_emit_return_once_the_writer_is_gone(tmp_path):
+    sink = LogSink(str(tmp_path / "dead.log"), capacity=2, flush_interval=60)
+
+    def stop_writer(ev):
+        raise SystemExit   # Exception ではないので writer スレッドごと終わる
+    sink.subscribe(stop_writer)
+    sink.emit("info", "a")
+    sink.flush()
+    sink._thread.join(5)
+    assert not sink._thread.is_alive()
+    for i in range(5):
+        sink.emit("info", f"m{i}")   # 満杯でも待たない
+    sink.flush()
+    assert sink.dropped > 0
+    sink.close()
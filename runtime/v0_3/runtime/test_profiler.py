@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_profiler.py — StepProfiler（hook）とサイズ概算のテスト
+Usage:
+  python3 -m pytest runtime/v0_3/runtime/test_profiler.py -q
+"""
+
+import os
+import sys
+import json
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from profiler import StepProfiler, approx_size, args_size
+from runtime_engine import RuntimeEngine
+
+
+def read_size(path):
+    return os.path.getsize(path)
+
+
+def allocate(n):
+    return len(bytearray(n))
+
+
+def explode():
+    raise ValueError("boom")
+
+
+async def alloc_async(n):
+    buf = bytearray(n)
+    await asyncio.sleep(0.05)
+    return len(buf)
+
+
+STEPS = {"READ": read_size, "ALLOC": allocate, "EXPLODE": explode, "ALLOC_ASYNC": alloc_async}
+
+
+def one_state(*actions):
+    return {"id": "prof", "states": [{"id": "s", "entry_action": list(actions)}]}
+
+
+def run(tmp_path, iep, prof):
+    with RuntimeEngine(STEPS, log_path=str(tmp_path / "runtime.log"), echo=False, hooks=[prof]) as engine:
+        engine.execute(iep)
+
+
+def test_approx_size_counts_bytes_and_extrapolates_containers():
+    assert approx_size(b"x" * 100) == 100
+    assert approx_size(memoryview(b"x" * 10)) == 10
+    assert approx_size(iter(range(10))) == 0   # ストリームは消費しない
+    small, large = approx_size(list(range(10))), approx_size(list(range(10000)))
+    assert large > small * 500
+
+
+def test_file_arguments_are_sized_by_content(tmp_path):
+    path = tmp_path / "in.bin"
+    path.write_bytes(b"x" * 50000)
+    assert args_size({"path": str(path)}) >= 50000
+    assert approx_size({"path": str(path)}) < 50000   # コンテナ内の str は文字列として数える
+    prof = StepProfiler(memory=None)
+    run(tmp_path, one_state({"ref_step": "READ", "args": {"path": str(path)}}), prof)
+    (rec,) = prof.records
+    assert rec.in_bytes >= 50000 and rec.mem_peak_bytes is None
+
+
+def test_records_memory_peak_and_exports(tmp_path):
+    prof = StepProfiler(memory="tracemalloc")
+    run(tmp_path, one_state({"ref_step": "ALLOC", "args": {"n": 5_000_000}}), prof)
+    (rec,) = prof.records
+    assert rec.ref_step == "ALLOC" and rec.error is None
+    assert rec.mem_peak_bytes >= 5_000_000
+    assert prof.summary()["ALLOC"]["calls"] == 1
+    prof.export_chrome_trace(str(tmp_path / "trace.json"))
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    assert {"ALLOC", "s", "prof"} <= {e["name"] for e in events}
+    assert any(line.startswith("prof;s;ALLOC ") for line in prof.collapsed())
+
+
+def test_overlapping_steps_do_not_report_memory_peaks(tmp_path):
+    prof = StepProfiler(memory="tracemalloc")
+    iep = one_state({"ref_step": "ALLOC_ASYNC", "independent": True, "args": {"n": 1_000_000}},
+                    {"ref_step": "ALLOC_ASYNC", "independent": True, "args": {"n": 2_000_000}},
+                    {"ref_step": "ALLOC", "args": {"n": 1_000_000}})
+    with RuntimeEngine(STEPS, log_path=str(tmp_path / "runtime.log"), echo=False, hooks=[prof]) as engine:
+        asyncio.run(engine.execute_async(iep))
+    peaks = [r.mem_peak_bytes for r in prof.records]
+    assert peaks[:2] == [None, None]
+    assert peaks[2] >= 1_000_000   # 単独で動いた step は計測する
+
+
+def test_failed_step_is_recorded_with_its_error(tmp_path):
+    prof = StepProfiler(memory=None)
+    with pytest.raises(ValueError):
+        run(tmp_path, one_state({"ref_step": "EXPLODE"}), prof)
+    (rec,) = prof.records
+    assert rec.error == "ValueError: boom" and rec.out_bytes is None
+    assert any(sp.kind == "state" for sp in prof.spans)   # 失敗時も開いていた span を閉じる
+
+
+def test_unknown_memory_mode_is_rejected():
+    with pytest.raises(ValueError, match="unknown memory mode"):
+        StepProfiler(memory="gpu")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_result_hash.py — result_hash のテスト
+Usage:
+  python3 -m pytest runtime/v0_3/runtime/test_result_hash.py -q
+"""
+
+import os
+import sys
+import pathlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from result_hash import BATCH_SIZE, HashingIterator, hash_result
+
+
+def test_mapping_hash_ignores_key_order():
+    assert hash_result({"a": 1, "b": [1, 2]}) == hash_result({"b": [1, 2], "a": 1})
+
+
+def test_distinct_values_hash_differently():
+    values = [None, False, 0, 0.0, "", b"", [], (), {}, "0", [1], (1,)]
+    assert len({hash_result(v) for v in values}) == len(values)
+
+
+def test_json_batches_keep_container_and_key_types():
+    assert hash_result({"a": (1, 2)}) != hash_result({"a": [1, 2]})
+    assert hash_result([(1, 2)]) != hash_result([[1, 2]])
+    assert hash_result([{1: "x"}]) != hash_result([{"1": "x"}])
+    assert hash_result({"k": {1: "x"}}) != hash_result({"k": {"1": "x"}})
+    # バッチ境界をまたぐ大きなリストでも同じ
+    big = [[i] for i in range(BATCH_SIZE * 2)]
+    assert hash_result(big) != hash_result(big[:-1] + [(BATCH_SIZE * 2 - 1,)])
+
+
+def test_file_results_hash_file_content(tmp_path):
+    path = tmp_path / "out.json"
+    path.write_text("one")
+    as_path, as_str = hash_result(path), hash_result(str(path))
+    path.write_text("two")
+    assert hash_result(path) != as_path
+    assert hash_result(str(path)) != as_str
+    assert hash_result(str(tmp_path / "missing.json")) == hash_result(str(tmp_path / "missing.json"))
+
+
+def test_file_result_does_not_collide_with_false(tmp_path):
+    empty = tmp_path / "empty"
+    empty.write_bytes(b"")
+    assert hash_result(pathlib.Path(empty)) != hash_result(False)
+
+
+def test_nested_str_paths_are_hashed_as_text(tmp_path):
+    path = tmp_path / "nested.txt"
+    path.write_text("one")
+    before = hash_result({"path": str(path)})
+    path.write_text("two")
+    assert hash_result({"path": str(path)}) == before
+
+
+def test_hashing_iterator_matches_hash_of_generator():
+    seen = []
+    it = HashingIterator((i * i for i in range(5)), on_done=seen.append)
+    assert it.digest is None
+    assert list(it) == [0, 1, 4, 9, 16]
+    assert seen == [it.digest]
+    assert it.digest == hash_result(i * i for i in range(5))
+
+
+def test_unregistered_types_fall_back_to_repr():
+    class Point:
+        def __init__(self, x):
+            self.x = x
+
+        def __repr__(self):
+            return f"Point({self.x})"
+
+    assert hash_result(Point(1)) == hash_result(Point(1))
+    assert hash_result(Point(1)) != hash_result(Point(2))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_run_ledger.py — SQLite 実行台帳（hook・問い合わせ・CLI）のテスト
+Usage:
+  python3 -m pytest runtime/v0_3/runtime/test_run_ledger.py -q
+"""
+
+import os
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from run_ledger import RunLedger, connect, main, recent_runs, slowest_steps, step_regressions
+from runtime_engine import RuntimeEngine
+
+
+def load(n=3):
+    return list(range(n))
+
+
+def nap(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def boom():
+    raise ValueError("boom")
+
+
+STEPS = {"LOAD": load, "NAP": nap, "BOOM": boom}
+
+
+def ledger_iep(nap_s=0.0, fail=False):
+    actions = [{"ref_step": "LOAD"}, {"ref_step": "NAP", "args": {"seconds": nap_s}}]
+    if fail:
+        actions.append({"ref_step": "BOOM"})
+    return {"id": "ledger", "states": [{"id": "s", "entry_action": actions}],
+            "runtime": {"contract_checks": {"post": ["context.LOAD_result exists", "it all went well"]}}}
+
+
+def run(tmp_path, ledger, iep):
+    with RuntimeEngine(STEPS, log_path=str(tmp_path / "runtime.log"), echo=False, hooks=[ledger]) as engine:
+        engine.execute(iep)
+        return engine
+
+
+def test_runs_steps_and_contracts_are_recorded(tmp_path):
+    db = str(tmp_path / "runs.db")
+    with RunLedger(db) as ledger:
+        engine = run(tmp_path, ledger, ledger_iep())
+        with pytest.raises(ValueError):
+            run(tmp_path, ledger, ledger_iep(fail=True))
+    conn = connect(db)
+    try:
+        runs = recent_runs(conn)
+        assert [(r["run_id"], r["status"]) for r in runs] == [(2, "error"), (1, "ok")]
+        assert runs[0]["error"] == "ValueError: boom"
+        steps = conn.execute("SELECT ref_step, status, result_hash FROM steps WHERE run_id = 1 ORDER BY seq").fetchall()
+        assert steps == [("LOAD", "ok", engine.result_hashes["LOAD_result"]),
+                         ("NAP", "ok", engine.result_hashes["NAP_result"])]
+        assert conn.execute("SELECT status FROM steps WHERE run_id = 2 AND ref_step = 'BOOM'").fetchone() == ("error",)
+        contracts = conn.execute("SELECT text, outcome FROM contracts WHERE run_id = 1 ORDER BY text").fetchall()
+        assert contracts == [("context.LOAD_result exists", "pass"), ("it all went well", "skipped")]
+        assert conn.execute("SELECT run_id, state FROM states ORDER BY run_id").fetchall() == [(1, "s"), (2, "s")]
+    finally:
+        conn.close()
+
+
+def test_rows_are_buffered_until_the_run_ends(tmp_path):
+    db = str(tmp_path / "runs.db")
+    ledger = RunLedger(db, batch_size=1000, flush_interval=3600)
+    ledger.run_start(type("Plan", (), {"iep_id": "p", "iep_hash": "h", "mode": "walk"})())
+    ledger.contract("pre", "x", True)
+    conn = connect(db)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM runs").fetchone() == (1,)   # run 行は即時
+        assert conn.execute("SELECT COUNT(*) FROM contracts").fetchone() == (0,)
+        ledger.close()
+        assert conn.execute("SELECT COUNT(*) FROM contracts").fetchone() == (1,)
+    finally:
+        conn.close()
+
+
+def test_slowest_steps_and_regressions(tmp_path):
+    db = str(tmp_path / "runs.db")
+    with RunLedger(db) as ledger:
+        for seconds in (0.01, 0.01, 0.01, 0.08):
+            run(tmp_path, ledger, ledger_iep(seconds))
+    conn = connect(db)
+    try:
+        slowest = slowest_steps(conn, runs=10)
+        assert slowest[0]["ref_step"] == "NAP" and slowest[0]["calls"] == 4
+        regressions = step_regressions(conn, "NAP", window=3, factor=2.0)
+        assert [r["run_id"] for r in regressions] == [4] and regressions[0]["ratio"] > 2
+        assert step_regressions(conn, "NAP", window=3, factor=20.0) == []
+        assert recent_runs(conn, iep="other") == []
+    finally:
+        conn.close()
+
+
+def test_cli_prints_json(tmp_path, capsys):
+    db = str(tmp_path / "runs.db")
+    with RunLedger(db) as ledger:
+        run(tmp_path, ledger, ledger_iep())
+    assert main([db, "--json", "runs", "--limit", "5"]) == 0
+    rows = json.loads(capsys.readouterr().out)
+    assert [r["iep_id"] for r in rows] == ["ledger"]
+    assert main([db, "slowest"]) == 0
+    assert "ref_step" in capsys.readouterr().out
+    with pytest.raises(SystemExit):
+        main([db, "regressions"])   # --step は必須
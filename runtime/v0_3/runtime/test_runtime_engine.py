@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_runtime_engine.py — RuntimeEngine / compile_plan のテスト
+Usage:
+  python3 -m pytest runtime/v0_3/runtime/test_runtime_engine.py -q
+"""
+
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from runtime_engine import (RunTimeoutError, RuntimeEngine, RuntimeErrorIKDD, StepTimeoutError, compile_plan,
+                            split_shards)
+
+
+# ===== step 実装（process プールへ渡せるようモジュールレベルに置く） =====
+
+def load(n=3):
+    return list(range(n))
+
+
+def double(rows):
+    return [r * 2 for r in rows]
+
+
+def export(path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("ok")
+    return path
+
+
+STEPS = {"LOAD": load, "DOUBLE": double, "EXPORT": export}
+
+
+def make_engine(tmp_path, steps=None, **kw):
+    return RuntimeEngine(steps or STEPS, log_path=str(tmp_path / "runtime.log"), echo=False, **kw)
+
+
+def linear_iep(out_path):
+    return {
+        "id": "linear",
+        "states": [
+            {"id": "loaded", "entry_action": [{"ref_step": "LOAD", "args": {"n": 3}}]},
+            {"id": "doubled", "entry_action": [{"ref_step": "DOUBLE", "args": {"rows": "${context.LOAD_result}"}}]},
+        ],
+        "transitions": [
+            {"from": "loaded", "to": "doubled",
+             "effects": [{"ref_step": "EXPORT", "args": {"path": str(out_path)}}]},
+        ],
+        "constraints": {"must": ["LOAD", "DOUBLE"], "forbidden": ["pandas"]},
+    }
+
+
+# ===== CompiledPlan =====
+
+def test_compile_plan_indexes_transitions_by_from_state(tmp_path):
+    plan = compile_plan(linear_iep(tmp_path / "out.txt"), STEPS)
+    assert [st.sid for st in plan.states] == ["loaded", "doubled"]
+    loaded, doubled = plan.states
+    assert [tr.to for tr in loaded.transitions] == ["doubled"]
+    assert doubled.transitions == []
+    assert loaded.entry[0].func is load
+    assert plan.must == frozenset({"LOAD", "DOUBLE"})
+
+
+def test_engine_caches_plan_by_content_hash(tmp_path):
+    iep = linear_iep(tmp_path / "out.txt")
+    reordered = dict(reversed(list(iep.items())))
+    with make_engine(tmp_path) as engine:
+        assert engine.compile(iep) is engine.compile(reordered)
+
+
+def test_execute_runs_walk_order_and_records_results(tmp_path):
+    out = tmp_path / "out.txt"
+    with make_engine(tmp_path) as engine:
+        engine.execute(linear_iep(out))
+        assert engine.context["_executed_steps"] == ["LOAD", "EXPORT", "DOUBLE"]
+        assert engine.context["DOUBLE_result"] == [0, 2, 4]
+    assert out.read_text() == "ok"
+
+
+def test_forbidden_step_in_resolver_is_rejected(tmp_path):
+    steps = dict(STEPS, pandas=load)
+    with pytest.raises(RuntimeErrorIKDD, match="forbidden step"):
+        compile_plan(linear_iep(tmp_path / "out.txt"), steps)
+
+
+def test_unknown_ref_step_is_rejected():
+    iep = {"id": "bad", "states": [{"id": "s", "entry_action": [{"ref_step": "NOPE"}]}]}
+    with pytest.raises(RuntimeErrorIKDD, match="'NOPE' not found"):
+        compile_plan(iep, STEPS)
+
+
+def test_missing_must_step_fails_the_run(tmp_path):
+    iep = linear_iep(tmp_path / "out.txt")
+    iep["constraints"]["must"].append("EXTRA")
+    with make_engine(tmp_path) as engine, pytest.raises(RuntimeErrorIKDD, match="must steps not executed"):
+        engine.execute(iep)
+
+
+# ===== asyncio 実行モード =====
+
+async def slow_a(delay):
+    await asyncio.sleep(delay)
+    return "a"
+
+
+async def slow_b(delay):
+    await asyncio.sleep(delay)
+    return "b"
+
+
+async def failing(delay):
+    await asyncio.sleep(delay)
+    raise ValueError("boom")
+
+
+def async_iep(second="SLOW_B", delay=0.1):
+    return {
+        "id": "async",
+        "states": [{"id": "s", "entry_action": [
+            {"ref_step": "SLOW_A", "independent": True, "args": {"delay": delay}},
+            {"ref_step": second, "independent": True, "args": {"delay": delay}},
+        ]}],
+    }
+
+
+ASYNC_STEPS = {"SLOW_A": slow_a, "SLOW_B": slow_b, "FAIL": failing}
+
+
+def test_execute_async_runs_independent_coroutines_concurrently(tmp_path):
+    with make_engine(tmp_path, ASYNC_STEPS) as engine:
+        t0 = time.perf_counter()
+        asyncio.run(engine.execute_async(async_iep(delay=0.3)))
+        elapsed = time.perf_counter() - t0
+        assert elapsed < 0.5   # 逐次なら 0.6 秒
+        # 記録順は完了順ではなく宣言順
+        assert engine.context["_executed_steps"] == ["SLOW_A", "SLOW_B"]
+        assert engine.context["SLOW_B_result"] == "b"
+
+
+def test_execute_async_fails_fast_and_records_nothing_from_the_group(tmp_path):
+    with make_engine(tmp_path, ASYNC_STEPS) as engine:
+        with pytest.raises(ValueError, match="boom"):
+            asyncio.run(engine.execute_async(async_iep(second="FAIL")))
+        assert "SLOW_A_result" not in engine.context
+
+
+def test_sync_execute_rejects_coroutine_steps(tmp_path):
+    with make_engine(tmp_path, ASYNC_STEPS) as engine:
+        with pytest.raises(RuntimeErrorIKDD, match="use execute_async"):
+            engine.execute(async_iep())
+
+
+# ===== executor（thread / process プール） =====
+
+def worker_pid():
+    return os.getpid()
+
+
+def stuck(seconds):
+    time.sleep(seconds)
+    return "late"
+
+
+def executor_iep(step, executor, args=None, timeout=None):
+    iep = {"id": f"exec-{step}", "states": [{"id": "s", "entry_action": [
+        {"ref_step": step, "executor": executor, "args": args or {}}]}]}
+    if timeout is not None:
+        iep["runtime"] = {"timeouts": {"step": timeout}}
+    return iep
+
+
+POOL_STEPS = {"PID": worker_pid, "STUCK": stuck}
+
+
+def test_process_executor_runs_step_in_a_worker_process(tmp_path):
+    with make_engine(tmp_path, POOL_STEPS, max_workers=1) as engine:
+        engine.execute(executor_iep("PID", "process"))
+        assert engine.context["PID_result"] != os.getpid()
+        engine.execute(executor_iep("PID", "thread"))
+        assert engine.context["PID_result"] == os.getpid()
+
+
+def test_unknown_executor_is_rejected():
+    with pytest.raises(RuntimeErrorIKDD, match="unknown executor 'gpu'"):
+        compile_plan(executor_iep("PID", "gpu"), POOL_STEPS)
+
+
+def test_process_timeout_terminates_the_stuck_worker_and_recreates_the_pool(tmp_path):
+    with make_engine(tmp_path, POOL_STEPS, max_workers=1) as engine:
+        engine.execute(executor_iep("PID", "process"))
+        first_pid = engine.context["PID_result"]
+        t0 = time.perf_counter()
+        with pytest.raises(StepTimeoutError):
+            engine.execute(executor_iep("STUCK", "process", {"seconds": 30}, timeout=0.3))
+        assert time.perf_counter() - t0 < 5
+        assert "process" not in engine._pools
+        with pytest.raises(ProcessLookupError):
+            for _ in range(50):   # terminate は非同期なので消えるまで待つ
+                os.kill(first_pid, 0)
+                time.sleep(0.1)
+        engine.execute(executor_iep("PID", "process"))
+        assert engine.context["PID_result"] not in (first_pid, os.getpid())
+
+
+# ===== timeout 予算と watchdog =====
+
+async def stuck_async(seconds):
+    await asyncio.sleep(seconds)
+    return "late"
+
+
+TIMEOUT_STEPS = {"FAST": load, "STUCK": stuck, "STUCK_ASYNC": stuck_async}
+
+
+def timeout_iep(timeouts, *actions):
+    return {"id": "timeouts", "states": [{"id": "s", "entry_action": list(actions)}],
+            "runtime": {"timeouts": timeouts}}
+
+
+def test_inline_step_timeout_abandons_the_step_and_logs_elapsed(tmp_path):
+    iep = timeout_iep({"step": 5, "per_step": {"STUCK": 0.2}},
+                      {"ref_step": "FAST"}, {"ref_step": "STUCK", "args": {"seconds": 30}})
+    with make_engine(tmp_path, TIMEOUT_STEPS) as engine:
+        t0 = time.perf_counter()
+        with pytest.raises(StepTimeoutError) as exc:
+            engine.execute(iep)
+        assert time.perf_counter() - t0 < 5
+        assert engine.context["_executed_steps"] == ["FAST"]
+    assert (exc.value.ref_step, exc.value.state, exc.value.timeout) == ("STUCK", "s", 0.2)
+    log = (tmp_path / "runtime.log").read_text(encoding="utf-8")
+    assert "[timeout] step=STUCK state=s budget=step" in log
+
+
+def test_run_timeout_covers_the_whole_run(tmp_path):
+    iep = timeout_iep({"run": 0.3},
+                      {"ref_step": "STUCK", "args": {"seconds": 0.2}},
+                      {"ref_step": "STUCK", "args": {"seconds": 0.2}})
+    with make_engine(tmp_path, TIMEOUT_STEPS) as engine, pytest.raises(RunTimeoutError) as exc:
+        engine.execute(iep)
+    assert isinstance(exc.value, StepTimeoutError) and exc.value.timeout == 0.3
+
+
+def test_coroutine_step_is_cancelled_on_timeout(tmp_path):
+    iep = timeout_iep({"step": 0.2}, {"ref_step": "STUCK_ASYNC", "args": {"seconds": 30}})
+    with make_engine(tmp_path, TIMEOUT_STEPS) as engine, pytest.raises(StepTimeoutError):
+        asyncio.run(engine.execute_async(iep))
+
+
+@pytest.mark.parametrize("value", [0, -1, "10", True])
+def test_invalid_timeout_is_rejected(value):
+    with pytest.raises(RuntimeErrorIKDD, match="invalid timeout"):
+        compile_plan(timeout_iep({"step": value}, {"ref_step": "FAST"}), TIMEOUT_STEPS)
+
+
+# ===== 状態機械モード =====
+
+POLLS = []
+
+
+def poll_job(path):
+    """外部ジョブの完了待ちを模す: 4 回目の問い合わせまでに完了ファイルができる"""
+    POLLS.append(path)
+    if len(POLLS) == 4:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("done")
+    return os.path.exists(path)
+
+
+def machine_iep(path, **runtime):
+    return {
+        "id": "poll",
+        "initial": "wait",
+        "states": [
+            {"id": "wait", "entry_action": [{"ref_step": "POLL", "args": {"path": str(path)}}]},
+            {"id": "done", "entry_action": [{"ref_step": "LOAD"}]},
+            {"id": "orphan", "entry_action": [{"ref_step": "DOUBLE", "args": {"rows": []}}]},
+        ],
+        "transitions": [
+            {"from": "wait", "to": "done", "guard": "context.POLL_result == true"},
+            {"from": "wait", "to": "wait"},
+        ],
+        "runtime": dict(runtime, mode="machine"),
+    }
+
+
+MACHINE_STEPS = dict(STEPS, POLL=poll_job)
+
+
+def test_machine_mode_keeps_polling_until_the_guard_fires(tmp_path):
+    POLLS.clear()
+    with make_engine(tmp_path, MACHINE_STEPS) as engine:
+        engine.execute(machine_iep(tmp_path / "job.done"))
+        assert engine.context["_executed_steps"] == ["POLL"] * 4 + ["LOAD"]
+    assert "DOUBLE" not in (tmp_path / "runtime.log").read_text(encoding="utf-8")   # 到達しない state は実行しない
+
+
+def test_machine_mode_stops_polling_at_max_steps(tmp_path):
+    POLLS.clear()
+    with make_engine(tmp_path, MACHINE_STEPS) as engine:
+        with pytest.raises(RuntimeErrorIKDD, match="exceeded max_steps=3"):
+            engine.execute(machine_iep(tmp_path / "job.done", max_steps=3))
+
+
+def test_opt_in_loop_detection_stops_on_unchanged_results(tmp_path):
+    POLLS.clear()
+    with make_engine(tmp_path, MACHINE_STEPS) as engine:
+        with pytest.raises(RuntimeErrorIKDD, match="loop detected: re-entered state wait"):
+            engine.execute(machine_iep(tmp_path / "job.done", loop_detection=True))
+    assert len(POLLS) == 2
+
+
+def test_machine_mode_rejects_unreachable_must_and_unknown_targets(tmp_path):
+    iep = machine_iep(tmp_path / "job.done")
+    iep["constraints"] = {"must": ["DOUBLE"]}
+    with make_engine(tmp_path, MACHINE_STEPS) as engine:
+        with pytest.raises(RuntimeErrorIKDD, match=r"must steps unreachable .*\['DOUBLE'\]"):
+            engine.execute(iep)
+        iep = machine_iep(tmp_path / "job.done")
+        iep["transitions"].append({"from": "done", "to": "nowhere"})
+        with pytest.raises(RuntimeErrorIKDD, match="done → nowhere: unknown target state"):
+            engine.execute(iep)
+
+
+# ===== 中間結果の解放（release_results） =====
+
+def total(rows):
+    return sum(rows)
+
+
+RELEASE_STEPS = dict(STEPS, TOTAL=total)
+
+
+def chain_iep(post=None):
+    iep = {
+        "id": "chain",
+        "states": [
+            {"id": "loaded", "entry_action": [{"ref_step": "LOAD", "args": {"n": 4}}]},
+            {"id": "doubled", "entry_action": [{"ref_step": "DOUBLE", "args": {"rows": "${context.LOAD_result}"}}]},
+            {"id": "summed", "entry_action": [{"ref_step": "TOTAL", "args": {"rows": "${context.DOUBLE_result}"}}]},
+        ],
+    }
+    if post:
+        iep["runtime"] = {"contract_checks": {"post": post}}
+    return iep
+
+
+def test_compute_releases_frees_each_result_after_its_last_reader():
+    plan = compile_plan(chain_iep(), RELEASE_STEPS)
+    by_step = {act.ref_step: plan.releases.get(id(act), ()) for st in plan.states for act in st.entry}
+    assert by_step == {"LOAD": (), "DOUBLE": ("LOAD_result",), "TOTAL": ("DOUBLE_result",)}
+
+
+def test_release_results_drops_intermediates_but_keeps_outputs_and_hashes(tmp_path):
+    with make_engine(tmp_path, RELEASE_STEPS, release_results=True) as engine:
+        engine.execute(chain_iep())
+        assert "LOAD_result" not in engine.context and "DOUBLE_result" not in engine.context
+        assert engine.context["TOTAL_result"] == 12
+        assert {"LOAD_result", "DOUBLE_result", "TOTAL_result"} <= set(engine.result_hashes)
+
+
+def test_pinned_and_post_contract_results_are_kept(tmp_path):
+    iep = chain_iep(post=["len(context.DOUBLE_result) == 4"])
+    with make_engine(tmp_path, RELEASE_STEPS, release_results=True, pinned_results=["LOAD"]) as engine:
+        engine.execute(iep)
+        assert engine.context["LOAD_result"] == [0, 1, 2, 3]
+        assert engine.context["DOUBLE_result"] == [0, 2, 4, 6]
+
+
+def test_results_are_kept_by_default_and_in_machine_mode(tmp_path):
+    with make_engine(tmp_path, RELEASE_STEPS) as engine:
+        engine.execute(chain_iep())
+        assert "LOAD_result" in engine.context
+    with make_engine(tmp_path, RELEASE_STEPS, release_results=True) as engine:
+        engine.execute(dict(chain_iep(), transitions=[{"from": "loaded", "to": "doubled"},
+                                                      {"from": "doubled", "to": "summed"}]), mode="machine")
+        assert engine.context["LOAD_result"] == [0, 1, 2, 3]
+
+
+# ===== foreach（shard 分割の並列実行） =====
+
+def count_lines(path, offset=0, length=None):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read() if length is None else f.read(length)
+    return data.count(b"\n")
+
+
+def concat(results):
+    return [x for part in results for x in part]
+
+
+def fail_on_three(rows):
+    if 3 in rows:
+        raise ValueError("bad shard")
+    return rows
+
+
+FOREACH_STEPS = dict(STEPS, LINES=count_lines, CONCAT=concat, TOTAL=total, PICKY=fail_on_three)
+
+
+def foreach_iep(step, args, foreach, executor="inline"):
+    return {"id": "foreach", "states": [{"id": "s", "entry_action": [
+        {"ref_step": step, "args": args, "foreach": foreach, "executor": executor}]}]}
+
+
+def test_split_shards_rows_files_and_bytes(tmp_path):
+    plan = compile_plan(foreach_iep("DOUBLE", {"rows": []}, {"arg": "rows", "shards": 3}), FOREACH_STEPS)
+    spec = plan.states[0].entry[0].foreach
+    shards = split_shards({"rows": list(range(7)), "k": 1}, spec, default_shards=8)
+    assert [s["rows"] for s in shards] == [[0, 1, 2], [3, 4], [5, 6]] and all(s["k"] == 1 for s in shards)
+    for name in ("b.csv", "a.csv"):
+        (tmp_path / name).write_text("x\n")
+    spec.by = "files"
+    assert [s["rows"] for s in split_shards({"rows": str(tmp_path / "*.csv")}, spec, 8)] == \
+        [str(tmp_path / "a.csv"), str(tmp_path / "b.csv")]
+    big = tmp_path / "big.txt"
+    big.write_bytes(b"".join(b"line %d\n" % i for i in range(100)))
+    spec.by = "bytes"
+    ranges = split_shards({"rows": str(big)}, spec, 8)
+    assert len(ranges) == 3 and sum(r["length"] for r in ranges) == big.stat().st_size
+    assert sum(count_lines(str(big), r["offset"], r["length"]) for r in ranges) == 100   # 行境界で分割
+
+
+@pytest.mark.parametrize("executor", ["inline", "process"])
+def test_foreach_with_reduce_returns_one_result(tmp_path, executor):
+    iep = foreach_iep("DOUBLE", {"rows": "${context.LOAD_result}"},
+                      {"arg": "rows", "shards": 3, "reduce": "CONCAT"}, executor)
+    iep["states"].insert(0, {"id": "loaded", "entry_action": [{"ref_step": "LOAD", "args": {"n": 10}}]})
+    with make_engine(tmp_path, FOREACH_STEPS, max_workers=2) as engine:
+        engine.execute(iep)
+        assert engine.context["DOUBLE_result"] == [x * 2 for x in range(10)]
+        assert engine.context["_executed_steps"] == ["LOAD", "DOUBLE", "CONCAT"]
+    assert "[foreach] step=DOUBLE by=rows shards=3" in (tmp_path / "runtime.log").read_text(encoding="utf-8")
+
+
+def test_foreach_without_reduce_returns_shard_results_in_order(tmp_path):
+    big = tmp_path / "big.txt"
+    big.write_bytes(b"row\n" * 1000)
+    iep = foreach_iep("LINES", {"path": str(big)}, {"arg": "path", "by": "bytes", "shards": 4})
+    with make_engine(tmp_path, FOREACH_STEPS) as engine:
+        engine.execute(iep)
+        assert len(engine.context["LINES_result"]) == 4 and sum(engine.context["LINES_result"]) == 1000
+
+
+def test_failing_shard_fails_the_step(tmp_path):
+    iep = foreach_iep("PICKY", {"rows": list(range(8))}, {"arg": "rows", "shards": 4})
+    with make_engine(tmp_path, FOREACH_STEPS) as engine, pytest.raises(ValueError, match="bad shard"):
+        engine.execute(iep)
+
+
+@pytest.mark.parametrize("foreach, message", [
+    ({"by": "rows"}, "'arg' is required"),
+    ({"arg": "nope"}, "arg 'nope' is not in args"),
+    ({"arg": "rows", "by": "columns"}, "unknown by 'columns'"),
+    ({"arg": "rows", "shards": 0}, "invalid shards 0"),
+    ({"arg": "rows", "reduce": "MISSING"}, "reduce step 'MISSING' not found"),
+])
+def test_invalid_foreach_spec_is_rejected(foreach, message):
+    with pytest.raises(RuntimeErrorIKDD, match=message):
+        compile_plan(foreach_iep("DOUBLE", {"rows": []}, foreach), FOREACH_STEPS)
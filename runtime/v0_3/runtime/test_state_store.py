@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_state_store.py — StateStore とチェックポイントからの再開のテスト
+Usage:
+  python3 -m pytest runtime/v0_3/runtime/test_state_store.py -q
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from runtime_engine import RuntimeEngine, RuntimeErrorIKDD, iep_content_hash
+from state_store import Checkpoint, StateStore
+
+CALLS = []
+
+
+def scale(x, k):
+    CALLS.append(("SCALE", x))
+    return x * k
+
+
+def flaky(value, fail):
+    CALLS.append(("CHECK", value))
+    if fail:
+        raise ValueError("flaky")
+    return value
+
+
+def broken(value, fail):
+    raise ValueError("down")
+
+
+STEPS = {"SCALE": scale, "CHECK": flaky}
+
+IEP = {
+    "id": "resume",
+    "states": [
+        {"id": "scaled", "entry_action": [{"ref_step": "SCALE", "args": {"x": "${x}", "k": 10}}]},
+        {"id": "checked", "entry_action": [
+            {"ref_step": "CHECK", "args": {"value": "${context.SCALE_result}", "fail": "${fail}"}}]},
+    ],
+}
+
+
+IEP_HASH = iep_content_hash(IEP)
+
+
+def run(tmp_path, store, params, resume=False):
+    with RuntimeEngine(STEPS, log_path=str(tmp_path / "rt.log"), echo=False, state_store=store) as engine:
+        engine.execute(IEP, resume=resume, params=params)
+        return engine.context
+
+
+def test_store_round_trip_and_clear(tmp_path):
+    store = StateStore(str(tmp_path))
+    ckpt = Checkpoint("h", "id", completed_states=["a"], context={"k": 1}, params_hash="p1")
+    store.save(ckpt)
+    assert store.load("h", "p1").context == {"k": 1}
+    assert store.load("h", "p2") is None
+    assert store.load("other", "p1") is None
+    assert store.params_hashes("h") == ["p1"]
+    store.clear("h", "p1")
+    assert store.load("h", "p1") is None
+
+
+def test_failed_run_leaves_a_checkpoint_for_its_params(tmp_path):
+    store = StateStore(str(tmp_path / "st"))
+    params = {"x": 1, "fail": True}
+    with pytest.raises(ValueError):
+        run(tmp_path, store, params)
+    assert len(store.params_hashes(IEP_HASH)) == 1
+    ckpt = store.load(IEP_HASH, iep_content_hash(params))
+    assert ckpt.completed_states == ["scaled"] and ckpt.context["SCALE_result"] == 10
+
+
+def test_resume_with_same_params_continues_after_last_completed_state(tmp_path, monkeypatch):
+    store = StateStore(str(tmp_path / "st"))
+    params = {"x": 2, "fail": False}
+    CALLS.clear()
+    monkeypatch.setitem(STEPS, "CHECK", broken)
+    with pytest.raises(ValueError):
+        run(tmp_path, store, params)
+    monkeypatch.setitem(STEPS, "CHECK", flaky)
+    CALLS.clear()
+    context = run(tmp_path, store, params, resume=True)
+    assert CALLS == [("CHECK", 20)]
+    assert context["_executed_steps"] == ["SCALE", "CHECK"]
+    assert os.listdir(tmp_path / "st") == []   # 正常終了でチェックポイントは削除
+
+
+def test_resume_with_different_params_does_not_reuse_the_old_context(tmp_path, monkeypatch):
+    store = StateStore(str(tmp_path / "st"))
+    monkeypatch.setitem(STEPS, "CHECK", broken)
+    with pytest.raises(ValueError):
+        run(tmp_path, store, {"x": 1, "fail": False})
+    monkeypatch.setitem(STEPS, "CHECK", flaky)
+    CALLS.clear()
+    context = run(tmp_path, store, {"x": 3, "fail": False}, resume=True)
+    assert CALLS == [("SCALE", 3), ("CHECK", 30)]
+    assert context["SCALE_result"] == 30
+    assert "other params" in (tmp_path / "rt.log").read_text(encoding="utf-8")
+
+
+def test_resume_without_state_store_is_an_error(tmp_path):
+    with pytest.raises(RuntimeErrorIKDD, match="no state_store"):
+        run(tmp_path, None, {"x": 1, "fail": False}, resume=True)
+
+
+def test_unreadable_checkpoint_is_logged_and_the_run_starts_over(tmp_path):
+    store = StateStore(str(tmp_path / "st"))
+    params = {"x": 4, "fail": False}
+    os.makedirs(store.root)
+    with open(store.path_for(IEP_HASH, iep_content_hash(params)), "wb") as f:
+        f.write(b"\x80\x05truncated")
+    assert store.load(IEP_HASH, iep_content_hash(params)) is None
+    assert "UnpicklingError" in store.last_error
+    CALLS.clear()
+    context = run(tmp_path, store, params, resume=True)
+    assert CALLS == [("SCALE", 4), ("CHECK", 40)] and context["CHECK_result"] == 40
+    assert "Unreadable checkpoint ignored" in (tmp_path / "rt.log").read_text(encoding="utf-8")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_step_cache.py — StepCache と RuntimeEngine のメモ化のテスト
+Usage:
+  python3 -m pytest runtime/v0_3/runtime/test_step_cache.py -q
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from runtime_engine import RuntimeEngine
+from step_cache import StepCache
+
+CALLS = []
+
+
+def count_lines(path):
+    CALLS.append("COUNT")
+    with open(path, encoding="utf-8") as f:
+        return len(f.readlines())
+
+
+def stamp(path):
+    CALLS.append("STAMP")
+    return path
+
+
+def iep_for(path):
+    return {"id": "cache", "states": [{"id": "s", "entry_action": [
+        {"ref_step": "COUNT", "args": {"path": str(path)}},
+        {"ref_step": "STAMP", "args": {"path": str(path)}, "side_effect": True},
+    ]}]}
+
+
+STEPS = {"COUNT": count_lines, "STAMP": stamp}
+
+
+def run(tmp_path, cache, path):
+    with RuntimeEngine(STEPS, log_path=str(tmp_path / "rt.log"), echo=False, cache=cache) as engine:
+        engine.execute(iep_for(path))
+        return engine.context
+
+
+def test_cached_step_is_not_reexecuted_until_its_input_file_changes(tmp_path):
+    data = tmp_path / "in.txt"
+    data.write_text("a\nb\n")
+    cache = StepCache(str(tmp_path / "cache"))
+    CALLS.clear()
+    assert run(tmp_path, cache, data)["COUNT_result"] == 2
+    assert run(tmp_path, cache, data)["COUNT_result"] == 2
+    # side_effect の step は毎回実行される
+    assert CALLS == ["COUNT", "STAMP", "STAMP"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    data.write_text("a\nb\nc\n")
+    assert run(tmp_path, cache, data)["COUNT_result"] == 3
+    assert CALLS.count("COUNT") == 2
+
+
+def test_content_fingerprint_ignores_touch_but_not_edits(tmp_path):
+    data = tmp_path / "in.txt"
+    data.write_text("x")
+    cache = StepCache(str(tmp_path / "cache"), fingerprint="content")
+    key = cache.key_for("COUNT", {"path": str(data)})
+    os.utime(data, (time.time() + 10, time.time() + 10))
+    assert cache.key_for("COUNT", {"path": str(data)}) == key
+    data.write_text("y")
+    assert cache.key_for("COUNT", {"path": str(data)}) != key
+
+
+def test_key_depends_on_step_args_and_salt(tmp_path):
+    cache = StepCache(str(tmp_path))
+    base = cache.key_for("A", {"n": 1})
+    assert cache.key_for("A", {"n": 1}) == base
+    assert cache.key_for("B", {"n": 1}) != base
+    assert cache.key_for("A", {"n": 2}) != base
+    assert StepCache(str(tmp_path), salt="v2").key_for("A", {"n": 1}) != base
+
+
+def test_lru_eviction_keeps_recently_used_entries(tmp_path):
+    cache = StepCache(str(tmp_path), max_entries=2)
+    for i, key in enumerate(("k1", "k2")):
+        assert cache.put(key, i)
+        os.utime(os.path.join(str(tmp_path), f"{key}.pkl"), (1000 + i, 1000 + i))
+    assert cache.get("k1") == (True, 0)   # k1 を最近使ったことにする
+    cache.put("k3", 3)
+    assert cache.get("k2") == (False, None)
+    assert cache.get("k1")[0] and cache.get("k3")[0]
+
+
+def test_unpicklable_results_and_iterators_are_not_stored(tmp_path):
+    cache = StepCache(str(tmp_path))
+    assert not cache.put("lock", lambda: None)
+    assert not cache.put("it", iter([1, 2]))
+    assert [n for n in os.listdir(tmp_path) if not n.startswith(".")] == []
+
+
+def test_unknown_fingerprint_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="fingerprint"):
+        StepCache(str(tmp_path), fingerprint="mtime")
+
+
+def test_put_scans_the_directory_only_when_a_limit_is_exceeded(tmp_path, monkeypatch):
+    cache = StepCache(str(tmp_path), max_entries=3)
+    scans = []
+    real_scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: scans.append(path) or real_scandir(path))
+    for i in range(3):
+        cache.put(f"k{i}", i)
+    cache.put("k0", "overwrite")   # 既存キーの上書きは件数を増やさない
+    assert len(scans) == 1         # 初回の件数把握のみ
+    cache.put("k3", 3)
+    assert len(scans) == 2
+    assert len([n for n in os.listdir(tmp_path) if n.endswith(".pkl")]) == 3
+
+
+class Gone:
+    pass
+
+
+@pytest.mark.parametrize("content", [b"broken", None])
+def test_unreadable_entries_are_misses_and_are_removed(tmp_path, monkeypatch, content):
+    cache = StepCache(str(tmp_path))
+    path = os.path.join(str(tmp_path), "k.pkl")
+    if content is None:
+        # 保存後にクラスが消えた（AttributeError で読めない）エントリ
+        assert cache.put("k", Gone())
+        monkeypatch.delattr(sys.modules[__name__], "Gone")
+    else:
+        with open(path, "wb") as f:
+            f.write(content)
+    assert cache.get("k") == (False, None)
+    assert cache.misses == 1 and not os.path.exists(path)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_step_registry.py — 遅延 import の step resolver のテスト
+Usage:
+  python3 -m pytest runtime/v0_3/runtime/test_step_registry.py -q
+"""
+
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from runtime_engine import RuntimeEngine, RuntimeErrorIKDD, load_step_resolver
+from step_registry import LazyStepResolver, StepImportError, referenced_steps
+
+STEPS_PY = '''
+import os
+os.environ["IKDD_TEST_IMPORTS"] += "{name};"
+
+def load():
+    return [1, 2, 3]
+
+def total(rows):
+    return sum(rows)
+
+NOT_CALLABLE = 42
+'''
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """steps_a.py / steps_b.py を .py パス指定で登録したレジストリ（import されたモジュールは環境変数に記録）"""
+    monkeypatch.setenv("IKDD_TEST_IMPORTS", "")
+    for name in ("a", "b"):
+        (tmp_path / f"steps_{name}.py").write_text(STEPS_PY.format(name=name), encoding="utf-8")
+    path = tmp_path / "registry.yaml"
+    path.write_text("steps:\n"
+                    "  LOAD: ./steps_a.py:load\n"
+                    "  TOTAL: ./steps_a.py:total\n"
+                    "  OTHER: ./steps_b.py:load\n"
+                    "  BROKEN: ./steps_b.py:NOT_CALLABLE\n"
+                    "  MISSING: no_such_module_ikdd:f\n", encoding="utf-8")
+    return path
+
+
+def imported():
+    return [m for m in os.environ["IKDD_TEST_IMPORTS"].split(";") if m]
+
+
+def test_membership_does_not_import(registry):
+    resolver = LazyStepResolver.from_file(str(registry))
+    assert "LOAD" in resolver and len(resolver) == 5 and "NOPE" not in resolver
+    assert imported() == [] and resolver.loaded == []
+    assert resolver["TOTAL"]([1, 2]) == 3
+    assert resolver["LOAD"] is resolver["LOAD"]
+    assert imported() == ["a"]   # 同じモジュールの step は 1 回だけ import
+
+
+def test_engine_imports_only_referenced_steps(registry, tmp_path):
+    iep = {"id": "lazy", "states": [{"id": "s", "entry_action": [
+        {"ref_step": "LOAD"}, {"ref_step": "TOTAL", "args": {"rows": "${context.LOAD_result}"}}]}]}
+    resolver = load_step_resolver(str(registry))
+    assert isinstance(resolver, LazyStepResolver)
+    with RuntimeEngine(resolver, log_path=str(tmp_path / "runtime.log"), echo=False) as engine:
+        engine.execute(iep)
+        assert engine.context["TOTAL_result"] == 6
+    assert imported() == ["a"] and sorted(resolver.loaded) == ["LOAD", "TOTAL"]
+
+
+def test_preload_and_referenced_steps(registry):
+    iep = {"states": [{"id": "s", "entry_action": [{"ref_step": "OTHER"}, {"ref_step": "NOPE"}]}],
+           "transitions": [{"from": "s", "to": "s", "effects": [
+               {"ref_step": "LOAD", "foreach": {"arg": "rows", "reduce": "TOTAL"}}]}]}
+    assert referenced_steps(iep) == ["OTHER", "NOPE", "LOAD", "TOTAL"]
+    resolver = LazyStepResolver.from_file(str(registry))
+    assert resolver.preload(iep) == ["OTHER", "LOAD", "TOTAL"]
+    assert imported() == ["b", "a"]
+
+
+def test_import_failures_are_step_import_errors(registry, tmp_path):
+    resolver = LazyStepResolver.from_file(str(registry))
+    with pytest.raises(KeyError):
+        resolver["NOPE"]
+    with pytest.raises(StepImportError, match="cannot import step 'MISSING'"):
+        resolver["MISSING"]
+    with pytest.raises(StepImportError, match="has no callable 'NOT_CALLABLE'"):
+        resolver["BROKEN"]
+    # エンジンからはコンパイルエラーとして見える
+    iep = {"id": "bad", "states": [{"id": "s", "entry_action": [{"ref_step": "MISSING"}]}]}
+    with RuntimeEngine(resolver, log_path=str(tmp_path / "runtime.log"), echo=False) as engine:
+        with pytest.raises(RuntimeErrorIKDD, match="cannot import step 'MISSING'"):
+            engine.execute(iep)
+
+
+def test_json_registry_and_invalid_registry(tmp_path):
+    good = tmp_path / "registry.json"
+    good.write_text(json.dumps({"DUMPS": "json:dumps"}), encoding="utf-8")
+    assert LazyStepResolver.from_file(str(good))["DUMPS"]({"a": 1}) == '{"a": 1}'
+    bad = tmp_path / "bad.yaml"
+    bad.write_text("steps:\n  X: [1, 2]\n", encoding="utf-8")
+    with pytest.raises(StepImportError, match="invalid step registry"):
+        LazyStepResolver.from_file(str(bad))
+
+
+def test_register_replaces_a_loaded_step():
+    resolver = LazyStepResolver({"DUMPS": "json:dumps"})
+    assert resolver["DUMPS"] is json.dumps
+    resolver.register("DUMPS", "json:loads")
+    assert resolver["DUMPS"] is json.loads
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_sweep.py — パラメータスイープ（共有 prefix・ワーカ分配）のテスト
+Usage:
+  python3 -m pytest runtime/v0_3/runtime/test_sweep.py -q
+"""
+
+import os
+import sys
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from runtime_engine import RuntimeErrorIKDD, compile_plan
+from sweep import load_arg_sets, run_sweep, shared_prefix_len, varying_keys
+
+CALLS = []
+_LOCK = threading.Lock()
+
+
+def load_rows(n):
+    with _LOCK:
+        CALLS.append("LOAD")
+    return list(range(n))
+
+
+def filter_rows(rows, threshold):
+    with _LOCK:
+        CALLS.append("FILTER")
+    if threshold < 0:
+        raise ValueError("negative threshold")
+    return [r for r in rows if r >= threshold]
+
+
+STEPS = {"LOAD": load_rows, "FILTER": filter_rows}
+
+
+def sweep_iep(pre=None):
+    iep = {
+        "id": "sweep",
+        "states": [
+            {"id": "loaded", "entry_action": [{"ref_step": "LOAD", "args": {"n": "${cfg.n}"}}]},
+            {"id": "filtered", "entry_action": [
+                {"ref_step": "FILTER", "args": {"rows": "${context.LOAD_result}", "threshold": "${cfg.th}"}}]},
+        ],
+        "constraints": {"must": ["LOAD", "FILTER"]},
+    }
+    if pre:
+        iep["runtime"] = {"contract_checks": {"pre": pre}}
+    return iep
+
+
+ARG_SETS = [{"cfg.n": 5, "cfg.th": 1}, {"cfg.n": 5, "cfg.th": 3}, {"cfg.n": 5, "cfg.th": 4}]
+
+
+def test_varying_keys_and_shared_prefix():
+    assert varying_keys(ARG_SETS) == {"cfg.th"}
+    plan = compile_plan(sweep_iep(), STEPS)
+    assert shared_prefix_len(plan, {"cfg.th"}) == 1
+    assert shared_prefix_len(plan, {"cfg"}) == 0
+
+
+def test_shared_prefix_runs_once_and_each_arg_set_gets_its_own_result():
+    CALLS.clear()
+    results = run_sweep(sweep_iep(), ARG_SETS, STEPS, workers=2, executor="thread")
+    assert [r["status"] for r in results] == ["ok"] * 3
+    assert CALLS.count("LOAD") == 1 and CALLS.count("FILTER") == 3
+    assert all(r["shared_prefix_states"] == 1 for r in results)
+    assert all(r["executed_steps"] == ["LOAD", "FILTER"] for r in results)
+    assert len({r["result_hashes"]["FILTER_result"] for r in results}) == 3
+
+
+def test_pre_contract_on_a_varying_key_is_checked_per_arg_set():
+    arg_sets = ARG_SETS + [{"cfg.n": 5, "cfg.th": -1}]
+    results = run_sweep(sweep_iep(pre=["cfg.th >= 0"]), arg_sets, STEPS, workers=2, executor="thread")
+    assert [r["status"] for r in results] == ["ok", "ok", "ok", "error"]
+    assert "Contract pre check failed: cfg.th >= 0" in results[-1]["error"]
+    assert results[0]["shared_prefix_states"] == 1
+
+
+def test_failing_arg_set_does_not_stop_the_others(tmp_path):
+    out = tmp_path / "results.jsonl"
+    arg_sets = [{"cfg.n": 3, "cfg.th": -1}, {"cfg.n": 3, "cfg.th": 0}]
+    results = run_sweep(sweep_iep(), arg_sets, STEPS, workers=1, executor="thread", out_path=str(out),
+                        emit=["FILTER_result"])
+    assert results[0]["status"] == "error" and "negative threshold" in results[0]["error"]
+    assert results[1]["results"] == {"FILTER_result": [0, 1, 2]}
+    lines = [json.loads(line) for line in out.read_text(encoding="utf-8").splitlines()]
+    assert [r["index"] for r in lines] == [0, 1]
+
+
+def test_concurrent_thread_sweeps_keep_their_own_steps():
+    # 各 sweep の最初の実行が barrier で揃う → 2 件目の実行時点で両 sweep ともワーカ準備済み
+    barrier = threading.Barrier(2, timeout=10)
+
+    def sync(wait):
+        if wait:
+            barrier.wait()
+        return wait
+
+    iep = {"id": "pair", "states": [
+        {"id": "loaded", "entry_action": [{"ref_step": "LOAD", "args": {"n": 3}}]},
+        {"id": "synced", "entry_action": [{"ref_step": "SYNC", "args": {"wait": "${wait}"}}]},
+        {"id": "filtered", "entry_action": [
+            {"ref_step": "FILTER", "args": {"rows": "${context.LOAD_result}", "threshold": 1}}]},
+    ]}
+    steps_a = {"LOAD": load_rows, "SYNC": sync, "FILTER": filter_rows}
+    steps_b = {"LOAD": load_rows, "SYNC": sync, "FILTER": lambda rows, threshold: "B"}
+    arg_sets = [{"wait": True}, {"wait": False}]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(run_sweep, iep, arg_sets, steps, workers=1, executor="thread",
+                               emit=["FILTER_result"]) for steps in (steps_a, steps_b)]
+        results_a, results_b = [f.result() for f in futures]
+    assert [r["results"]["FILTER_result"] for r in results_a] == [[1, 2], [1, 2]]
+    assert [r["results"]["FILTER_result"] for r in results_b] == ["B", "B"]
+
+
+def test_process_executor():
+    results = run_sweep(sweep_iep(), ARG_SETS[:2], STEPS, workers=2, executor="process")
+    assert [r["status"] for r in results] == ["ok", "ok"]
+
+
+def test_load_arg_sets_from_csv_coerces_numbers(tmp_path):
+    path = tmp_path / "sets.csv"
+    path.write_text("cfg.th,name\n1,a\n2.5,b\n")
+    assert load_arg_sets(str(path)) == [{"cfg.th": 1, "name": "a"}, {"cfg.th": 2.5, "name": "b"}]
+
+
+def test_unknown_executor_is_rejected():
+    with pytest.raises(RuntimeErrorIKDD, match="unknown sweep executor"):
+        run_sweep(sweep_iep(), ARG_SETS, STEPS, executor="gpu")
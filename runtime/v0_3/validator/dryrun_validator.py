@@ -7,17 +7,16 @@ dryrun_validator.py — IKDD v0.3.2-min 用 IEP 検証器 (MVP)
   - Appendix C (must/forbidden/keep/error) 検証
   - ref_step / guard / contract の整合性チェック
   - iep_to_v02.py による dry-run 射影
+  - 複数ファイル・ディレクトリ・glob を渡すと batch モード（プロセスプールで検証し、JSON / JUnit で集計）
+Usage:
+  python3 dryrun_validator.py <input.iep.yaml|json>
+  python3 dryrun_validator.py <dir|glob|file>... [--workers N] [--report PATH] [--format json|junit]
 """
 
+import os
 import sys
-import json
-from typing import Any, Dict, List
-
-try:
-    import yaml  # type: ignore
-    HAVE_YAML = True
-except Exception:
-    HAVE_YAML = False
+import argparse
+from typing import Any, Dict, List, Optional
 
 # (オプション) JSON Schema 検証を有効化
 try:
@@ -26,26 +25,39 @@ try:
 except Exception:
     HAVE_JSONSCHEMA = False
 
-# 射影モジュールを同ディレクトリに置いておく想定
-import iep_to_v02 as projector
+if __name__ == "__main__":
+    # スクリプトとして直接実行した場合はリポジトリ直下（共通 runtime パッケージ）と compiler/ を import 可能にする
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "compiler")))
+
+# 共通ローダ（libyaml・パースキャッシュ）
+from runtime import yamlio  # noqa: E402
+
+# 射影モジュール（compiler/）
+import iep_to_v02 as projector  # noqa: E402
+from iep_batch import expand_inputs, print_summary, run_batch, write_report  # noqa: E402
 
 PLAN_SCHEMA_PATH = "plan_schema.yaml"
 
+# 読み込み済みスキーマ（パス → schema）。batch モードでは worker プロセスごとに 1 回だけ読む
+_SCHEMA_CACHE: Dict[str, Dict[str, Any]] = {}
+
 class ValidationError(Exception):
     pass
 
 def load_yaml_or_json(path: str) -> Dict[str, Any]:
-    with open(path, "r", encoding="utf-8") as f:
-        text = f.read()
-    if path.endswith((".yaml", ".yml")) and HAVE_YAML:
-        return yaml.safe_load(text)
-    return json.loads(text)
+    return yamlio.load_file(path)
 
 def load_plan_schema() -> Dict[str, Any]:
+    schema = _SCHEMA_CACHE.get(PLAN_SCHEMA_PATH)
+    if schema is not None:
+        return schema
     try:
-        return load_yaml_or_json(PLAN_SCHEMA_PATH)
+        schema = load_yaml_or_json(PLAN_SCHEMA_PATH)
     except FileNotFoundError:
         raise ValidationError("plan_schema.yaml が見つかりません (同ディレクトリに配置してください)")
+    _SCHEMA_CACHE[PLAN_SCHEMA_PATH] = schema
+    return schema
 
 def validate_schema(iepy: Dict[str, Any], schema: Dict[str, Any], report: List[str]) -> None:
     if not HAVE_JSONSCHEMA:
@@ -76,15 +88,29 @@ def check_ref_steps(iepy: Dict[str, Any], report: List[str]) -> None:
                 if not ref:
                     raise ValidationError(f"[error] {sec} に ref_step がありません (state={st.get('id')})")
                 seen.append(ref)
+                seen.extend(check_foreach(act, ref))
     for tr in iepy.get("transitions", []) or []:
         for eff in tr.get("effects", []) or []:
             ref = eff.get("ref_step")
             if not ref:
                 raise ValidationError(f"[error] transition.effects に ref_step がありません (from={tr.get('from')})")
             seen.append(ref)
+            seen.extend(check_foreach(eff, ref))
     uniq = len(set(seen))
     report.append(f"[ok] ref_step 検出: {uniq} unique steps")
 
+def check_foreach(act: Dict[str, Any], ref: str) -> List[str]:
+    """foreach 指定の整合性（分割対象の引数が args にあること）。reduce step 名を返す"""
+    fe = act.get("foreach")
+    if not fe:
+        return []
+    arg = fe.get("arg")
+    if not arg or arg not in (act.get("args") or {}):
+        raise ValidationError(f"[error] foreach.arg '{arg}' が args にありません (ref_step={ref})")
+    if fe.get("by", "rows") not in ("rows", "files", "bytes"):
+        raise ValidationError(f"[error] foreach.by が不正です: {fe.get('by')} (ref_step={ref})")
+    return [fe["reduce"]] if fe.get("reduce") else []
+
 def check_guard_and_contracts(iepy: Dict[str, Any], report: List[str]) -> None:
     # guard: 簡易構文チェック（禁止文字・空白判定など）
     for tr in iepy.get("transitions", []) or []:
@@ -103,22 +129,13 @@ def check_guard_and_contracts(iepy: Dict[str, Any], report: List[str]) -> None:
     else:
         report.append("[ok] contract_checks 整合")
 
-def run_projection_dryrun(in_path: str, report: List[str]) -> None:
-    from io import StringIO
-    import tempfile
-    import os
-
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".yaml") as tmp:
-        tmp_path = tmp.name
+def run_projection_dryrun(iepy: Dict[str, Any], report: List[str]) -> None:
+    # 読み込み済みの dict をそのまま射影する（一時ファイル・再パースなし）
     try:
-        rc = projector.main(["iep_to_v02.py", in_path, tmp_path])
-        if rc == 0:
-            report.append("[ok] 射影テスト成功 (iep_to_v02.py)")
-        else:
-            raise ValidationError(f"[error] 射影テスト失敗 (exit={rc})")
-    finally:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+        projector.project(iepy)
+    except projector.CompileError as e:
+        raise ValidationError(f"[error] 射影テスト失敗: {e}")
+    report.append("[ok] 射影テスト成功 (iep_to_v02.py)")
 
 def validate_iepy_file(path: str) -> Dict[str, Any]:
     report: List[str] = []
@@ -129,22 +146,50 @@ def validate_iepy_file(path: str) -> Dict[str, Any]:
         check_constraints(iepy, report)
         check_ref_steps(iepy, report)
         check_guard_and_contracts(iepy, report)
-        run_projection_dryrun(path, report)
+        run_projection_dryrun(iepy, report)
         report.append("[DONE] IEP dryrun validation 成功 ✅")
         return {"status": "ok", "report": report}
     except ValidationError as e:
         report.append(f"[FAILED] {e}")
         return {"status": "error", "report": report}
 
+def _validate_task(path: str) -> Dict[str, Any]:
+    try:
+        result = validate_iepy_file(path)
+    except ValidationError as e:   # スキーマが読めないなど、ファイル以前の失敗
+        return {"status": "error", "messages": [f"[FAILED] {e}"]}
+    return {"status": result["status"], "messages": result["report"]}
+
+def validate_batch(inputs: List[str], workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    return run_batch(_validate_task, expand_inputs(inputs), workers)
+
 def main(argv: List[str]) -> int:
-    if len(argv) < 2:
+    ap = argparse.ArgumentParser(prog=os.path.basename(argv[0]) if argv else "dryrun_validator.py",
+                                 description="IKDD v0.3.2-min IEP dry-run validator")
+    ap.add_argument("inputs", nargs="*", metavar="INPUT", help="IEP file(s), directories or globs")
+    ap.add_argument("--workers", type=int, default=None, help="worker processes in batch mode (default: CPU count)")
+    ap.add_argument("--report", default=None, help="write an aggregated batch report to this path")
+    ap.add_argument("--format", choices=["json", "junit"], default="json", help="report format (default: json)")
+    try:
+        args = ap.parse_args(argv[1:])
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else 2
+    if not args.inputs:
         print("Usage: dryrun_validator.py <input.iep.yaml|json>", file=sys.stderr)
         return 2
-    path = argv[1]
-    result = validate_iepy_file(path)
-    for line in result["report"]:
-        print(line)
-    return 0 if result["status"] == "ok" else 1
+    if len(args.inputs) == 1 and os.path.isfile(args.inputs[0]) and not args.report:
+        result = validate_iepy_file(args.inputs[0])
+        for line in result["report"]:
+            print(line)
+        return 0 if result["status"] == "ok" else 1
+    results = validate_batch(args.inputs, args.workers)
+    if not results:
+        print("[error] no IEP files matched", file=sys.stderr)
+        return 1
+    print_summary(results, "validate")
+    if args.report:
+        write_report(results, args.report, args.format, suite="dryrun_validator")
+    return 0 if all(r["status"] == "ok" for r in results) else 1
 
 if __name__ == "__main__":
     raise SystemExit(main(sys.argv))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_dryrun_validator.py — 読み込み済み IEP のメモリ上射影（project / run_projection_dryrun）のテスト
+Usage:
+  python3 -m pytest runtime/v0_3/validator/test_dryrun_validator.py -q
+"""
+
+import os
+import sys
+import copy
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "compiler"))
+
+import pytest
+
+import dryrun_validator
+from dryrun_validator import ValidationError, projector, run_projection_dryrun, validate_iepy_file
+
+V03 = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLE = os.path.join(V03, "examples", "ex1_minimal.iep.yaml")
+
+
+@pytest.fixture(autouse=True)
+def schema_path(monkeypatch):
+    monkeypatch.setattr(dryrun_validator, "PLAN_SCHEMA_PATH", os.path.join(V03, "schemas", "plan_schema.yaml"))
+    monkeypatch.setattr(dryrun_validator, "HAVE_JSONSCHEMA", False)
+
+
+def test_project_matches_the_file_compiler_and_keeps_input(tmp_path):
+    iepy = projector.load_iepy(EXAMPLE)
+    before = copy.deepcopy(iepy)
+    tool = projector.project(iepy)
+    assert iepy == before
+    out = str(tmp_path / "out.tool.yaml")
+    projector.compile_iepy_to_v02(EXAMPLE, out)
+    assert projector.load_iepy(out) == tool
+    assert [s["step"] for s in tool["tool"]["flow"]] == ["CSV_LOAD", "FILTER_ROWS", "JSON_EXPORT"]
+
+
+def test_project_raises_compile_error():
+    with pytest.raises(projector.CompileError, match="missing required key 'id'"):
+        projector.project({"states": [{"id": "s"}], "constraints": {}})
+
+
+def test_validation_projects_in_memory_without_temp_files_or_reparse(monkeypatch):
+    def forbidden(*args, **kwargs):
+        raise AssertionError("projection must not touch the filesystem")
+    monkeypatch.setattr(tempfile, "NamedTemporaryFile", forbidden)
+    monkeypatch.setattr(projector, "load_iepy", forbidden)
+    monkeypatch.setattr(projector, "main", forbidden)
+    result = validate_iepy_file(EXAMPLE)
+    assert result["status"] == "ok", result["report"]
+    assert "[ok] 射影テスト成功 (iep_to_v02.py)" in result["report"]
+
+
+def test_projection_failure_reports_the_compiler_message(tmp_path):
+    report = []
+    with pytest.raises(ValidationError, match="射影テスト失敗: IEP missing required key 'id'"):
+        run_projection_dryrun({"states": [{"id": "s"}], "constraints": {}}, report)
+    assert report == []
+
+    path = tmp_path / "noid.iep.json"
+    path.write_text('{"states": [{"id": "s", "entry_action": [{"ref_step": "A"}]}], "constraints": {}}',
+                    encoding="utf-8")
+    result = validate_iepy_file(str(path))
+    assert result["status"] == "error"
+    assert result["report"][-1].startswith("[FAILED] [error] 射影テスト失敗")
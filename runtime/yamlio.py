@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+yamlio.py — IKDD Runtime 共通 YAML / JSON ローダ
+目的:
+  - v0.1 / v0.2 / v0.3 の各ローダが共有する読み込み・書き出しの 1 実装
+  - libyaml があれば CSafeLoader / CSafeDumper を使う（なければ純 Python の SafeLoader / SafeDumper）
+  - パース結果のキャッシュ
+      メモリ : プロセス内（常に有効）
+      永続   : 環境変数 IKDD_PARSE_CACHE（ディレクトリ）または configure_parse_cache(root) で有効化
+    キーは絶対パス＋形式。stat（サイズ・mtime）が一致すればファイルを読まずに返し、
+    一致しなくても内容ハッシュが同じならパースせずに返す（touch・checkout 対策）
+備考:
+  - キャッシュは pickle で保持し、呼び出しごとに新しいオブジェクトを返す（呼び出し側が変更しても共有されない）
+  - 直近 RACY_WINDOW 秒以内に更新されたファイルは stat を信用せず内容ハッシュで確認する
+Usage:
+  from runtime.yamlio import load_file, loads, dumps, parse_text
+  data = load_file("plan.iep.yaml")           # 拡張子で YAML / JSON を判定
+  data = load_file("tool.txt", fmt="yaml")
+  data = parse_text(text, "plan.iep.yaml")    # 読み込み済みの文字列（キャッシュなし）
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import pickle
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+try:
+    import yaml  # type: ignore
+    HAVE_YAML = True
+except Exception:
+    HAVE_YAML = False
+
+if HAVE_YAML:
+    SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    SafeDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+    HAVE_LIBYAML = SafeLoader is not yaml.SafeLoader
+else:
+    SafeLoader = SafeDumper = None
+    HAVE_LIBYAML = False
+
+CACHE_FORMAT = 1        # 保存形式を変えたら上げる
+RACY_WINDOW = 2.0       # 秒
+MEMORY_ENTRIES = 256
+
+Entry = Tuple[int, int, str, bytes]   # (size, mtime_ns, 内容ハッシュ, pickle 済みのパース結果)
+
+
+# ===== 文字列 ⇔ オブジェクト =====
+
+def loads(text: Any) -> Any:
+    """YAML 文字列（または bytes / ファイルオブジェクト）を safe に読み込む"""
+    if not HAVE_YAML:
+        raise ImportError("PyYAML is required to parse YAML")
+    return yaml.load(text, Loader=SafeLoader)
+
+def dumps(obj: Any, sort_keys: bool = False, allow_unicode: bool = True, **kw: Any) -> str:
+    """yaml.safe_dump 相当（libyaml があれば CSafeDumper）"""
+    if not HAVE_YAML:
+        raise ImportError("PyYAML is required to write YAML")
+    return yaml.dump(obj, Dumper=SafeDumper, sort_keys=sort_keys, allow_unicode=allow_unicode, **kw)
+
+def _format_of(path: str, fmt: Optional[str]) -> str:
+    if fmt is None:
+        fmt = "yaml" if path.endswith((".yaml", ".yml")) else "json"
+    if fmt not in ("yaml", "json"):
+        raise ValueError(f"unknown format: {fmt}")
+    if fmt == "yaml" and not HAVE_YAML:
+        # JSON として読むと正しい YAML でも JSONDecodeError になり原因が分からないため、明示的に失敗させる
+        raise ImportError(f"PyYAML is required to read YAML: {path or '<text>'}")
+    return fmt
+
+def parse_bytes(data: bytes, fmt: str) -> Any:
+    return parse_text(data.decode("utf-8"), fmt=fmt)
+
+def parse_text(text: str, path: str = "", fmt: Optional[str] = None) -> Any:
+    """文字列を fmt（None なら path の拡張子）に従って YAML / JSON としてパースする（キャッシュなし）"""
+    return loads(text) if _format_of(path, fmt) == "yaml" else json.loads(text)
+
+
+# ===== パースキャッシュ =====
+
+class ParseCache:
+    """絶対パス＋形式 → Entry。root を指定すると <root>/<key>.pkl に永続化する"""
+    def __init__(self, root: Optional[str] = None, memory_entries: int = MEMORY_ENTRIES):
+        self.root = root
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self._mem: "OrderedDict[str, Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, path: str, fmt: str) -> str:
+        return hashlib.sha256(f"{CACHE_FORMAT}:{fmt}:{os.path.abspath(path)}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                self._mem.move_to_end(key)
+                return entry
+        if not self.root:
+            return None
+        try:
+            with open(os.path.join(self.root, f"{key}.pkl"), "rb") as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return None
+        if not (isinstance(entry, tuple) and len(entry) == 4):
+            return None
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key: str, entry: Entry):
+        with self._lock:
+            self._mem[key] = entry
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.memory_entries:
+                self._mem.popitem(last=False)
+
+    def _store(self, key: str, entry: Entry):
+        self._remember(key, entry)
+        if not self.root:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, os.path.join(self.root, f"{key}.pkl"))
+        except OSError:
+            # 永続キャッシュに書けなくても読み込み自体は成功させる
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def load(self, path: str, fmt: str, parse: Callable[[bytes, str], Any] = parse_bytes) -> Any:
+        st = os.stat(path)
+        key = self._key(path, fmt)
+        entry = self._lookup(key)
+        racy = time.time() - st.st_mtime < RACY_WINDOW
+        if entry is not None and not racy and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            self.hits += 1
+            return pickle.loads(entry[3])
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if entry is not None and entry[2] == digest:
+            self.hits += 1
+            if (entry[0], entry[1]) != (st.st_size, st.st_mtime_ns):
+                self._store(key, (st.st_size, st.st_mtime_ns, digest, entry[3]))
+            return pickle.loads(entry[3])
+        self.misses += 1
+        obj = parse(data, fmt)
+        try:
+            blob = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return obj   # キャッシュできない値（通常の YAML / JSON では起きない）
+        self._store(key, (st.st_size, st.st_mtime_ns, digest, blob))
+        return obj
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+
+
+_CACHE = ParseCache(os.environ.get("IKDD_PARSE_CACHE") or None)
+
+def configure_parse_cache(root: Optional[str] = None, memory_entries: int = MEMORY_ENTRIES) -> ParseCache:
+    """既定のパースキャッシュを差し替える（root=None ならメモリのみ）"""
+    global _CACHE
+    _CACHE = ParseCache(root, memory_entries)
+    return _CACHE
+
+def parse_cache() -> ParseCache:
+    return _CACHE
+
+
+# ===== ファイル =====
+
+def load_file(path: str, fmt: Optional[str] = None, cache: bool = True) -> Any:
+    """
+    ファイルを読み込む。fmt=None なら拡張子で判定（.yaml / .yml → YAML、それ以外 → JSON）。
+    cache=False ならパースキャッシュを使わない
+    """
+    fmt = _format_of(path, fmt)
+    if cache:
+        return _CACHE.load(path, fmt)
+    with open(path, "rb") as f:
+        return parse_bytes(f.read(), fmt)